@@ -0,0 +1,174 @@
+import asyncio
+import datetime
+import logging
+from frontier import CrawlFrontier
+from metrics import metrics
+from network_crawler import ChatScan, MessagePager, add_chats, load_chats_to_extend, store_older_forwards, store_scan_results, usernames_not_stored
+from storage import get_storage
+from telegram import AsyncTelegramClient, TRANSIENT_ERRORS
+from telethon.errors.rpcerrorlist import ChannelPrivateError, FloodWaitError
+from tqdm import tqdm
+
+# Configure logging
+logging.basicConfig(filename='log.log', level=logging.DEBUG)
+
+
+async def iter_message_pages_async(client, chat_id, batch_size=100, offset_id=0, offset_date=None, min_id=0, upward=False):
+    """Asyncio version of network_crawler.iter_message_pages, yields the pages of the chat as lists of MessageRecords."""
+    pager = MessagePager(chat_id, batch_size, offset_id, offset_date, min_id, upward)
+    while True:
+        request = pager.request()
+        if request is None:
+            return
+        try:
+            messages = await client.fetch_messages(**request)
+        except Exception as error:
+            pager.failed(error)
+            return
+        records = pager.page(messages)
+        # Do not keep the message objects alive while the page is processed
+        del messages
+        if records is None:
+            return
+        yield records
+
+
+async def scan_chat_async(client, nodes_in_network_id_list, chat_id, batch_size=100, offset_id=0, offset_date=None, min_id=0, upward=False):
+    """
+    Asyncio version of network_crawler.scan_chat. The pages of one chat are fetched one after another, but many chats can be
+    scanned concurrently. Returns the same values as scan_chat.
+
+    client - AsyncTelegramClient used for the requests
+    """
+    scan = ChatScan(nodes_in_network_id_list, chat_id)
+    async for records in iter_message_pages_async(client, chat_id, batch_size, offset_id, offset_date, min_id, upward):
+        for forwarded_from_id in scan.add_page(records):
+            try:
+                if not await client.is_private(forwarded_from_id):
+                    scan.add_new_node(forwarded_from_id)
+            except ChannelPrivateError:
+                logging.info(str(forwarded_from_id) + ' is private')
+    return scan.results()
+
+
+async def extend_network_async(client, iterations=1, scan_size=100, only_scan_chats=None, max_date=None, min_degree=0, concurrency=8):
+    """
+    Asyncio version of network_crawler.extend_network that scans up to `concurrency` chats at the same time. Produces the same
+    scanned_log.csv, edges/<chat id>.csv, nodes.csv and chats.csv as extend_network.
+
+    client - Opened AsyncTelegramClient used for the requests
+    concurrency - The maximum number of chats that are scanned at the same time
+    For the other arguments see network_crawler.extend_network.
+    """
+    if not get_storage().has_table('chats'):
+        print('chats.csv does not exist yet. You need to call initialize_data first.')
+        return
+
+    if only_scan_chats != None and type(only_scan_chats[0]) != int:
+        print('only_scan_chats must be a list of ids')
+        return
+
+    offset_date = datetime.datetime(*max_date).replace(hour=23, minute=59, second=59, microsecond=999999) if max_date != None else None
+    semaphore = asyncio.Semaphore(concurrency)
+    frontier = CrawlFrontier.load(get_storage())
+
+    for i in range(iterations):
+        print('Extending network: Iteration', i+1, 'of', iterations)
+        chats_to_scan = frontier.chats_to_scan(only_scan_chats, min_degree)
+        progress_bar = tqdm(total=len(chats_to_scan))
+
+        async def scan_and_store(chat_id):
+            async with semaphore:
+                try:
+                    # Chats are scanned concurrently, so the timers of the chats overlap
+                    with metrics.timer('stage_seconds', stage='scan_chat_async'):
+                        new_nodes_found, forward_edges, newest_message, oldest_message = await scan_chat_async(
+                            client, frontier, chat_id, batch_size=scan_size, offset_date=offset_date
+                        )
+                except (FloodWaitError, *TRANSIENT_ERRORS) as error:
+                    print('Chat', chat_id, 'could not be scanned completely and is not logged as scanned:', error)
+                    progress_bar.update(1)
+                    return
+                # Other chats scanned at the same time may have discovered the same chats
+                new_nodes_found = [node_id for node_id in new_nodes_found if node_id not in frontier]
+                chats_metadata = await client.get_chats_metadata(new_nodes_found) if newest_message != None else []
+            # Storing does not await, so it is never interleaved with storing the results of another chat
+            store_scan_results(frontier, chat_id, new_nodes_found, forward_edges, newest_message, oldest_message, chats_metadata)
+            progress_bar.update(1)
+
+        await asyncio.gather(*[scan_and_store(chat_id) for chat_id in chats_to_scan])
+        progress_bar.close()
+        get_storage().flush()
+
+
+def extend_network_concurrently(iterations=1, scan_size=100, only_scan_chats=None, max_date=None, min_degree=0, concurrency=8):
+    """
+    Extend the network like network_crawler.extend_network, but scan up to `concurrency` chats at the same time using telethon's asyncio client.
+    """
+    async def run():
+        async with AsyncTelegramClient() as client:
+            await extend_network_async(client, iterations, scan_size, only_scan_chats, max_date, min_degree, concurrency)
+    asyncio.run(run())
+
+
+async def extend_chats_with_older_forwards_async(client, chat_ids=None, scan_size=100, concurrency=8, commit_size=100):
+    """
+    Asyncio version of network_crawler.extend_chats_with_older_forwards. The crawl state is loaded once, up to `concurrency` chats
+    are scanned at the same time and the results of `commit_size` chats are stored together in one transaction.
+
+    client - Opened AsyncTelegramClient used for the requests
+    chat_ids - Ids of the chats to be scanned. If None, all scanned chats are scanned.
+    """
+    chat_rows, frontier = load_chats_to_extend(chat_ids)
+    semaphore = asyncio.Semaphore(concurrency)
+    progress_bar = tqdm(total=len(chat_rows))
+
+    async def scan_older_messages(chat_row):
+        async with semaphore:
+            try:
+                new_nodes_found, forward_edges, _, oldest_message = await scan_chat_async(
+                    client, frontier, int(chat_row.chat_id), batch_size=scan_size, offset_id=int(chat_row.oldest_message_id)
+                )
+            except (FloodWaitError, *TRANSIENT_ERRORS) as error:
+                print('Older messages of chat', chat_row.chat_id, 'could not be scanned completely:', error)
+                oldest_message = None
+            progress_bar.update(1)
+            if oldest_message == None:
+                return None
+            return chat_row, new_nodes_found, forward_edges, oldest_message
+
+    for i in range(0, len(chat_rows), commit_size):
+        results = await asyncio.gather(*[scan_older_messages(chat_row) for chat_row in chat_rows[i:i+commit_size]])
+        results = [result for result in results if result is not None]
+        new_nodes_found = list(dict.fromkeys(node_id for _, nodes, _, _ in results for node_id in nodes if node_id not in frontier))
+        chats_metadata = await client.get_chats_metadata(new_nodes_found)
+        store_older_forwards(results, frontier, chats_metadata)
+        get_storage().flush()
+    progress_bar.close()
+
+
+def extend_all_with_older_forwards_concurrently(scan_size=100, chat_ids=None, concurrency=8, commit_size=100):
+    """
+    Like network_crawler.extend_all_with_older_forwards, but scan up to `concurrency` chats at the same time and store the results in bulk.
+
+    chat_ids - Ids of the chats to be scanned. If None, all scanned chats are scanned.
+    """
+    async def run():
+        async with AsyncTelegramClient() as client:
+            await extend_chats_with_older_forwards_async(client, chat_ids, scan_size, concurrency, commit_size)
+    asyncio.run(run())
+
+
+def add_chats_by_username_concurrently(chats):
+    """Like network_crawler.add_chats_by_username, but the chats are looked up concurrently."""
+    async def run():
+        async with AsyncTelegramClient() as client:
+            add_chats(await client.get_chats_metadata(usernames_not_stored(chats)))
+    asyncio.run(run())
+    get_storage().flush()
+
+
+if __name__ == "__main__":
+    pass
+    # extend_network_concurrently(iterations=1, scan_size=100, max_date=(2022, 2, 28), min_degree=5, concurrency=8)
+    # extend_all_with_older_forwards_concurrently(scan_size=200, concurrency=8)
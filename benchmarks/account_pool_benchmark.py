@@ -0,0 +1,53 @@
+"""
+Compare the asyncio crawler with one account against a pool of several accounts on a synthetic network. Every account has its
+own rate limit, so the crawl is limited by the rate limits rather than by the latency. All crawls must produce the same data.
+Prints the utilisation of the accounts.
+
+Run from the repository root: python -m benchmarks.account_pool_benchmark
+"""
+import asyncio
+import os
+import time
+from async_crawler import extend_network_async
+from benchmarks.crawl_data import create_crawl_directory, read_crawl_results
+from benchmarks.fake_telegram import FakeAsyncTelegramClient, FakeNetwork
+from entity_cache import EntityCache
+from storage import SqliteStorage, get_storage
+from telegram import AsyncTelegramClient, RequestScheduler
+
+# Rate limits of each account, low enough that they dominate the crawl time
+RATE_LIMITS = {'default': {'rate': 5, 'burst': 5}}
+
+
+def run(chats=100, messages_per_chat=200, scan_size=100, iterations=2, request_latency=0.02, concurrency=16, account_counts=(1, 2, 4)):
+    network = FakeNetwork(chats=chats, messages_per_chat=messages_per_chat)
+    working_directory = os.getcwd()
+    results = {}
+    timings = {}
+    try:
+        for account_count in account_counts:
+            create_crawl_directory(network, storage_class=SqliteStorage)
+            fake_clients = [FakeAsyncTelegramClient(network, request_latency=request_latency) for _ in range(account_count)]
+            schedulers = [RequestScheduler(rate_limits=RATE_LIMITS) for _ in range(account_count)]
+
+            async def crawl():
+                async with AsyncTelegramClient(client=fake_clients, entity_cache=EntityCache(file_path=None), scheduler=schedulers) as client:
+                    await extend_network_async(client, iterations=iterations, scan_size=scan_size, concurrency=concurrency)
+                return client
+            start = time.perf_counter()
+            client = asyncio.run(crawl())
+            timings[account_count] = time.perf_counter() - start
+            results[account_count] = read_crawl_results(get_storage())
+            requests = sum(fake_client.requests for fake_client in fake_clients)
+            print(f'{account_count} accounts: {timings[account_count]:.2f}s, {requests} requests, {requests / timings[account_count]:.1f} requests/s')
+            client._pool.print_utilisation()
+    finally:
+        os.chdir(working_directory)
+    first = account_counts[0]
+    print(f'Speedup of {account_counts[-1]} accounts: {timings[first] / timings[account_counts[-1]]:.1f}x')
+    print('Same results:', all(result == results[first] for result in results.values()))
+    return timings, results
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,54 @@
+"""
+Compare extend_network with the asyncio crawler of async_crawler on a synthetic network served with injected latency.
+Both crawls must produce the same data.
+
+Run from the repository root: python -m benchmarks.async_crawl_benchmark
+"""
+import asyncio
+import os
+import time
+import network_crawler
+from async_crawler import extend_network_async
+from benchmarks.crawl_data import create_crawl_directory, read_crawl_results
+from benchmarks.fake_telegram import FakeAsyncTelegramClient, FakeNetwork, FakeTelegramClient
+from entity_cache import EntityCache
+from storage import get_storage
+from telegram import AsyncTelegramClient, RequestScheduler, SyncTelegramClient
+
+
+def run(chats=100, messages_per_chat=200, scan_size=100, iterations=2, request_latency=0.1, concurrency=16):
+    network = FakeNetwork(chats=chats, messages_per_chat=messages_per_chat)
+    working_directory = os.getcwd()
+    results = {}
+    timings = {}
+    try:
+        create_crawl_directory(network)
+        fake_client = FakeTelegramClient(network, request_latency=request_latency)
+        network_crawler.telethon_api = SyncTelegramClient(client=fake_client, entity_cache=EntityCache(file_path=None), scheduler=RequestScheduler(rate_limits={}))
+        start = time.perf_counter()
+        with network_crawler.telethon_api:
+            network_crawler.extend_network(iterations=iterations, scan_size=scan_size)
+        timings['sync'] = time.perf_counter() - start
+        results['sync'] = read_crawl_results(get_storage())
+        print(f"extend_network: {timings['sync']:.2f}s, {fake_client.requests} requests")
+
+        create_crawl_directory(network)
+        fake_async_client = FakeAsyncTelegramClient(network, request_latency=request_latency)
+
+        async def crawl():
+            async with AsyncTelegramClient(client=fake_async_client, entity_cache=EntityCache(file_path=None), scheduler=RequestScheduler(rate_limits={})) as client:
+                await extend_network_async(client, iterations=iterations, scan_size=scan_size, concurrency=concurrency)
+        start = time.perf_counter()
+        asyncio.run(crawl())
+        timings['async'] = time.perf_counter() - start
+        results['async'] = read_crawl_results(get_storage())
+        print(f"extend_network_async (concurrency {concurrency}): {timings['async']:.2f}s, {fake_async_client.requests} requests")
+    finally:
+        os.chdir(working_directory)
+    print(f"Speedup: {timings['sync'] / timings['async']:.1f}x")
+    print('Same results:', results['sync'] == results['async'])
+    return timings, results
+
+
+if __name__ == "__main__":
+    run()
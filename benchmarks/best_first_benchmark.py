@@ -0,0 +1,53 @@
+"""
+Compare the iterations of extend_network with crawl_best_first on a synthetic network: how many of the channels forwarded from by
+the most chats (the hubs) are scanned and how many requests are needed for it.
+
+Run from the repository root: python -m benchmarks.best_first_benchmark
+"""
+import os
+from collections import Counter
+import network_crawler
+from benchmarks.crawl_data import create_crawl_directory
+from benchmarks.fake_telegram import FakeNetwork, FakeTelegramClient
+from entity_cache import EntityCache
+from storage import SqliteStorage, get_storage
+from telegram import RequestScheduler, SyncTelegramClient
+
+
+def top_hubs(network, k):
+    """Ids of the k public channels of the whole network that are forwarded from by the most chats."""
+    in_degrees = Counter()
+    for chat_id in network.chat_ids:
+        forwarded_from = set(message.fwd_from.from_id.channel_id for message in network.messages(chat_id) if message.fwd_from is not None)
+        in_degrees.update(forwarded_from)
+    return set([chat_id for chat_id, _ in in_degrees.most_common() if chat_id not in network.private_chat_ids][:k])
+
+
+def crawl(network, crawl_function, **kwargs):
+    """Run the crawl in a new crawl directory and return the scanned chat ids and the number of requests sent."""
+    create_crawl_directory(network, storage_class=SqliteStorage)
+    fake_client = FakeTelegramClient(network, request_latency=0)
+    network_crawler.telethon_api = SyncTelegramClient(client=fake_client, entity_cache=EntityCache(file_path=None), scheduler=RequestScheduler(rate_limits={}))
+    with network_crawler.telethon_api:
+        crawl_function(**kwargs)
+    scanned = set(get_storage().read_table('scanned_log', columns=['chat_id'])['chat_id'])
+    return scanned, fake_client.requests
+
+
+def run(chats=1000, messages_per_chat=100, scan_size=100, iterations=3, hubs=20):
+    network = FakeNetwork(chats=chats, messages_per_chat=messages_per_chat, forward_probability=0.1)
+    hub_ids = top_hubs(network, hubs)
+    working_directory = os.getcwd()
+    try:
+        scanned, requests = crawl(network, network_crawler.extend_network, iterations=iterations, scan_size=scan_size)
+        print(f'extend_network ({iterations} iterations): {len(scanned)} chats, {requests} requests, {len(scanned & hub_ids)} of {hubs} hubs scanned')
+        # Best-first with half of the requests sent by the iterations
+        max_requests = requests // 2
+        scanned, requests = crawl(network, network_crawler.crawl_best_first, max_requests=max_requests, scan_size=scan_size)
+        print(f'crawl_best_first (max_requests {max_requests}): {len(scanned)} chats, {requests} requests, {len(scanned & hub_ids)} of {hubs} hubs scanned')
+    finally:
+        os.chdir(working_directory)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,72 @@
+"""
+End-to-end benchmark of a full crawl with extend_network on the fake Telegram backend: the network is crawled from the seed until
+no chat is left to scan, once per storage backend and once with injected FloodWaitErrors. Reports the chats scanned per second,
+the requests per chat, the FloodWaitErrors and the bytes written to disk. All crawls must produce the same data.
+
+Run from the repository root: python -m benchmarks.crawl_benchmark
+"""
+import os
+import time
+import network_crawler
+from benchmarks.crawl_data import create_crawl_directory, read_crawl_results
+from benchmarks.fake_telegram import FakeNetwork, FakeTelegramClient
+from entity_cache import EntityCache
+from frontier import CrawlFrontier
+from metrics import bytes_written
+from storage import STORAGE_BACKENDS, get_storage
+from telegram import RequestScheduler, SyncTelegramClient
+
+
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(path, name)) for path, _, names in os.walk(directory) for name in names)
+
+
+def crawl(network, backend, request_latency, flood_wait_probability, max_iterations):
+    """Crawl the network until no chat is left to scan. Returns the crawl results and the measurements."""
+    directory = create_crawl_directory(network, storage_class=STORAGE_BACKENDS[backend])
+    fake_client = FakeTelegramClient(network, request_latency=request_latency, flood_wait_probability=flood_wait_probability)
+    network_crawler.telethon_api = SyncTelegramClient(client=fake_client, entity_cache=EntityCache(file_path=None), scheduler=RequestScheduler(rate_limits={}))
+    written = bytes_written()
+    start = time.perf_counter()
+    iterations = 0
+    with network_crawler.telethon_api:
+        while iterations < max_iterations and CrawlFrontier.load(get_storage()).chats_to_scan():
+            network_crawler.extend_network(scan_size=network.messages_per_chat)
+            iterations += 1
+    network_crawler.flush_messages()
+    get_storage().flush()
+    elapsed = time.perf_counter() - start
+    results = read_crawl_results(get_storage())
+    return results, {
+        'chats': len(results['scanned']),
+        'iterations': iterations,
+        'seconds': elapsed,
+        'requests': fake_client.requests,
+        'flood_waits': fake_client.flood_waits,
+        'bytes_written': bytes_written() - written if written is not None else None,
+        'bytes_stored': directory_size(directory)
+    }
+
+
+def run(chats=200, messages_per_chat=300, request_latency=0, flood_wait_probability=0.01, max_iterations=10):
+    network = FakeNetwork(chats=chats, messages_per_chat=messages_per_chat)
+    working_directory = os.getcwd()
+    scenarios = [(backend, 0) for backend in STORAGE_BACKENDS] + [('sqlite', flood_wait_probability)]
+    all_results = []
+    try:
+        for backend, probability in scenarios:
+            results, measurements = crawl(network, backend, request_latency, probability, max_iterations)
+            all_results.append(results)
+            chats_scanned = measurements['chats']
+            print(f"{backend}{' with FloodWaitErrors' if probability else ''}: {chats_scanned} chats in {measurements['iterations']} iterations, "
+                  f"{measurements['seconds']:.2f}s, {chats_scanned / measurements['seconds']:.1f} chats/s, "
+                  f"{measurements['requests'] / chats_scanned:.2f} requests per chat, {measurements['flood_waits']} FloodWaitErrors")
+            written = f"{measurements['bytes_written'] / 1e6:.1f} MB written, " if measurements['bytes_written'] is not None else ''
+            print(f"  {written}{measurements['bytes_stored'] / 1e6:.1f} MB stored")
+    finally:
+        os.chdir(working_directory)
+    print('Same results:', all(results == all_results[0] for results in all_results))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,39 @@
+"""Helpers to set up and compare crawl data directories for benchmarks."""
+import os
+import tempfile
+import pandas as pd
+from data_model import CHATS_COLUMNS, SCANNED_COLUMNS, NODES_COLUMNS
+from storage import CsvStorage, set_storage
+
+
+def create_crawl_directory(network, seed_size=5, storage_class=CsvStorage):
+    """
+    Create a temporary directory containing the data of a network that was initialized with the first seed_size public channels
+    of the FakeNetwork as seed, like initialize_data, add_chats_by_username and set_network_seed would. Changes into the directory,
+    because all data paths are relative, and sets a new storage backend of the given class as the storage used by the crawler.
+    Returns the path of the directory.
+    """
+    directory = tempfile.mkdtemp(prefix='crawl_benchmark_')
+    os.chdir(directory)
+    storage = storage_class()
+    set_storage(storage)
+    seed = [chat_id for chat_id in network.chat_ids if chat_id not in network.private_chat_ids][:seed_size]
+    storage.write_table('chats', pd.DataFrame([[chat_id, 'Fake channel ' + str(chat_id), network.username(chat_id), 'broadcast', 0] for chat_id in seed], columns=CHATS_COLUMNS))
+    storage.write_table('nodes', pd.DataFrame([[chat_id, 'Fake channel ' + str(chat_id), 1, 0] for chat_id in seed], columns=NODES_COLUMNS))
+    storage.write_table('scanned_log', pd.DataFrame(columns=SCANNED_COLUMNS))
+    storage.flush()
+    return directory
+
+
+def read_crawl_results(storage):
+    """Read the crawl results of the storage in an order independent form, so that the results of different crawlers can be compared."""
+    df_scanned_log = storage.read_table('scanned_log')
+    df_nodes = storage.read_table('nodes')
+    df_chats = storage.read_table('chats')
+    df_edges = storage.read_all_rows('edges')
+    return {
+        'scanned': set(zip(df_scanned_log['chat_id'], df_scanned_log['newest_message_id'], df_scanned_log['oldest_message_id'])),
+        'nodes': set(zip(df_nodes['chat_id'], df_nodes['in_degree'])),
+        'chats': set(df_chats['id']),
+        'edges': set(zip(df_edges['chat_id'], df_edges['message_id'], df_edges['forwarded_from']))
+    }
@@ -0,0 +1,76 @@
+"""
+Run a distributed crawl with crawl_worker in several local processes that share a SqliteStorage and compare it with extend_network
+on a single process. Before the workers start, a worker leases a few chats and crashes, so the crawl only finishes if the expired
+leases are queued again. Both crawls must produce the same data.
+
+Run from the repository root: python -m benchmarks.distributed_crawl_benchmark
+"""
+import multiprocessing
+import os
+import time
+import network_crawler
+from benchmarks.crawl_data import create_crawl_directory, read_crawl_results
+from benchmarks.fake_telegram import FakeNetwork, FakeTelegramClient
+from distributed_crawler import crawl_worker
+from entity_cache import EntityCache
+from frontier import CrawlFrontier
+from storage import SqliteStorage, get_storage, set_storage
+from telegram import RequestScheduler, SyncTelegramClient
+from work_queue import WorkQueue
+
+NETWORK_SETTINGS = {'chats': 150, 'messages_per_chat': 200}
+
+
+def use_fake_client(network, request_latency):
+    network_crawler.telethon_api = SyncTelegramClient(client=FakeTelegramClient(network, connect_latency=0, request_latency=request_latency), entity_cache=EntityCache(file_path=None), scheduler=RequestScheduler(rate_limits={}))
+
+
+def worker_process(directory, crawl_settings, request_latency, lease_seconds):
+    """Crawl worker in its own process with its own fake client, like a worker on another machine."""
+    os.chdir(directory)
+    set_storage(SqliteStorage())
+    use_fake_client(FakeNetwork(**NETWORK_SETTINGS), request_latency)
+    with network_crawler.telethon_api:
+        crawl_worker(**crawl_settings, lease_seconds=lease_seconds, poll_seconds=0.2)
+
+
+def run(workers=4, iterations=2, scan_size=100, request_latency=0.05, lease_seconds=2, crashed_leases=3):
+    network = FakeNetwork(**NETWORK_SETTINGS)
+    working_directory = os.getcwd()
+    try:
+        create_crawl_directory(network, storage_class=SqliteStorage)
+        use_fake_client(network, request_latency)
+        start = time.perf_counter()
+        with network_crawler.telethon_api:
+            network_crawler.extend_network(iterations=iterations, scan_size=scan_size)
+        single_time = time.perf_counter() - start
+        single_results = read_crawl_results(get_storage())
+        print(f'extend_network: {single_time:.2f}s')
+
+        directory = create_crawl_directory(network, storage_class=SqliteStorage)
+        crawl_settings = {'crawl': 'benchmark', 'iterations': iterations, 'scan_size': scan_size}
+        # A worker that leases chats of the first iteration and crashes without completing them
+        queue = WorkQueue(get_storage(), lease_seconds)
+        queue.create('benchmark', iterations, {'scan_size': scan_size, 'only_scan_chats': None, 'max_date': None, 'min_degree': 0})
+        queue.next_iteration('benchmark', lambda: CrawlFrontier.load(get_storage()).chats_to_scan())
+        queue.lease('benchmark', 'crashed worker', crashed_leases)
+        context = multiprocessing.get_context('spawn')
+        processes = [context.Process(target=worker_process, args=(directory, crawl_settings, request_latency, lease_seconds)) for _ in range(workers)]
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        distributed_time = time.perf_counter() - start
+        set_storage(SqliteStorage())
+        distributed_results = read_crawl_results(get_storage())
+        print(f'crawl_worker in {workers} processes: {distributed_time:.2f}s including the start of the processes')
+        print('Chats scanned per worker:', sorted(WorkQueue(get_storage()).workers('benchmark').values()))
+    finally:
+        os.chdir(working_directory)
+    print('Same results:', single_results == distributed_results)
+    return single_results == distributed_results
+
+
+if __name__ == "__main__":
+    run()
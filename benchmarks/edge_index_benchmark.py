@@ -0,0 +1,80 @@
+"""
+Check that the in-degrees stay correct when forwards are stored again: a network is crawled with extend_network, then all scanned
+chats are rescanned from the newest message and the older messages are backfilled with extend_all_with_older_forwards. After each
+step the in-degrees in the nodes table must equal those recomputed from the stored edges (rebuild_in_degrees). Reports the time
+add_edges takes per rescanned chat, including loading the stored edges of the chat, and the time of a full recomputation.
+
+Run from the repository root: python -m benchmarks.edge_index_benchmark
+"""
+import os
+import time
+import network_crawler
+from benchmarks.crawl_data import create_crawl_directory
+from benchmarks.fake_telegram import FakeNetwork, FakeTelegramClient
+from entity_cache import EntityCache
+from frontier import CrawlFrontier
+from storage import STORAGE_BACKENDS, get_storage
+from telegram import RequestScheduler, SyncTelegramClient
+
+
+def stored_in_degrees(storage):
+    df_nodes = storage.read_table('nodes', columns=['chat_id', 'in_degree'])
+    return dict(zip(df_nodes['chat_id'].tolist(), df_nodes['in_degree'].tolist()))
+
+
+def check_in_degrees(step):
+    """Compare the stored in-degrees with the recomputed ones. Returns True if they are equal."""
+    storage = get_storage()
+    storage.flush()
+    in_degrees = stored_in_degrees(storage)
+    start = time.perf_counter()
+    network_crawler.rebuild_in_degrees()
+    rebuild_time = time.perf_counter() - start
+    correct = in_degrees == stored_in_degrees(storage)
+    print(f'  {step}: in-degrees correct: {correct} (full recomputation: {rebuild_time * 1000:.1f}ms)')
+    return correct
+
+
+def rescan(frontier, scan_size):
+    """Scan all scanned chats again from the newest message and store the edges. Returns the number of chats and edges and the seconds spent in add_edges."""
+    edges = 0
+    seconds = 0
+    df_scanned_log = get_storage().read_table('scanned_log', columns=['chat_id'])
+    for chat_id in df_scanned_log['chat_id'].tolist():
+        _, forward_edges, _, _ = network_crawler.scan_chat(frontier, chat_id, batch_size=scan_size)
+        start = time.perf_counter()
+        with get_storage().transaction():
+            frontier.add_in_degrees(network_crawler.add_edges(chat_id, forward_edges))
+        seconds += time.perf_counter() - start
+        edges += len(forward_edges)
+    get_storage().flush()
+    return len(df_scanned_log), edges, seconds
+
+
+def run(chats=200, messages_per_chat=300, scan_size=100, iterations=2):
+    network = FakeNetwork(chats=chats, messages_per_chat=messages_per_chat)
+    working_directory = os.getcwd()
+    all_correct = True
+    try:
+        for backend, storage_class in STORAGE_BACKENDS.items():
+            print(backend)
+            create_crawl_directory(network, storage_class=storage_class)
+            network_crawler.telethon_api = SyncTelegramClient(client=FakeTelegramClient(network, request_latency=0), entity_cache=EntityCache(file_path=None), scheduler=RequestScheduler(rate_limits={}))
+            with network_crawler.telethon_api:
+                network_crawler.extend_network(iterations=iterations, scan_size=scan_size)
+                all_correct &= check_in_degrees('crawl')
+                frontier = CrawlFrontier.load(get_storage())
+                chats_rescanned, edges, seconds = rescan(frontier, scan_size)
+                all_correct &= check_in_degrees('rescan')
+                all_correct &= frontier.in_degrees == stored_in_degrees(get_storage())
+                print(f'  add_edges on the rescan: {edges} edges of {chats_rescanned} chats in {seconds * 1000:.1f}ms, {seconds / chats_rescanned * 1000:.2f}ms per chat')
+                network_crawler.extend_all_with_older_forwards(scan_size=scan_size)
+                all_correct &= check_in_degrees('backfill')
+    finally:
+        os.chdir(working_directory)
+    print('All in-degrees correct:', all_correct)
+    return all_correct
+
+
+if __name__ == "__main__":
+    run()
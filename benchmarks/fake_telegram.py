@@ -0,0 +1,246 @@
+"""Fake stand-ins for the telethon client serving a synthetic network of channels, so that the crawler can be exercised offline."""
+import asyncio
+import datetime
+import json
+import random
+import time
+from types import SimpleNamespace
+from telethon.errors.rpcerrorlist import ChannelPrivateError, FloodWaitError
+from telethon.tl import functions
+from telethon.tl.types import ChannelForbidden
+from telethon.tl.functions.messages import GetHistoryRequest
+
+FIRST_CHANNEL_ID = 1000000
+
+
+class FakeNetwork:
+    """
+    Deterministic synthetic network of channels that forward messages from each other. A few channels are forwarded
+    from much more often than the others, like hubs in real networks.
+
+    chats - Number of channels
+    messages_per_chat - Number of messages posted in each channel
+    forward_probability - Probability of a message being a forward from another channel
+    private_ratio - Fraction of channels that are private
+    seed - Seed of the random generator
+    """
+    def __init__(self, chats=200, messages_per_chat=300, forward_probability=0.3, private_ratio=0.05, seed=0):
+        self.chats = chats
+        self.messages_per_chat = messages_per_chat
+        self.forward_probability = forward_probability
+        self.seed = seed
+        self.chat_ids = [FIRST_CHANNEL_ID + i for i in range(chats)]
+        rng = random.Random(seed)
+        self.private_chat_ids = set(rng.sample(self.chat_ids, int(chats * private_ratio)))
+        # Zipf-like popularity, so that some channels are forwarded from much more often
+        self._popularity = [1 / (rank + 1) for rank in range(chats)]
+        self._messages = {}
+        self.end_date = datetime.datetime(2022, 3, 1, tzinfo=datetime.timezone.utc)
+
+    def username(self, chat_id):
+        return 'fake_channel_' + str(chat_id - FIRST_CHANNEL_ID)
+
+    def chat_id_of(self, chat):
+        """Resolve an id or username to the chat id."""
+        if type(chat) == str:
+            chat_id = FIRST_CHANNEL_ID + int(chat.lower().replace('fake_channel_', ''))
+        else:
+            chat_id = chat
+        if chat_id not in self.chat_ids:
+            raise ValueError('Could not find the input entity for ' + str(chat))
+        return chat_id
+
+    def messages(self, chat_id):
+        """All messages of the chat, newest first."""
+        if chat_id not in self._messages:
+            rng = random.Random(self.seed * 1000003 + chat_id)
+            messages = []
+            for message_id in range(self.messages_per_chat, 0, -1):
+                fwd_from = None
+                if rng.random() < self.forward_probability:
+                    forwarded_from_id = rng.choices(self.chat_ids, weights=self._popularity)[0]
+                    if forwarded_from_id != chat_id:
+                        fwd_from = SimpleNamespace(from_id=SimpleNamespace(channel_id=forwarded_from_id))
+                messages.append(SimpleNamespace(
+                    id=message_id,
+                    message='Message ' + str(message_id) + ' in ' + self.username(chat_id),
+                    date=self.end_date - datetime.timedelta(hours=self.messages_per_chat - message_id),
+                    views=rng.randint(0, 10000),
+                    forwards=rng.randint(0, 100),
+                    fwd_from=fwd_from
+                ))
+            self._messages[chat_id] = messages
+        return self._messages[chat_id]
+
+    def history(self, request):
+        chat_id = self.chat_id_of(request.peer)
+        if chat_id in self.private_chat_ids:
+            raise ChannelPrivateError(request=request)
+        messages = self.messages(chat_id)
+        if request.offset_date:
+            messages = [m for m in messages if m.date < request.offset_date.replace(tzinfo=datetime.timezone.utc)]
+        if request.max_id:
+            messages = [m for m in messages if m.id < request.max_id]
+        if request.min_id:
+            messages = [m for m in messages if m.id > request.min_id]
+        # Like Telegram, the page starts at the first message older than offset_id, moved by add_offset (negative moves to newer messages)
+        start = next((i for i, m in enumerate(messages) if m.id < request.offset_id), len(messages)) if request.offset_id else 0
+        start = start + request.add_offset
+        messages = messages[max(start, 0):max(start + request.limit, 0)]
+        # Like Telegram, return the chats the messages were forwarded from along with the messages
+        forwarded_from_ids = dict.fromkeys(m.fwd_from.from_id.channel_id for m in messages if m.fwd_from)
+        return SimpleNamespace(messages=messages, chats=[SimpleNamespace(id=chat_id) for chat_id in forwarded_from_ids])
+
+    def full_channel(self, request):
+        chat_id = self.chat_id_of(request.channel)
+        if chat_id in self.private_chat_ids:
+            raise ChannelPrivateError(request=request)
+        data = {
+            'full_chat': {'id': chat_id, 'can_view_participants': False},
+            'chats': [{
+                'id': chat_id,
+                'title': 'Fake channel ' + str(chat_id - FIRST_CHANNEL_ID),
+                'username': self.username(chat_id),
+                'megagroup': False,
+                'gigagroup': False
+            }]
+        }
+        return SimpleNamespace(to_json=lambda: json.dumps(data))
+
+    def channels(self, request):
+        # Like telethon, the whole request fails if one of the chats cannot be resolved
+        chat_ids = [self.chat_id_of(chat) for chat in request.id]
+        channels = []
+        for chat_id in chat_ids:
+            if chat_id in self.private_chat_ids:
+                channels.append(ChannelForbidden(id=chat_id, access_hash=0, title='Fake channel ' + str(chat_id - FIRST_CHANNEL_ID)))
+            else:
+                channels.append(SimpleNamespace(
+                    id=chat_id,
+                    title='Fake channel ' + str(chat_id - FIRST_CHANNEL_ID),
+                    username=self.username(chat_id),
+                    megagroup=False,
+                    gigagroup=False,
+                    has_link=False
+                ))
+        return SimpleNamespace(chats=channels)
+
+    def entity(self, chat):
+        chat_id = self.chat_id_of(chat)
+        if chat_id in self.private_chat_ids:
+            raise ChannelPrivateError(request=None)
+        return SimpleNamespace(id=chat_id, username=self.username(chat_id), restricted=False)
+
+    def respond(self, request):
+        if isinstance(request, GetHistoryRequest):
+            return self.history(request)
+        if isinstance(request, functions.channels.GetFullChannelRequest):
+            return self.full_channel(request)
+        if isinstance(request, functions.channels.GetChannelsRequest):
+            return self.channels(request)
+        raise NotImplementedError(type(request).__name__)
+
+
+class FloodWaitInjector:
+    """
+    Raises FloodWaitErrors for a random but reproducible fraction of the requests, like Telegram does when an account sends
+    requests too fast.
+
+    probability - Fraction of the requests that fail with a FloodWaitError
+    seconds - Seconds to wait given by the FloodWaitErrors
+    seed - Seed of the random generator
+    """
+    def __init__(self, probability=0, seconds=1, seed=0):
+        self.probability = probability
+        self.seconds = seconds
+        self.flood_waits = 0
+        self._random = random.Random(seed)
+
+    def check(self, request):
+        if self.probability and self._random.random() < self.probability:
+            self.flood_waits += 1
+            raise FloodWaitError(request=request, capture=self.seconds)
+
+
+class FakeTelegramClient:
+    """
+    Mimics the parts of the synchronous telethon TelegramClient used by SyncTelegramClient.
+
+    network - FakeNetwork that is served. By default a small network is generated.
+    connect_latency - Seconds spent connecting and authorizing (the handshake done by 'with client' and start())
+    request_latency - Seconds spent on every API request
+    flood_wait_probability, flood_wait_seconds - Fraction of the requests that fail with a FloodWaitError of the given seconds,
+        see FloodWaitInjector. Failed requests are counted in requests as well.
+    """
+    def __init__(self, network=None, connect_latency=0.05, request_latency=0.005, flood_wait_probability=0, flood_wait_seconds=1):
+        self.network = network if network is not None else FakeNetwork()
+        self.connect_latency = connect_latency
+        self.request_latency = request_latency
+        self.flood_wait_injector = FloodWaitInjector(flood_wait_probability, flood_wait_seconds, self.network.seed)
+        self.connects = 0
+        self.requests = 0
+
+    @property
+    def flood_waits(self):
+        return self.flood_wait_injector.flood_waits
+
+    def start(self):
+        time.sleep(self.connect_latency)
+        self.connects += 1
+        return self
+
+    def disconnect(self):
+        pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.disconnect()
+
+    def __call__(self, request):
+        time.sleep(self.request_latency)
+        self.requests += 1
+        self.flood_wait_injector.check(request)
+        return self.network.respond(request)
+
+    def get_entity(self, chat):
+        time.sleep(self.request_latency)
+        self.requests += 1
+        self.flood_wait_injector.check(None)
+        return self.network.entity(chat)
+
+
+class FakeAsyncTelegramClient:
+    """Mimics the parts of the asyncio telethon TelegramClient used by AsyncTelegramClient. See FakeTelegramClient for the arguments."""
+    def __init__(self, network=None, connect_latency=0.05, request_latency=0.005, flood_wait_probability=0, flood_wait_seconds=1):
+        self.network = network if network is not None else FakeNetwork()
+        self.connect_latency = connect_latency
+        self.request_latency = request_latency
+        self.flood_wait_injector = FloodWaitInjector(flood_wait_probability, flood_wait_seconds, self.network.seed)
+        self.connects = 0
+        self.requests = 0
+
+    @property
+    def flood_waits(self):
+        return self.flood_wait_injector.flood_waits
+
+    async def start(self):
+        await asyncio.sleep(self.connect_latency)
+        self.connects += 1
+        return self
+
+    async def disconnect(self):
+        pass
+
+    async def __call__(self, request):
+        await asyncio.sleep(self.request_latency)
+        self.requests += 1
+        self.flood_wait_injector.check(request)
+        return self.network.respond(request)
+
+    async def get_entity(self, chat):
+        await asyncio.sleep(self.request_latency)
+        self.requests += 1
+        self.flood_wait_injector.check(None)
+        return self.network.entity(chat)
@@ -0,0 +1,114 @@
+"""
+Compare the previous per-chat construction of the graph with the vectorised build of graph_builder on synthetic edge files.
+Both must produce the same graph. Then compare building graphs for several thresholds one by one with build_graphs, which
+reads the data once and reuses the cached aggregated edge weights.
+
+Run from the repository root: python -m benchmarks.graph_benchmark
+"""
+import os
+import tempfile
+import time
+import networkx as nx
+import numpy as np
+import pandas as pd
+from data_model import CHATS_COLUMNS, NODES_COLUMNS, SCANNED_COLUMNS
+from graph_builder import EDGE_WEIGHTS_CACHE_PATH, aggregate_edge_weights, build_graphs, graph_from_edge_weights
+from storage import CsvStorage, set_storage
+
+
+def create_edge_files(chats=2000, edges=300000, seed=0):
+    """
+    Create a temporary directory with the crawl data of a synthetic network in which all chats were scanned. The chats forwarded
+    from are Zipf distributed. Changes into the directory and returns the storage.
+    """
+    os.chdir(tempfile.mkdtemp(prefix='graph_benchmark_'))
+    rng = np.random.default_rng(seed)
+    storage = CsvStorage()
+    set_storage(storage)
+    chat_ids = np.arange(1000000, 1000000 + chats)
+    scanned_chat_ids = chat_ids[:chats // 2]
+    destinations = rng.choice(scanned_chat_ids, size=edges)
+    sources = chat_ids[np.minimum(rng.zipf(1.3, size=edges), chats) - 1]
+    keep = destinations != sources
+    df_edges = pd.DataFrame({'chat_id': destinations[keep], 'message_id': np.arange(edges)[keep], 'forwarded_from': sources[keep]})
+    storage.clear_rows('edges')
+    for chat_id, df in df_edges.groupby('chat_id'):
+        storage.append_rows('edges', chat_id, df[['message_id', 'forwarded_from']])
+    in_degrees = df_edges.drop_duplicates(['chat_id', 'forwarded_from'])['forwarded_from'].value_counts().reindex(chat_ids, fill_value=0)
+    storage.write_table('chats', pd.DataFrame({'id': chat_ids, 'name': ['Chat ' + str(chat_id) for chat_id in chat_ids], 'username': '', 'type': 'broadcast', 'can_comment': 0}, columns=CHATS_COLUMNS))
+    storage.write_table('nodes', pd.DataFrame({'chat_id': chat_ids, 'chat_name': '', 'in_seed': 0, 'in_degree': in_degrees.values}, columns=NODES_COLUMNS))
+    storage.write_table('scanned_log', pd.DataFrame({'chat_id': scanned_chat_ids, 'newest_message_id': 1, 'newest_message_date': '', 'oldest_message_id': 1, 'oldest_message_date': ''}, columns=SCANNED_COLUMNS))
+    return storage
+
+
+def build_graph_per_chat(storage, min_edge_weight_threshold=0, min_in_degree_threshold=0):
+    """The previous implementation of build_graph, which reads and adds the edges chat by chat."""
+    G = nx.DiGraph()
+    df_scanned_log = storage.read_table('scanned_log', columns=['chat_id']).set_index('chat_id')
+    df_chats = storage.read_table('chats', columns=['id', 'name']).set_index('id')
+    df_nodes = storage.read_table('nodes', columns=['chat_id', 'in_degree']).set_index('chat_id')
+    df_scanned = df_scanned_log.join(df_chats)
+    for scanned_chat in df_scanned.itertuples(index=True):
+        chat_id = scanned_chat[0]
+        if not G.has_node(chat_id):
+            G.add_node(chat_id, label=scanned_chat.name)
+        df_edges = storage.read_rows('edges', chat_id, columns=['forwarded_from'])
+        weighted_edges = df_edges["forwarded_from"].value_counts()
+        for forwarded_from, edge_weight in weighted_edges.items():
+            if df_nodes.at[forwarded_from, 'in_degree'] >= min_in_degree_threshold and edge_weight >= min_edge_weight_threshold:
+                if not G.has_node(forwarded_from):
+                    G.add_node(forwarded_from, label=df_chats.at[forwarded_from, 'name'])
+                G.add_edge(chat_id, forwarded_from, value=edge_weight)
+    return G
+
+
+def build_graph_vectorised(storage, min_edge_weight_threshold=0, min_in_degree_threshold=0):
+    return graph_from_edge_weights(
+        aggregate_edge_weights(storage),
+        storage.read_table('scanned_log', columns=['chat_id']),
+        storage.read_table('chats', columns=['id', 'name']),
+        storage.read_table('nodes', columns=['chat_id', 'in_degree']),
+        min_edge_weight_threshold,
+        min_in_degree_threshold
+    )
+
+
+def same_graph(G, H):
+    return dict(G.nodes(data=True)) == dict(H.nodes(data=True)) and set(G.edges(data='value')) == set(H.edges(data='value'))
+
+
+def run(chats=2000, edges=300000, thresholds=((0, 0), (2, 5)), sweep=((0, 0), (1, 1), (2, 2), (2, 5), (5, 5), (5, 10), (10, 10), (10, 20))):
+    working_directory = os.getcwd()
+    try:
+        storage = create_edge_files(chats, edges)
+        for min_edge_weight_threshold, min_in_degree_threshold in thresholds:
+            graphs = {}
+            timings = {}
+            for name, build in [('per chat', build_graph_per_chat), ('vectorised', build_graph_vectorised)]:
+                start = time.perf_counter()
+                graphs[name] = build(storage, min_edge_weight_threshold, min_in_degree_threshold)
+                timings[name] = time.perf_counter() - start
+            G = graphs['vectorised']
+            print(f'Thresholds ({min_edge_weight_threshold}, {min_in_degree_threshold}): {G.number_of_nodes()} nodes, {G.number_of_edges()} edges')
+            print(f"  per chat: {timings['per chat']:.2f}s, vectorised: {timings['vectorised']:.2f}s, speedup {timings['per chat'] / timings['vectorised']:.1f}x")
+            print('  Same graph:', same_graph(graphs['per chat'], G))
+
+        start = time.perf_counter()
+        for pair in sweep:
+            build_graph_vectorised(storage, *pair)
+        print(f'{len(sweep)} thresholds one by one: {time.perf_counter() - start:.2f}s')
+        for cache in ['cold', 'warm']:
+            start = time.perf_counter()
+            build_graphs(sweep)
+            print(f'{len(sweep)} thresholds with build_graphs ({cache} cache): {time.perf_counter() - start:.2f}s')
+        # New edges invalidate the cache
+        storage.append_rows('edges', int(storage.chat_ids('edges')[0]), pd.DataFrame({'message_id': [edges], 'forwarded_from': [1000000 + chats - 1]}))
+        cache_time = os.path.getmtime(EDGE_WEIGHTS_CACHE_PATH)
+        build_graphs(sweep[:1])
+        print('Cache invalidated by new edges:', os.path.getmtime(EDGE_WEIGHTS_CACHE_PATH) != cache_time)
+    finally:
+        os.chdir(working_directory)
+
+
+if __name__ == "__main__":
+    run()
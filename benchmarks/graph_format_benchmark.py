@@ -0,0 +1,57 @@
+"""
+Compare storing a graph as networkx pickle with the compact format of CompactGraph: size, loading time and the time of the degree
+ranking. Uses the synthetic network of graph_benchmark. The rankings and the graphs must be the same.
+
+Run from the repository root: python -m benchmarks.graph_format_benchmark
+"""
+import os
+import pickle
+import time
+from networkx import in_degree_centrality
+from benchmarks.graph_benchmark import create_edge_files, same_graph
+from compact_graph import CompactGraph
+from graph_builder import build_graph, get_degree_ranking, graph_path, load_compact_graph, load_graph
+
+
+def directory_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(entry.stat().st_size for entry in os.scandir(path))
+
+
+def run(chats=20000, edges=1000000):
+    working_directory = os.getcwd()
+    try:
+        create_edge_files(chats, edges)
+        build_graph()
+        name = 'nodes_complete_edges_complete'
+        G = load_graph(name)
+        pickle_path = graph_path(name) + '.p'
+        pickle.dump(G, open(pickle_path, 'wb'))
+        print(f'{G.number_of_nodes()} nodes, {G.number_of_edges()} edges')
+        print(f'pickle: {directory_size(pickle_path) / 1e6:.1f} MB, compact: {directory_size(graph_path(name)) / 1e6:.1f} MB')
+
+        start = time.perf_counter()
+        G_pickle = pickle.load(open(pickle_path, 'rb'))
+        print(f'Loading the pickle: {time.perf_counter() - start:.3f}s')
+        start = time.perf_counter()
+        compact_graph = load_compact_graph(name)
+        print(f'Loading the compact graph (memory-mapped): {time.perf_counter() - start:.3f}s')
+        start = time.perf_counter()
+        G_compact = CompactGraph.load(graph_path(name)).to_networkx()
+        print(f'Loading the compact graph as networkx graph: {time.perf_counter() - start:.3f}s')
+
+        start = time.perf_counter()
+        ranking_pickle = sorted(in_degree_centrality(pickle.load(open(pickle_path, 'rb'))).items(), key=lambda item: item[1], reverse=True)
+        print(f'Degree ranking from the pickle: {time.perf_counter() - start:.3f}s')
+        start = time.perf_counter()
+        ranking = get_degree_ranking(name)
+        print(f'Degree ranking from the compact graph: {time.perf_counter() - start:.3f}s')
+        print('Same graph:', same_graph(G_pickle, G_compact) and compact_graph.number_of_edges() == G.number_of_edges())
+        print('Same ranking:', ranking == ranking_pickle)
+    finally:
+        os.chdir(working_directory)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,60 @@
+"""
+Compare resolving the metadata of chats one by one with get_chat_metadata against the batched get_chats_metadata on a synthetic
+network served with injected latency. Both must return the same metadata.
+
+Run from the repository root: python -m benchmarks.metadata_benchmark
+"""
+import asyncio
+import time
+from benchmarks.fake_telegram import FakeAsyncTelegramClient, FakeNetwork, FakeTelegramClient
+from entity_cache import EntityCache
+from telegram import AsyncTelegramClient, RequestScheduler, SyncTelegramClient
+from telethon.errors.rpcerrorlist import ChannelPrivateError
+
+
+def create_client(network, request_latency):
+    fake_client = FakeTelegramClient(network, request_latency=request_latency)
+    return SyncTelegramClient(client=fake_client, entity_cache=EntityCache(file_path=None), scheduler=RequestScheduler(rate_limits={})), fake_client
+
+
+def one_by_one(client, chats):
+    chats_metadata = []
+    for chat in chats:
+        try:
+            chats_metadata.append(client.get_chat_metadata(chat))
+        except ChannelPrivateError:
+            pass
+    return chats_metadata
+
+
+def run(chats=1000, resolved_chats=300, request_latency=0.02):
+    network = FakeNetwork(chats=chats, messages_per_chat=1)
+    chat_ids = network.chat_ids[:resolved_chats]
+    usernames = [network.username(chat_id) for chat_id in chat_ids]
+    results = {}
+
+    for name, function, chats in [
+        ('ids one by one', one_by_one, chat_ids),
+        ('ids with get_chats_metadata', SyncTelegramClient.get_chats_metadata, chat_ids),
+        ('usernames one by one', one_by_one, usernames)
+    ]:
+        client, fake_client = create_client(network, request_latency)
+        start = time.perf_counter()
+        with client:
+            results[name] = function(client, chats)
+        print(f'{name}: {time.perf_counter() - start:.2f}s, {fake_client.requests} requests')
+
+    fake_async_client = FakeAsyncTelegramClient(network, request_latency=request_latency)
+
+    async def resolve():
+        async with AsyncTelegramClient(client=fake_async_client, entity_cache=EntityCache(file_path=None), scheduler=RequestScheduler(rate_limits={})) as client:
+            return await client.get_chats_metadata(usernames)
+    start = time.perf_counter()
+    results['usernames concurrently'] = asyncio.run(resolve())
+    print(f'usernames concurrently with get_chats_metadata: {time.perf_counter() - start:.2f}s, {fake_async_client.requests} requests')
+    print('Same results:', all(chats_metadata == results['ids one by one'] for chats_metadata in results.values()))
+    return results
+
+
+if __name__ == "__main__":
+    run()
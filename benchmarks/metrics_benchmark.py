@@ -0,0 +1,57 @@
+"""
+Measure the overhead of the metrics (see metrics.py) on a full crawl with the fake Telegram backend: the same crawl runs with
+metrics disabled and enabled, alternately, and must produce the same data. Also reports the cost of a single disabled timer and
+counter, builds the graph of the last crawl, prints the collected metrics and writes them to data/metrics.json and data/metrics.prom in the crawl directory.
+
+Run from the repository root: python -m benchmarks.metrics_benchmark
+"""
+import os
+import timeit
+from benchmarks.crawl_benchmark import crawl
+from benchmarks.fake_telegram import FakeNetwork
+from graph_builder import build_graph
+from metrics import Metrics, metrics
+
+
+def disabled_overhead(number=1000000):
+    """Seconds per call of a disabled timer and counter."""
+    disabled = Metrics(enabled=False)
+
+    def measure():
+        with disabled.timer('stage_seconds', stage='benchmark'):
+            disabled.count('rows_written_total', 1, table='benchmark')
+    return timeit.timeit(measure, number=number) / number
+
+
+def run(chats=200, messages_per_chat=300, backend='parquet', repetitions=3):
+    print(f'Disabled timer and counter: {disabled_overhead() * 1e6:.2f} microseconds per measurement')
+    network = FakeNetwork(chats=chats, messages_per_chat=messages_per_chat)
+    working_directory = os.getcwd()
+    seconds = {False: [], True: []}
+    all_results = []
+    try:
+        for _ in range(repetitions):
+            for enabled in (False, True):
+                metrics.reset()
+                metrics.enabled = enabled
+                results, measurements = crawl(network, backend, request_latency=0, flood_wait_probability=0, max_iterations=10)
+                seconds[enabled].append(measurements['seconds'])
+                all_results.append(results)
+        # The graph is built twice, the second time from the cached edge weights
+        build_graph()
+        build_graph()
+        metrics.print_summary()
+        metrics.dump_json('data/metrics.json')
+        with open('data/metrics.prom', 'w') as file:
+            file.write(metrics.to_prometheus())
+        print('Metrics written to', os.path.join(os.getcwd(), 'data'))
+    finally:
+        metrics.disable()
+        os.chdir(working_directory)
+    disabled_time, enabled_time = min(seconds[False]), min(seconds[True])
+    print(f'Crawl with metrics disabled: {disabled_time:.2f}s, enabled: {enabled_time:.2f}s ({enabled_time / disabled_time - 1:+.1%})')
+    print('Same results:', all(results == all_results[0] for results in all_results))
+
+
+if __name__ == "__main__":
+    run()
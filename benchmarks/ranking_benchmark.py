@@ -0,0 +1,90 @@
+"""
+Compare the rankings of ranking.py on the CSR arrays of a CompactGraph with networkx on the synthetic network of graph_benchmark:
+the time of in-degree, PageRank and HITS and of top-k queries. The scores must be the same as the ones of networkx. The pure
+Python implementations of networkx are used, as scipy is optional. Also checks the scores of a graph without edges, which
+build_graph produces when its thresholds remove all edges.
+
+Run from the repository root: python -m benchmarks.ranking_benchmark
+"""
+import os
+import time
+import networkx as nx
+import numpy as np
+from networkx import in_degree_centrality
+from networkx.algorithms.link_analysis.hits_alg import _hits_python
+from networkx.algorithms.link_analysis.pagerank_alg import _pagerank_python
+from benchmarks.graph_benchmark import create_edge_files
+import ranking
+from compact_graph import CompactGraph
+from graph_builder import build_graph, get_degree_ranking, get_ranking, get_top_k_degree_chats, load_compact_graph, load_graph
+
+
+def same_scores(graph, scores, nx_scores, tolerance):
+    return np.allclose(scores, [nx_scores[node_id] for node_id in graph.node_ids.tolist()], rtol=0, atol=tolerance)
+
+
+def check_graph_without_edges(nodes=5):
+    """All measures give every node of a graph without edges the same score."""
+    G = nx.DiGraph()
+    G.add_nodes_from((node_id, {'label': str(node_id)}) for node_id in range(nodes))
+    graph = CompactGraph.from_networkx(G)
+    all_equal = True
+    for measure in ranking.MEASURES:
+        scores = ranking.scores(graph, measure)
+        all_equal &= len(scores) == nodes and np.all(scores == scores[0])
+    all_equal &= same_scores(graph, ranking.pagerank(graph), _pagerank_python(G, weight='value'), 1e-6)
+    print('Graph without edges, same scores for all nodes:', bool(all_equal))
+    return all_equal
+
+
+def run(chats=20000, edges=1000000, k=20):
+    check_graph_without_edges()
+    working_directory = os.getcwd()
+    try:
+        create_edge_files(chats, edges)
+        build_graph()
+        name = 'nodes_complete_edges_complete'
+        G = load_graph(name)
+        graph = load_compact_graph(name)
+        print(f'{G.number_of_nodes()} nodes, {G.number_of_edges()} edges')
+
+        for measure, nx_function in [
+            ('in_degree_centrality', in_degree_centrality),
+            ('pagerank', lambda G: _pagerank_python(G, weight='value')),
+            ('authorities', lambda G: _hits_python(G)[1]),
+            ('hubs', lambda G: _hits_python(G)[0])
+        ]:
+            start = time.perf_counter()
+            nx_scores = nx_function(G)
+            nx_time = time.perf_counter() - start
+            start = time.perf_counter()
+            scores = ranking.scores(graph, measure)
+            array_time = time.perf_counter() - start
+            # The iterative measures converge to the same scores, up to the tolerance of the power iteration
+            tolerance = 0 if measure == 'in_degree_centrality' else 1e-6
+            print(f'{measure}: networkx {nx_time:.3f}s, arrays {array_time:.3f}s, speedup {nx_time / array_time:.0f}x, same scores: {same_scores(graph, scores, nx_scores, tolerance)}')
+
+        start = time.perf_counter()
+        ranking_sorted = sorted(in_degree_centrality(G).items(), key=lambda item: item[1], reverse=True)
+        print(f'Degree ranking with networkx: {time.perf_counter() - start:.3f}s')
+        for query in ['first', 'memoized']:
+            start = time.perf_counter()
+            degree_ranking = get_degree_ranking(name)
+            print(f'Degree ranking ({query}): {time.perf_counter() - start:.4f}s')
+        print('Same ranking:', degree_ranking == ranking_sorted)
+        start = time.perf_counter()
+        top_k = get_degree_ranking(name, k)
+        print(f'Top {k} ranking: {time.perf_counter() - start:.4f}s, same as the first {k} of the ranking: {top_k == ranking_sorted[:k]}')
+        for measure in ['pagerank', 'pagerank']:
+            start = time.perf_counter()
+            get_ranking(name, measure, k)
+            print(f'Top {k} by {measure}: {time.perf_counter() - start:.4f}s')
+        start = time.perf_counter()
+        df_top_k = get_top_k_degree_chats(name, k)
+        print(f'get_top_k_degree_chats: {time.perf_counter() - start:.4f}s, same chats: {df_top_k.index.tolist() == [node_id for node_id, _ in ranking_sorted[:k]]}')
+    finally:
+        os.chdir(working_directory)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,69 @@
+"""
+Compare refreshing a crawled network with refresh_chats against scanning the chats again. The network is first crawled up to
+a date, as if the crawl had run in the past, and then refreshed. Afterwards the edges must contain all forwards of the scanned chats.
+
+Run from the repository root: python -m benchmarks.refresh_benchmark
+"""
+import datetime
+import os
+import time
+import network_crawler
+from benchmarks.crawl_data import create_crawl_directory
+from benchmarks.fake_telegram import FakeNetwork, FakeTelegramClient
+from entity_cache import EntityCache
+from frontier import CrawlFrontier
+from storage import SqliteStorage, get_storage
+from telegram import RequestScheduler, SyncTelegramClient
+
+
+def crawl_until(network, max_date, iterations, scan_size):
+    """Crawl the network in a new crawl directory using messages up to max_date. Returns the fake client."""
+    create_crawl_directory(network, storage_class=SqliteStorage)
+    fake_client = FakeTelegramClient(network, request_latency=0)
+    network_crawler.telethon_api = SyncTelegramClient(client=fake_client, entity_cache=EntityCache(file_path=None), scheduler=RequestScheduler(rate_limits={}))
+    with network_crawler.telethon_api:
+        network_crawler.extend_network(iterations=iterations, scan_size=scan_size, max_date=max_date)
+    return fake_client
+
+
+def run(chats=300, messages_per_chat=1000, new_messages=50, iterations=2):
+    network = FakeNetwork(chats=chats, messages_per_chat=messages_per_chat)
+    # The messages are posted hourly until network.end_date, so this date excludes the newest messages of every chat
+    max_date = (network.end_date - datetime.timedelta(hours=new_messages)).timetuple()[:3]
+    working_directory = os.getcwd()
+    try:
+        fake_client = crawl_until(network, max_date, iterations, messages_per_chat)
+        crawl_requests = fake_client.requests
+        start = time.perf_counter()
+        with network_crawler.telethon_api:
+            network_crawler.refresh_chats()
+        refresh_time = time.perf_counter() - start
+        print(f'refresh_chats: {refresh_time:.2f}s, {fake_client.requests - crawl_requests} requests')
+        storage = get_storage()
+        scanned = list(storage.read_table('scanned_log', columns=['chat_id'])['chat_id'])
+        df_edges = storage.read_all_rows('edges')
+        edges = set(zip(df_edges['chat_id'], df_edges['message_id'], df_edges['forwarded_from']))
+        expected_edges = set(
+            (chat_id, message_id, forwarded_from)
+            for chat_id in scanned if chat_id not in network.private_chat_ids
+            for message_id, forwarded_from in network_crawler.extract_forwards(chat_id, network.messages(chat_id))
+        )
+
+        # Scanning the same chats again instead
+        fake_client = crawl_until(network, max_date, iterations, messages_per_chat)
+        crawl_requests = fake_client.requests
+        start = time.perf_counter()
+        with network_crawler.telethon_api:
+            frontier = CrawlFrontier.load(get_storage())
+            for chat_id in scanned:
+                network_crawler.scan_chat(frontier, chat_id, batch_size=messages_per_chat)
+        rescan_time = time.perf_counter() - start
+        print(f'Rescanning {len(scanned)} chats: {rescan_time:.2f}s, {fake_client.requests - crawl_requests} requests')
+    finally:
+        os.chdir(working_directory)
+    print('All forwards of the scanned chats stored:', edges == expected_edges)
+    return edges == expected_edges
+
+
+if __name__ == "__main__":
+    run()
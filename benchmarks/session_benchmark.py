@@ -0,0 +1,34 @@
+"""
+Compare the per-request overhead of connecting for every request with a long-lived connection.
+
+Run from the repository root: python -m benchmarks.session_benchmark
+"""
+import time
+from benchmarks.fake_telegram import FakeNetwork, FakeTelegramClient
+from entity_cache import EntityCache
+from telegram import RequestScheduler, SyncTelegramClient
+
+
+def run(requests=50, connect_latency=0.05, request_latency=0.005):
+    network = FakeNetwork(chats=requests, private_ratio=0)
+    results = {}
+    for mode in ['per_request', 'persistent']:
+        fake_client = FakeTelegramClient(network, connect_latency, request_latency)
+        telethon_api = SyncTelegramClient(client=fake_client, entity_cache=EntityCache(file_path=None), scheduler=RequestScheduler(rate_limits={}))
+        start = time.perf_counter()
+        if mode == 'persistent':
+            telethon_api.open()
+        for chat_id in network.chat_ids:
+            telethon_api.fetch_messages(chat_id)
+            telethon_api.is_private(chat_id)
+        telethon_api.close()
+        elapsed = time.perf_counter() - start
+        results[mode] = elapsed
+        print(f"{mode:>12}: {elapsed:.3f}s for {fake_client.requests} requests, {fake_client.connects} connects, "
+              f"{1000 * elapsed / fake_client.requests:.2f}ms per request")
+    print(f"Speedup: {results['per_request'] / results['persistent']:.1f}x")
+    return results
+
+
+if __name__ == "__main__":
+    run()
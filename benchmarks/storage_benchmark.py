@@ -0,0 +1,52 @@
+"""
+Crawl a synthetic network with each storage backend, migrate the csv data to the other backends and compare the time it
+takes to load all edges.
+
+Run from the repository root: python -m benchmarks.storage_benchmark
+"""
+import os
+import time
+import network_crawler
+from benchmarks.crawl_data import create_crawl_directory, read_crawl_results
+from benchmarks.fake_telegram import FakeNetwork, FakeTelegramClient
+from entity_cache import EntityCache
+from storage import CsvStorage, ParquetStorage, SqliteStorage, get_storage, migrate_storage
+from telegram import RequestScheduler, SyncTelegramClient
+
+
+def run(chats=300, messages_per_chat=300, scan_size=300, iterations=2):
+    network = FakeNetwork(chats=chats, messages_per_chat=messages_per_chat)
+    working_directory = os.getcwd()
+    results = {}
+    try:
+        for storage_class in [CsvStorage, ParquetStorage, SqliteStorage]:
+            name = storage_class.__name__
+            create_crawl_directory(network, storage_class=storage_class)
+            network_crawler.telethon_api = SyncTelegramClient(client=FakeTelegramClient(network, connect_latency=0, request_latency=0), entity_cache=EntityCache(file_path=None), scheduler=RequestScheduler(rate_limits={}))
+            start = time.perf_counter()
+            network_crawler.extend_network(iterations=iterations, scan_size=scan_size)
+            print(f"{name}: crawl took {time.perf_counter() - start:.2f}s")
+            results[name] = read_crawl_results(get_storage())
+
+        # Migrate the csv data of the last csv crawl and compare loading all edges
+        csv_storage = CsvStorage()
+        create_crawl_directory(network)
+        network_crawler.extend_network(iterations=iterations, scan_size=scan_size)
+        for storage_class in [ParquetStorage, SqliteStorage]:
+            storage = storage_class()
+            start = time.perf_counter()
+            migrate_storage(csv_storage, storage)
+            print(f"Migration to {storage_class.__name__} took {time.perf_counter() - start:.2f}s")
+            print('Same data after migration:', read_crawl_results(csv_storage) == read_crawl_results(storage))
+        for storage in [csv_storage, ParquetStorage(), SqliteStorage()]:
+            start = time.perf_counter()
+            df_edges = storage.read_all_rows('edges', columns=['forwarded_from'])
+            print(f"{type(storage).__name__}: loading {len(df_edges)} edges took {time.perf_counter() - start:.3f}s")
+    finally:
+        os.chdir(working_directory)
+    print('Same results:', results['CsvStorage'] == results['ParquetStorage'] == results['SqliteStorage'])
+    return results
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,69 @@
+"""
+Measure the peak memory of scanning one large chat with scan_chat for increasing scan sizes, compared with collecting the
+fetched message objects of the whole scan before processing them. Like a real client, the fake network creates new message
+objects for every response. With the streaming pages of iter_message_pages, the peak memory must stay flat apart from the
+forward edges, which are a pair of ids per forward.
+
+Run from the repository root: python -m benchmarks.streaming_benchmark
+"""
+import os
+import time
+import tracemalloc
+from types import SimpleNamespace
+import network_crawler
+from benchmarks.crawl_data import create_crawl_directory
+from benchmarks.fake_telegram import FakeNetwork, FakeTelegramClient
+from entity_cache import EntityCache
+from storage import SqliteStorage
+from telegram import RequestScheduler, SyncTelegramClient
+
+
+class DeserializingNetwork(FakeNetwork):
+    """FakeNetwork that returns new message objects with every response, as they are deserialized by a real client."""
+    def history(self, request):
+        response = super().history(request)
+        return SimpleNamespace(messages=[SimpleNamespace(**vars(message)) for message in response.messages])
+
+
+def scan_chat_collecting(nodes_in_network_id_list, chat_id, batch_size=100):
+    """Fetch all pages of the scan first and then store the messages and extract the forwards."""
+    messages = []
+    while len(messages) < batch_size:
+        page = network_crawler.telethon_api.fetch_messages(chat=chat_id, offset_id=messages[-1].id if messages else 0)
+        if not page:
+            break
+        messages.extend(page[:batch_size - len(messages)])
+    network_crawler.add_messages(chat_id, messages)
+    forward_edges = network_crawler.extract_forwards(chat_id, messages)
+    network_crawler.flush_messages(chat_id)
+    return [], forward_edges, messages[0], messages[-1]
+
+
+def run(scan_sizes=(1000, 5000, 20000, 50000)):
+    network = DeserializingNetwork(chats=50, messages_per_chat=max(scan_sizes), private_ratio=0)
+    chat_id = network.chat_ids[1]
+    network.messages(chat_id)
+    working_directory = os.getcwd()
+    try:
+        create_crawl_directory(network, storage_class=SqliteStorage)
+        network_crawler.telethon_api = SyncTelegramClient(client=FakeTelegramClient(network, request_latency=0), entity_cache=EntityCache(file_path=None), scheduler=RequestScheduler(rate_limits={}))
+        nodes = set(network.chat_ids)
+        with network_crawler.telethon_api:
+            for scan_size in scan_sizes:
+                results = {}
+                for name, scan in [('collecting', scan_chat_collecting), ('streaming', network_crawler.scan_chat)]:
+                    tracemalloc.start()
+                    start = time.perf_counter()
+                    _, forward_edges, newest_message, oldest_message = scan(nodes, chat_id, batch_size=scan_size)
+                    elapsed = time.perf_counter() - start
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    results[name] = (forward_edges, newest_message.id, oldest_message.id)
+                    print(f'{scan_size} messages, {name}: peak memory {peak / 1e6:.1f} MB, {elapsed:.2f}s')
+                print('  Same forwards:', results['collecting'] == results['streaming'])
+    finally:
+        os.chdir(working_directory)
+
+
+if __name__ == "__main__":
+    run()
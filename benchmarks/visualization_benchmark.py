@@ -0,0 +1,41 @@
+"""
+Export the synthetic network of graph_benchmark with export_graph at several levels of detail: the time of the first export,
+which computes the layout, and of the second one, which uses the cached layout, and the size of the exported files. The GEXF
+files are read back to check that they contain the reduced graph.
+
+Run from the repository root: python -m benchmarks.visualization_benchmark
+"""
+import os
+import time
+import networkx as nx
+from benchmarks.graph_benchmark import create_edge_files
+from graph_builder import build_graph
+from graph_visualizer import export_graph, reduce_graph
+
+
+def run(chats=20000, edges=1000000, levels=((500, 1, False), (1000, 2, False), (2000, 5, False), (2000, 1, True))):
+    working_directory = os.getcwd()
+    try:
+        create_edge_files(chats, edges)
+        build_graph()
+        name = 'nodes_complete_edges_complete'
+        for k, min_edge_weight, communities in levels:
+            G = reduce_graph(name, k, min_edge_weight)
+            print(f'k={k}, min_edge_weight={min_edge_weight}, communities={communities}: {G.number_of_nodes()} nodes, {G.number_of_edges()} edges')
+            for cache in ['cold', 'warm']:
+                for file_format in ['html', 'gexf']:
+                    start = time.perf_counter()
+                    file_path = export_graph(name, file_format, k=k, min_edge_weight=min_edge_weight, communities=communities)
+                    print(f'  {file_format} ({cache} layout cache): {time.perf_counter() - start:.2f}s, {os.path.getsize(file_path) / 1e6:.1f} MB')
+            H = nx.read_gexf(file_path)
+            if communities:
+                print(f'  {H.number_of_nodes()} communities, {H.number_of_edges()} edges between them')
+            else:
+                print('  GEXF has all nodes:', G.number_of_nodes() == H.number_of_nodes())
+            print('  GEXF has positions:', all('viz' in data for _, data in H.nodes(data=True)))
+    finally:
+        os.chdir(working_directory)
+
+
+if __name__ == "__main__":
+    run()
@@ -1,12 +1,9 @@
 import logging
-import pandas as pd
-from network_crawler import add_messages
+from network_crawler import add_messages, flush_messages, telethon_api
+from storage import get_storage
 from tqdm import tqdm
-from telegram import SyncTelegramClient
 from telethon.errors.rpcerrorlist import ChannelPrivateError
 
-# Initialize telegram client
-telethon_api = SyncTelegramClient()
 # Configure logging
 logging.basicConfig(filename='log.log', level=logging.DEBUG)
 
@@ -21,9 +18,10 @@ def store_chat_messages(chat_id, offset_id=0):
     except ValueError:
         print('ValueError in chat', chat_id)
     add_messages(chat_id, messages)
+    flush_messages(chat_id)
 
 def store_can_view_participants():
-    df_chats = pd.read_csv('data/chats.csv')
+    df_chats = get_storage().read_table('chats')
     stored_chat_ids = list(df_chats.iloc[:,0])
     can_view_participants_column = [can_view_participants(chat_id) for chat_id in tqdm(stored_chat_ids)]
     df_chats['can_view_participants'] = can_view_participants_column
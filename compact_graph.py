@@ -0,0 +1,91 @@
+import os
+import networkx as nx
+import numpy as np
+
+
+class CompactGraph:
+    """
+    Directed graph of chats stored as arrays: the ids and labels of the nodes and the weighted edges in compressed sparse row (CSR)
+    form, where the edges of node i are indices[indptr[i]:indptr[i+1]] with the weights weights[indptr[i]:indptr[i+1]].
+    An edge points from the chat that forwarded messages to the chat they were forwarded from, like in build_graph.
+
+    Graphs are saved as a directory of .npy files, which load in milliseconds and can be memory-mapped, so that degrees and
+    rankings can be computed without building a networkx graph.
+    """
+    ARRAYS = ['node_ids', 'labels', 'indptr', 'indices', 'weights']
+
+    def __init__(self, node_ids, labels, indptr, indices, weights):
+        """
+        node_ids - Chat ids of the nodes
+        labels - Labels of the nodes (the chat names)
+        indptr, indices, weights - Edges in CSR form, indices are positions in node_ids
+        """
+        self.node_ids = node_ids
+        self.labels = labels
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+
+    @classmethod
+    def from_networkx(cls, G):
+        """Convert a graph built by build_graph, using the node attribute label and the edge attribute value."""
+        node_ids = np.array(list(G.nodes), dtype=np.int64)
+        positions = {node_id: position for position, node_id in enumerate(G.nodes)}
+        labels = np.array([str(label) for _, label in G.nodes(data='label', default='')], dtype=str)
+        degrees = np.array([G.out_degree(node_id) for node_id in G.nodes], dtype=np.int64)
+        indptr = np.concatenate([[0], np.cumsum(degrees)]).astype(np.int64)
+        indices = np.array([positions[target] for _, target in G.edges()], dtype=np.int32)
+        weights = np.array([weight for _, _, weight in G.edges(data='value', default=1)], dtype=np.int64)
+        return cls(node_ids, labels, indptr, indices, weights)
+
+    def to_networkx(self):
+        """Build the networkx graph with the same nodes, labels and edge weights."""
+        G = nx.DiGraph()
+        G.add_nodes_from((node_id, {'label': label}) for node_id, label in zip(self.node_ids.tolist(), self.labels.tolist()))
+        sources = np.repeat(self.node_ids, np.diff(self.indptr))
+        G.add_weighted_edges_from(zip(sources.tolist(), self.node_ids[self.indices].tolist(), self.weights.tolist()), weight='value')
+        return G
+
+    def save(self, directory):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        for name in self.ARRAYS:
+            # Loaded graphs may memory-map the files, so they are replaced instead of overwritten. Mapped arrays keep the old files.
+            file_path = os.path.join(directory, name + '.npy')
+            with open(file_path + '.tmp', 'wb') as file:
+                np.save(file, getattr(self, name))
+            os.replace(file_path + '.tmp', file_path)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        Load a graph saved with save.
+
+        mmap - If True, the arrays are memory-mapped instead of read into memory
+        """
+        mmap_mode = 'r' if mmap else None
+        return cls(*[np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode) for name in cls.ARRAYS])
+
+    def number_of_nodes(self):
+        return len(self.node_ids)
+
+    def number_of_edges(self):
+        return len(self.indices)
+
+    def in_degree(self):
+        """Number of chats that forwarded from each node."""
+        return np.bincount(self.indices, minlength=len(self.node_ids))
+
+    def out_degree(self):
+        return np.diff(self.indptr)
+
+    def in_strength(self):
+        """Number of forwarded messages from each node, i.e. the sum of the weights of its incoming edges."""
+        return np.bincount(self.indices, weights=self.weights, minlength=len(self.node_ids)).astype(np.int64)
+
+    def in_degree_centrality(self):
+        """In-degree normalized by the maximum possible degree, like networkx.in_degree_centrality."""
+        n = len(self.node_ids)
+        if n <= 1:
+            return np.ones(n)
+        return self.in_degree() * (1.0 / (n - 1))
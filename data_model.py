@@ -1,6 +1,13 @@
+from collections import namedtuple
+
 # Columns in csv files
 CHATS_COLUMNS = ['id', 'name', 'username', 'type', 'can_comment']
 SCANNED_COLUMNS = ['chat_id', 'newest_message_id', 'newest_message_date', 'oldest_message_id', 'oldest_message_date']
 NODES_COLUMNS = ['chat_id', 'chat_name', 'in_seed', 'in_degree']
 EDGES_COLUMNS = ['message_id', 'forwarded_from']
-MESSAGES_COLUMNS = ['id', 'content', 'forwarded', 'date', 'views', 'forwards']
\ No newline at end of file
+MESSAGES_COLUMNS = ['id', 'content', 'forwarded', 'date', 'views', 'forwards']
+NAME_QUEUE_COLUMNS = ['chat_id', 'status']
+
+# Compact form of a fetched message: the stored columns and the id of the channel it was forwarded from, None if it was not
+# forwarded from another channel
+MessageRecord = namedtuple('MessageRecord', MESSAGES_COLUMNS + ['forwarded_from'])
\ No newline at end of file
@@ -0,0 +1,96 @@
+import datetime
+import logging
+import os
+import socket
+import time
+import network_crawler
+from frontier import CrawlFrontier
+from network_crawler import scan_chat, store_scan_results
+from storage import SqliteStorage, get_storage
+from telegram import TRANSIENT_ERRORS
+from telethon.errors.rpcerrorlist import FloodWaitError
+from work_queue import LeaseLostError, WorkQueue
+
+# Configure logging
+logging.basicConfig(filename='log.log', level=logging.DEBUG)
+
+
+def crawl_worker(crawl='default', iterations=1, scan_size=100, only_scan_chats=None, max_date=None, min_degree=0, worker=None, lease_seconds=60, poll_seconds=1):
+    """
+    Extend the network like network_crawler.extend_network together with other workers, which may run in other processes or on
+    other machines. The workers share the data in a SqliteStorage and take the chats to scan from a WorkQueue in the same database,
+    so no chat is scanned twice. Start the same call on every machine; the first worker creates the crawl and the others join it
+    with its settings. The worker returns when all iterations are done. The results are the same as those of extend_network.
+
+    crawl - Name of the crawl. A crawl that finished is not started again, use a new name for the next crawl.
+    worker - Name of the worker, by default the host name and process id
+    lease_seconds - Seconds after which a chat leased by a worker that stopped sending heartbeats is given to another worker
+    poll_seconds - Seconds to wait before asking for work again while other workers finish the current iteration
+    For the other arguments see network_crawler.extend_network.
+    """
+    storage = get_storage()
+    if not isinstance(storage, SqliteStorage):
+        print('Distributed crawls need the sqlite storage backend, set "storage": {"backend": "sqlite"} in config.json')
+        return
+    if not storage.has_table('chats'):
+        print('chats.csv does not exist yet. You need to call initialize_data first.')
+        return
+
+    queue = WorkQueue(storage, lease_seconds)
+    settings = queue.create(crawl, iterations, {'scan_size': scan_size, 'only_scan_chats': only_scan_chats, 'max_date': max_date, 'min_degree': min_degree})
+    scan_size, only_scan_chats, max_date, min_degree = settings['scan_size'], settings['only_scan_chats'], settings['max_date'], settings['min_degree']
+    offset_date = datetime.datetime(*max_date).replace(hour=23, minute=59, second=59, microsecond=999999) if max_date != None else None
+    worker = worker or socket.gethostname() + ':' + str(os.getpid())
+    frontier = None
+    frontier_iteration = None
+    stop_heartbeat = queue.heartbeat(crawl, worker)
+    try:
+        while True:
+            iteration, chat_ids = queue.lease(crawl, worker)
+            if not chat_ids:
+                if queue.next_iteration(crawl, lambda: CrawlFrontier.load(storage).chats_to_scan(only_scan_chats, min_degree)):
+                    continue
+                if queue.finished(crawl):
+                    break
+                # Other workers are still scanning chats of this iteration, and their leases may expire
+                time.sleep(poll_seconds)
+                continue
+            if frontier_iteration != iteration:
+                # Reload the nodes found by all workers in the previous iterations
+                frontier = CrawlFrontier.load(storage)
+                network_crawler.edge_index.clear()
+                frontier_iteration = iteration
+            for chat_id in chat_ids:
+                scan_leased_chat(queue, crawl, worker, iteration, frontier, chat_id, scan_size, offset_date)
+    finally:
+        stop_heartbeat.set()
+        storage.flush()
+    print('Worker', worker, 'finished crawl', crawl)
+
+def scan_leased_chat(queue, crawl, worker, iteration, frontier, chat_id, scan_size, offset_date):
+    """
+    Scan a chat leased from the queue and store the results in the same transaction that completes the lease, so that they are
+    discarded if the lease expired and the chat was given to another worker meanwhile.
+    """
+    storage = get_storage()
+    try:
+        new_nodes_found, forward_edges, newest_message, oldest_message = scan_chat(frontier, chat_id, batch_size=scan_size, offset_date=offset_date)
+    except (FloodWaitError, *TRANSIENT_ERRORS) as error:
+        # Like in extend_network, the chat is not logged as scanned and is scanned again in the next iteration
+        print('Chat', chat_id, 'could not be scanned completely and is not logged as scanned:', error)
+        try:
+            queue.complete(crawl, worker, iteration, chat_id, status='failed')
+        except LeaseLostError:
+            pass
+        return
+    # Other workers may have stored the chats found since the frontier was loaded
+    stored_nodes = set(storage.read_table('nodes', columns=['chat_id'], keys=new_nodes_found)['chat_id'])
+    new_nodes_found = [node_id for node_id in new_nodes_found if node_id not in stored_nodes]
+    # The metadata is requested before the transaction, so that other workers are not locked out during the requests
+    chats_metadata = network_crawler.telethon_api.get_chats_metadata(new_nodes_found) if newest_message != None else []
+    try:
+        with network_crawler.edge_index.forget_on_error(), storage.transaction():
+            queue.complete(crawl, worker, iteration, chat_id)
+            store_scan_results(frontier, chat_id, new_nodes_found, forward_edges, newest_message, oldest_message, chats_metadata)
+    except LeaseLostError as error:
+        print(error, '- the results are discarded, because another worker scans the chat')
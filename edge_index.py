@@ -0,0 +1,111 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from storage import get_storage
+
+
+class EdgeIndex:
+    """
+    Index of the stored forward edges keyed by (chat the message was forwarded to, message id), with the number of forwards from
+    every chat forwarded from (the edge weights). It turns the edges found by a scan into changes of the stored data: edges of
+    messages that are already stored with the same origin are skipped, and the in-degree of a chat (the number of distinct chats
+    that forwarded from it) only changes when the weight of an edge becomes positive or zero. Storing the same forwards again,
+    e.g. when a chat is rescanned or older messages are backfilled, therefore changes nothing.
+
+    The entries of a chat are loaded from the stored edges the first time the chat is updated and then kept in memory, so every
+    edge is processed in constant time. The max_chats chats updated last are kept.
+    """
+    def __init__(self, max_chats=1000):
+        """
+        max_chats - Number of chats whose entries are kept in memory
+        """
+        self.max_chats = max_chats
+        self._storage = None
+        self._chats = OrderedDict()
+        self._updated = None
+
+    def clear(self):
+        """Forget all entries, e.g. when other processes may have stored edges of the chats meanwhile."""
+        self._chats = OrderedDict()
+
+    def forget(self, chat_id):
+        """Forget the entries of the chat, e.g. because the transaction that stored its edges was rolled back."""
+        self._chats.pop(chat_id, None)
+
+    @contextmanager
+    def forget_on_error(self):
+        """
+        Forget all chats updated in the with block if it raises an exception. Wrap the storage transaction that stores the edges,
+        so that the index never contains edges of a transaction that was rolled back:
+        with edge_index.forget_on_error(), storage.transaction(): ...
+        """
+        outermost = self._updated is None
+        if outermost:
+            self._updated = []
+        try:
+            yield
+        except BaseException:
+            for chat_id in self._updated:
+                self.forget(chat_id)
+            raise
+        finally:
+            if outermost:
+                self._updated = None
+
+    def _entry(self, chat_id, stored):
+        """Return the tuple (origin per message id, weight per chat forwarded from) of the chat."""
+        storage = get_storage()
+        if storage is not self._storage:
+            # The entries belong to the data of another storage backend
+            self._storage = storage
+            self.clear()
+        entry = self._chats.get(chat_id)
+        if entry is not None:
+            self._chats.move_to_end(chat_id)
+            return entry
+        origins = {}
+        weights = {}
+        if stored:
+            df_edges = storage.read_rows('edges', chat_id)
+            origins = dict(zip(df_edges['message_id'].astype('int64').tolist(), df_edges['forwarded_from'].astype('int64').tolist()))
+            for forwarded_from in origins.values():
+                weights[forwarded_from] = weights.get(forwarded_from, 0) + 1
+        entry = self._chats[chat_id] = (origins, weights)
+        if len(self._chats) > self.max_chats:
+            self._chats.popitem(last=False)
+        return entry
+
+    def add_edges(self, chat_id, edges, stored=True):
+        """
+        Add the edges of a chat to the index.
+
+        chat_id - Id of the chat the messages were forwarded to
+        edges - List of tuples (message_id, forwarded_from)
+        stored - False if the chat is known to have no stored edges, e.g. because it was never scanned, which saves reading them
+        Returns:
+            changed_edges: The edges that are not stored yet or whose origin changed, in the given order
+            in_degree_increments: Dictionary mapping chats forwarded from to the change of their in-degree (1 or -1)
+        """
+        origins, weights = self._entry(chat_id, stored)
+        if self._updated is not None:
+            self._updated.append(chat_id)
+        changed_edges = []
+        in_degree_increments = {}
+        for message_id, forwarded_from in edges:
+            previous = origins.get(message_id)
+            if previous == forwarded_from:
+                continue
+            origins[message_id] = forwarded_from
+            changed_edges.append((message_id, forwarded_from))
+            if previous is not None:
+                weights[previous] -= 1
+                if weights[previous] == 0:
+                    del weights[previous]
+                    in_degree_increments[previous] = in_degree_increments.get(previous, 0) - 1
+            weights[forwarded_from] = weights.get(forwarded_from, 0) + 1
+            if weights[forwarded_from] == 1:
+                in_degree_increments[forwarded_from] = in_degree_increments.get(forwarded_from, 0) + 1
+        return changed_edges, {node_id: increment for node_id, increment in in_degree_increments.items() if increment != 0}
+
+    def weights(self, chat_id):
+        """Dictionary mapping the chats forwarded from to the number of messages of the chat forwarded from them."""
+        return dict(self._entry(chat_id, True)[1])
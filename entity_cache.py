@@ -0,0 +1,99 @@
+import atexit
+import json
+import os
+import time
+from metrics import metrics
+
+
+class EntityCache:
+    """
+    Persistent cache of information about chats (privacy and metadata) keyed by channel id, so that the same entity is not
+    requested from the API over and over again. Chats whose lookup raised ChannelPrivateError are cached as well.
+    """
+    def __init__(self, file_path='data/entity_cache.json', ttl=7*24*60*60, save_interval=100):
+        """
+        file_path - Path of the json file the cache is stored in. If None, the cache is only kept in memory.
+        ttl - Number of seconds after which a cached entry expires and the chat is requested again
+        save_interval - The cache is written to disk after this many changes (and when the program exits)
+        """
+        self.file_path = file_path
+        self.ttl = ttl
+        self.save_interval = save_interval
+        self.hits = 0
+        self.misses = 0
+        self._unsaved_changes = 0
+        self._entries = {}
+        if file_path is not None:
+            if os.path.isfile(file_path):
+                with open(file_path, 'r') as file:
+                    self._entries = {int(chat_id): entry for chat_id, entry in json.load(file).items()}
+            atexit.register(self.save)
+
+    def _entry(self, chat_id):
+        """Return the entry of the chat or None if it is not cached or expired."""
+        entry = self._entries.get(chat_id)
+        if entry is not None and time.time() - entry['timestamp'] > self.ttl:
+            del self._entries[chat_id]
+            entry = None
+        return entry
+
+    def get(self, chat_id, key):
+        """
+        Look up a cached value of the chat.
+
+        chat_id - Id of the chat
+        key - Name of the cached value, e.g. 'restricted' or 'metadata'
+        Returns:
+            found: True if the value is cached
+            value: The cached value or None
+        """
+        entry = self._entry(chat_id)
+        if entry is not None and key in entry:
+            self.hits += 1
+            metrics.count('cache_lookups_total', cache='entity', result='hit')
+            return True, entry[key]
+        self.misses += 1
+        metrics.count('cache_lookups_total', cache='entity', result='miss')
+        return False, None
+
+    def is_private_error(self, chat_id):
+        """Return True if accessing the chat raised ChannelPrivateError the last time it was requested."""
+        entry = self._entry(chat_id)
+        if entry is not None and entry.get('private_error', False):
+            self.hits += 1
+            metrics.count('cache_lookups_total', cache='entity', result='hit')
+            return True
+        return False
+
+    def set(self, chat_id, key, value):
+        entry = self._entry(chat_id)
+        if entry is None or entry.get('private_error'):
+            entry = {}
+            self._entries[chat_id] = entry
+        entry[key] = value
+        entry['timestamp'] = time.time()
+        self._changed()
+
+    def set_private_error(self, chat_id):
+        """Remember that accessing the chat raised ChannelPrivateError."""
+        self._entries[chat_id] = {'private_error': True, 'timestamp': time.time()}
+        self._changed()
+
+    def _changed(self):
+        self._unsaved_changes += 1
+        if self._unsaved_changes >= self.save_interval:
+            self.save()
+
+    def save(self):
+        """Write the cache to disk."""
+        if self.file_path is None or self._unsaved_changes == 0:
+            return
+        directory = os.path.dirname(self.file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # Write to a temporary file first so that an interrupted write does not corrupt the cache
+        temporary_file_path = self.file_path + '.tmp'
+        with open(temporary_file_path, 'w') as file:
+            json.dump(self._entries, file)
+        os.replace(temporary_file_path, self.file_path)
+        self._unsaved_changes = 0
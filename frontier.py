@@ -0,0 +1,91 @@
+import heapq
+import itertools
+
+
+class CrawlFrontier:
+    """
+    In-memory state of the crawl: the nodes of the network with their in-degree and the chats that were scanned. Membership tests
+    and updates take constant time. The unscanned nodes are additionally kept in a priority queue ordered by in-degree.
+    The frontier is loaded from the storage once when a crawl starts and then kept up to date by the crawler.
+    """
+    def __init__(self, in_degrees=None, scanned=None):
+        """
+        in_degrees - Dictionary mapping the ids of the nodes to their in-degree, in the order the nodes were added
+        scanned - Ids of the chats that were scanned
+        """
+        self.in_degrees = dict(in_degrees or {})
+        self.scanned = set(scanned or [])
+        self._queue = []
+        self._counter = itertools.count()
+        for node_id in self.in_degrees:
+            self._push(node_id)
+
+    @classmethod
+    def load(cls, storage):
+        """Load the frontier from the nodes and scanned_log tables of the storage backend."""
+        df_nodes = storage.read_table('nodes', columns=['chat_id', 'in_degree'])
+        df_scanned_log = storage.read_table('scanned_log', columns=['chat_id'])
+        return cls(dict(zip(df_nodes['chat_id'].tolist(), df_nodes['in_degree'].tolist())), df_scanned_log['chat_id'].tolist())
+
+    def __contains__(self, node_id):
+        """True if the chat is a node of the network."""
+        return node_id in self.in_degrees
+
+    def __len__(self):
+        return len(self.in_degrees)
+
+    def _push(self, node_id):
+        if node_id not in self.scanned:
+            # heapq is a min-heap, so the in-degree is negated. The counter keeps the order of nodes with the same in-degree.
+            heapq.heappush(self._queue, (-self.in_degrees[node_id], next(self._counter), node_id))
+
+    def add_nodes(self, nodes_id_list):
+        for node_id in nodes_id_list:
+            if node_id not in self.in_degrees:
+                self.in_degrees[node_id] = 0
+                self._push(node_id)
+
+    def add_in_degrees(self, in_degree_increments):
+        """
+        Update the in-degrees with the changes returned by network_crawler.add_edges. Chats that are not nodes yet are added.
+
+        in_degree_increments - Dictionary mapping ids of nodes to the change of their in-degree
+        """
+        for node_id, increment in in_degree_increments.items():
+            self.in_degrees[node_id] = self.in_degrees.get(node_id, 0) + increment
+            self._push(node_id)
+
+    def mark_scanned(self, chat_id):
+        self.scanned.add(chat_id)
+
+    def is_scanned(self, chat_id):
+        return chat_id in self.scanned
+
+    def chats_to_scan(self, only_scan_chats=None, min_degree=0):
+        """
+        Ids of the nodes that have not been scanned yet and have a degree of at least min_degree, in the order the nodes were added.
+
+        only_scan_chats - List of chat ids. If given, only these chats are considered.
+        """
+        only_scan_chats = set(only_scan_chats) if only_scan_chats is not None else None
+        return [
+            chat_id for chat_id, in_degree in self.in_degrees.items()
+            if chat_id not in self.scanned and in_degree >= min_degree and (only_scan_chats is None or chat_id in only_scan_chats)
+        ]
+
+    def pop(self, min_degree=0):
+        """
+        Remove and return the id of the unscanned node with the highest in-degree, or None if there is no unscanned node with an
+        in-degree of at least min_degree. The node is not marked as scanned.
+        """
+        while self._queue:
+            negative_in_degree, _, node_id = self._queue[0]
+            # Skip outdated entries of nodes that were scanned or whose in-degree changed since they were pushed
+            if node_id in self.scanned or -negative_in_degree != self.in_degrees[node_id]:
+                heapq.heappop(self._queue)
+                continue
+            if -negative_in_degree < min_degree:
+                return None
+            heapq.heappop(self._queue)
+            return node_id
+        return None
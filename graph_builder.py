@@ -3,15 +3,19 @@ import networkx as nx
 import os
 import pandas as pd
 import pickle
-from networkx import in_degree_centrality
-from telegram import SyncTelegramClient
-from telethon.errors.rpcerrorlist import ChannelPrivateError
+import ranking
+from compact_graph import CompactGraph
+from data_model import NAME_QUEUE_COLUMNS
+from metrics import metrics
+from storage import get_storage
 
-# Initialize telegram client
-telethon_api = SyncTelegramClient()
 # Configure logging
 logging.basicConfig(filename='log.log', level=logging.DEBUG)
 
+# Cache of the aggregated edge weights. Increase the format version when the layout of the cached data changes.
+EDGE_WEIGHTS_CACHE_PATH = 'data/network/edge_weights.p'
+EDGE_WEIGHTS_CACHE_FORMAT = 1
+
 
 def build_graph(min_edge_weight_threshold=0, min_in_degree_threshold=0):
     """
@@ -22,68 +26,200 @@ def build_graph(min_edge_weight_threshold=0, min_in_degree_threshold=0):
             of edges that are added to the graph. Defaults to 0.
         min_in_degree_threshold (int, optional): Threshold for the minimum in-degree (number of chats that forwarded from this chat)
             of nodes that are added to the graph. Chats that were scanned are added regardless of in-degree. Defaults to 0.
+
+    The graph is built from local data only. Chats that are missing in chats.csv are labelled with their id and added to the name
+    queue (data/network/name_queue.csv). Call network_crawler.resolve_queued_chat_names and build the graph again to label them.
+    Chats that could not be resolved because they are private or unknown are left out like before.
     """
-    
-    # Instantiate the network graph
-    G = nx.DiGraph()
-    # Get the ids and names of all chats that have been scanned
-    df_scanned_log = pd.read_csv('data/network/scanned_log.csv').set_index('chat_id')
-    df_chats = pd.read_csv('data/chats.csv').set_index('id')
-    df_nodes = pd.read_csv('data/network/nodes.csv').set_index('chat_id')
-    df_scanned = df_scanned_log.join(df_chats)
-
-    # Construct the network graph
-    for scanned_chat in df_scanned.itertuples(index=True):
-        chat_id = scanned_chat[0]
-        if not G.has_node(chat_id):
-            G.add_node(chat_id, label=scanned_chat.name)
-        try:
-            df_edges = pd.read_csv('data/network/edges/'+str(chat_id)+'.csv')
-        except FileNotFoundError:
-            # Skip chats with no edges file
-            continue
-        weighted_edges = df_edges["forwarded_from"].value_counts()
-        for forwarded_from, edge_weight in weighted_edges.items():
-            # Only add nodes and edges that exceed the defined thresholds
-            if df_nodes.at[forwarded_from, 'in_degree'] >= min_in_degree_threshold and edge_weight >= min_edge_weight_threshold:
-                # If the node corresponding to the chat forwarded_from does not exist yet, create it
-                if not G.has_node(forwarded_from):
-                    forwarded_name = ''
-                    try:
-                        forwarded_name = df_chats.at[forwarded_from, 'name']
-                    except:
-                        # If the chat name is not in the database yet, fetch it
-                        try:
-                            forwarded_name = telethon_api.get_chat_name(forwarded_from)
-                        except ChannelPrivateError:
-                            logging.info(str(forwarded_from) + ' is private')
-                            continue
-                    G.add_node(forwarded_from, label=forwarded_name)
-                G.add_edge(chat_id, forwarded_from, value=edge_weight)
-    
-    # Create graphs directory if it does not exist
-    if not os.path.exists('data/network/graphs'):
-        os.makedirs('data/network/graphs')
-    # Store network graph in pickle file
+    build_graphs([(min_edge_weight_threshold, min_in_degree_threshold)])
+
+
+@metrics.timed('build_graph')
+def build_graphs(thresholds):
+    """
+    Build and store the graphs for several pairs of thresholds, e.g. to compare cutoffs for visualisations. The crawled data is
+    read once for all graphs and the aggregated edge weights are cached (see load_edge_weights).
+
+    thresholds - List of tuples (min_edge_weight_threshold, min_in_degree_threshold), see build_graph
+    """
+    for min_edge_weight_threshold, min_in_degree_threshold, G in iter_graphs(thresholds):
+        store_graph(G, min_edge_weight_threshold, min_in_degree_threshold)
+
+
+def iter_graphs(thresholds):
+    """
+    Yield tuples (min_edge_weight_threshold, min_in_degree_threshold, graph) for the given pairs of thresholds without storing
+    the graphs. See build_graphs.
+    """
+    storage = get_storage()
+    df_weights = load_edge_weights(storage)
+    df_scanned_log = storage.read_table('scanned_log', columns=['chat_id'])
+    df_chats = storage.read_table('chats', columns=['id', 'name'])
+    df_nodes = storage.read_table('nodes', columns=['chat_id', 'in_degree'])
+    df_name_queue = storage.read_table('name_queue') if storage.has_table('name_queue') else pd.DataFrame(columns=NAME_QUEUE_COLUMNS)
+    unavailable_chat_ids = df_name_queue.loc[df_name_queue['status'] == 'unavailable', 'chat_id']
+    for min_edge_weight_threshold, min_in_degree_threshold in thresholds:
+        G = graph_from_edge_weights(
+            df_weights,
+            df_scanned_log,
+            df_chats,
+            df_nodes,
+            min_edge_weight_threshold,
+            min_in_degree_threshold,
+            unavailable_chat_ids
+        )
+        queue_unresolved_chats(storage, pd.Index(list(G.nodes)).difference(df_chats['id']))
+        yield min_edge_weight_threshold, min_in_degree_threshold, G
+
+
+def graph_name(min_edge_weight_threshold=0, min_in_degree_threshold=0):
+    """Name of the graph file of build_graph for the thresholds."""
     nodes_string = f"nodes_restricted_with_{min_in_degree_threshold}" if min_in_degree_threshold > 0 else "nodes_complete"
     edges_string = f"edges_restricted_with_{min_edge_weight_threshold}" if min_edge_weight_threshold > 0 else "edges_complete"
-    pickle.dump(G, open(f"data/network/graphs/{nodes_string}_{edges_string}.p", "wb"))
+    return f"{nodes_string}_{edges_string}"
+
+
+@metrics.timed('store_graph')
+def store_graph(G, min_edge_weight_threshold=0, min_in_degree_threshold=0):
+    """Store the graph in the compact format of CompactGraph in data/network/graphs/<graph name>."""
+    CompactGraph.from_networkx(G).save(graph_path(graph_name(min_edge_weight_threshold, min_in_degree_threshold)))
+
+
+def graph_path(graph_name):
+    return 'data/network/graphs/' + graph_name
+
+
+def load_compact_graph(graph_name, mmap=True):
+    """
+    Load a stored graph as CompactGraph. Graphs stored as pickle files by earlier versions are converted and stored in the compact format.
+    Returns None if the graph does not exist.
+    """
+    if os.path.isdir(graph_path(graph_name)):
+        return CompactGraph.load(graph_path(graph_name), mmap)
+    if os.path.isfile(graph_path(graph_name) + '.p'):
+        compact_graph = CompactGraph.from_networkx(pickle.load(open(graph_path(graph_name) + '.p', 'rb')))
+        compact_graph.save(graph_path(graph_name))
+        return compact_graph
+    return None
+
+
+def load_graph(graph_name):
+    """Load a stored graph as networkx graph. Returns None if the graph does not exist."""
+    compact_graph = load_compact_graph(graph_name)
+    return compact_graph.to_networkx() if compact_graph is not None else None
+
+
+def load_edge_weights(storage):
+    """
+    Return the aggregated edge weights (see aggregate_edge_weights). They are cached in data/network/edge_weights.p together with
+    the version of the stored edges and only recomputed when edges were added or removed since.
+    """
+    cache_key = {'format': EDGE_WEIGHTS_CACHE_FORMAT, 'storage': type(storage).__name__, 'edges_version': storage.rows_version('edges')}
+    if os.path.isfile(EDGE_WEIGHTS_CACHE_PATH):
+        with open(EDGE_WEIGHTS_CACHE_PATH, 'rb') as file:
+            cache = pickle.load(file)
+        if cache['key'] == cache_key:
+            metrics.count('cache_lookups_total', cache='edge_weights', result='hit')
+            return cache['edge_weights']
+    metrics.count('cache_lookups_total', cache='edge_weights', result='miss')
+    df_weights = aggregate_edge_weights(storage)
+    if not os.path.exists(os.path.dirname(EDGE_WEIGHTS_CACHE_PATH)):
+        os.makedirs(os.path.dirname(EDGE_WEIGHTS_CACHE_PATH))
+    with open(EDGE_WEIGHTS_CACHE_PATH, 'wb') as file:
+        pickle.dump({'key': cache_key, 'edge_weights': df_weights}, file)
+    return df_weights
+
+
+@metrics.timed('aggregate_edge_weights')
+def aggregate_edge_weights(storage):
+    """
+    Load the edges of all chats at once and count the forwards from one chat to another.
+    Returns a DataFrame with the columns chat_id (the chat the messages were forwarded to), forwarded_from and weight.
+    """
+    df_edges = storage.read_all_rows('edges', columns=['forwarded_from'])
+    df_weights = df_edges.groupby(['chat_id', 'forwarded_from'], sort=False).size().reset_index(name='weight')
+    return df_weights.astype({'chat_id': 'int64', 'forwarded_from': 'int64', 'weight': 'int64'})
+
+
+@metrics.timed('graph_from_edge_weights')
+def graph_from_edge_weights(df_weights, df_scanned_log, df_chats, df_nodes, min_edge_weight_threshold=0, min_in_degree_threshold=0, unavailable_chat_ids=()):
+    """
+    Build the networkx graph from the aggregated edge weights (see aggregate_edge_weights) and the scanned_log, chats and nodes tables.
+    Chats without a name in the chats table are labelled with placeholder_label. See build_graph for the thresholds.
+
+    unavailable_chat_ids - Ids of chats forwarded from that are left out, because they are private or forbidden
+    """
+    G = nx.DiGraph()
+    chat_names = df_chats.drop_duplicates('id').set_index('id')['name']
+    in_degrees = df_nodes.drop_duplicates('chat_id').set_index('chat_id')['in_degree']
+    scanned_chat_ids = pd.Index(df_scanned_log['chat_id'].unique())
+    # All scanned chats are nodes, labelled with their name
+    G.add_nodes_from((chat_id, {'label': label(chat_id, name)}) for chat_id, name in zip(scanned_chat_ids, chat_names.reindex(scanned_chat_ids)))
+
+    # Only add nodes and edges that exceed the defined thresholds
+    df_weights = df_weights[df_weights['chat_id'].isin(scanned_chat_ids)]
+    df_weights = df_weights[
+        (df_weights['weight'] >= min_edge_weight_threshold) &
+        (df_weights['forwarded_from'].map(in_degrees) >= min_in_degree_threshold) &
+        ~df_weights['forwarded_from'].isin(unavailable_chat_ids)
+    ]
+
+    # Add the chats forwarded from that are not nodes yet
+    new_chat_ids = pd.Index(df_weights['forwarded_from'].unique()).difference(scanned_chat_ids)
+    G.add_nodes_from((chat_id, {'label': label(chat_id, name)}) for chat_id, name in zip(new_chat_ids, chat_names.reindex(new_chat_ids)))
+    G.add_weighted_edges_from(zip(df_weights['chat_id'], df_weights['forwarded_from'], df_weights['weight']), weight='value')
+    return G
+
+
+def label(chat_id, name):
+    return placeholder_label(chat_id) if pd.isna(name) else name
+
+
+def placeholder_label(chat_id):
+    """Label of chats whose name is not known yet."""
+    return str(chat_id)
+
+
+def queue_unresolved_chats(storage, chat_ids):
+    """Add the chats to the name queue, so that their names are fetched by network_crawler.resolve_queued_chat_names."""
+    if len(chat_ids) > 0:
+        logging.info(str(len(chat_ids)) + ' chats in the graph have no name yet')
+        storage.insert_missing_rows('name_queue', pd.DataFrame({'chat_id': chat_ids, 'status': 'pending'}, columns=NAME_QUEUE_COLUMNS))
+        storage.flush()
+
+
+def get_ranking(graph_name, measure='in_degree', k=None, **settings):
+    """
+    Rank the chats of a stored graph by one of the measures of ranking.MEASURES. Returns a DataFrame with the columns id, label
+    and score of the k chats with the highest scores, highest score first.
+
+    Args:
+        graph_name - Name of the graph, e.g. nodes_complete_edges_complete
+        measure - in_degree, in_degree_centrality, in_strength, pagerank, authorities or hubs
+        k - Number of chats, all if None
+        settings - Passed to ranking.pagerank or ranking.hits, e.g. alpha=0.9
+    """
+    graph = load_compact_graph(graph_name)
+    if graph is None:
+        raise FileNotFoundError('Graph ' + graph_name + ' not found. You may need to run build_graph() first.')
+    scores = ranking.cached_scores(graph, graph_path(graph_name), measure, **settings)
+    positions = ranking.top_k(scores, k)
+    return pd.DataFrame({'id': graph.node_ids[positions], 'label': graph.labels[positions], 'score': scores[positions]})
 
 
-def get_degree_ranking(graph_name):
-    graph = pickle.load(open('data/network/graphs/'+graph_name+'.p', 'rb'))
-    return sorted(in_degree_centrality(graph).items(), key=lambda item: item[1], reverse=True)
+def get_degree_ranking(graph_name, k=None):
+    df_ranking = get_ranking(graph_name, 'in_degree_centrality', k)
+    return list(zip(df_ranking['id'].tolist(), df_ranking['score'].tolist()))
 
 
-def get_top_k_degree_chats(graph_name, k):
-    degree_ranking = get_degree_ranking(graph_name)
-    top_k = degree_ranking[:k]
-    df_top_k = pd.DataFrame(top_k, columns=['id', 'centrality'])
-    df_chats = pd.read_csv('data/chats.csv')
+def get_top_k_degree_chats(graph_name, k, measure='in_degree_centrality', **settings):
+    df_top_k = get_ranking(graph_name, measure, k, **settings)[['id', 'score']].rename(columns={'score': 'centrality'})
+    df_chats = get_storage().read_table('chats', keys=df_top_k['id'].tolist())
     df_top_k = df_top_k.set_index('id').join(df_chats.set_index('id'))
     return df_top_k
 
 
 if __name__ == "__main__":
     build_graph(min_edge_weight_threshold=2, min_in_degree_threshold=2)
+    # build_graphs([(0, 0), (2, 2), (5, 5)])
     # df_top_k = get_top_k_degree_chats("full_graph", 20)
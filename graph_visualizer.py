@@ -1,14 +1,50 @@
+import json
 import os
 import pickle
-from pyvis.network import Network
+import networkx as nx
+import numpy as np
+import ranking
+from graph_builder import graph_path, load_compact_graph, load_graph
+from storage import fingerprint
+
+# Cache of the computed layouts. Increase the format version when the layout algorithm or the cached data changes.
+LAYOUT_CACHE_DIRECTORY = 'data/network/layouts'
+LAYOUT_CACHE_FORMAT = 1
+EXPORT_FORMATS = ['html', 'gexf']
+
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<script src="https://unpkg.com/vis-network@9.1.9/standalone/umd/vis-network.min.js"></script>
+<style>html, body, #network {{ width: 100%; height: 100%; margin: 0; }}</style>
+</head>
+<body>
+<div id="network"></div>
+<script>
+var nodes = new vis.DataSet({nodes});
+var edges = new vis.DataSet({edges});
+var options = {{
+    physics: false,
+    layout: {{improvedLayout: false}},
+    interaction: {{hideEdgesOnDrag: true, tooltipDelay: 100}},
+    nodes: {{shape: 'dot', scaling: {{min: 5, max: 50}}}},
+    edges: {{arrows: 'to', color: {{opacity: 0.3}}, smooth: false, scaling: {{min: 1, max: 10}}}}
+}};
+new vis.Network(document.getElementById('network'), {{nodes: nodes, edges: edges}}, options);
+</script>
+</body>
+</html>
+"""
 
 
 def show_graph(graph_name):
-    file_path = 'data/network/graphs/'+graph_name+'.p'
-    if not os.path.isfile(file_path):
+    from pyvis.network import Network
+    graph = load_graph(graph_name)
+    if graph is None:
         print("Graph not found. You may need to run build_graph() first.")
         return
-    graph = pickle.load(open(file_path, 'rb'))
     # Set network graph parameters
     nt = Network('900', '1300', directed=True)
     nt.barnes_hut()
@@ -18,5 +54,159 @@ def show_graph(graph_name):
     nt.show(graph_name+'.html')
 
 
+def reduce_graph(graph_name, k=1000, min_edge_weight=1, measure='in_degree'):
+    """
+    Level of detail of a stored graph for rendering: the k chats with the highest scores and the edges between them with a
+    weight of at least min_edge_weight. Returns a networkx graph whose nodes have the attributes label, score and size (the
+    number of chats a node stands for), or None if the graph does not exist.
+
+    Args:
+        graph_name - Name of the stored graph
+        k - Number of chats to keep, all if None
+        min_edge_weight - Minimum number of forwards of the edges to keep
+        measure - Measure of ranking.MEASURES by which the chats are selected
+    """
+    graph = load_compact_graph(graph_name)
+    if graph is None:
+        return None
+    scores = ranking.cached_scores(graph, graph_path(graph_name), measure)
+    positions = ranking.top_k(scores, k)
+    keep = np.zeros(graph.number_of_nodes(), dtype=bool)
+    keep[positions] = True
+    sources = np.repeat(np.arange(graph.number_of_nodes()), graph.out_degree())
+    edges = keep[sources] & keep[graph.indices] & (graph.weights >= min_edge_weight)
+    G = nx.DiGraph()
+    G.add_nodes_from(
+        (node_id, {'label': label, 'score': float(score), 'size': 1})
+        for node_id, label, score in zip(graph.node_ids[positions].tolist(), graph.labels[positions].tolist(), scores[positions].tolist())
+    )
+    G.add_weighted_edges_from(zip(
+        graph.node_ids[sources[edges]].tolist(), graph.node_ids[graph.indices[edges]].tolist(), graph.weights[edges].tolist()
+    ), weight='value')
+    return G
+
+
+def collapse_communities(G):
+    """
+    Replace the communities of the graph (Louvain communities of the undirected graph) by one node each, named and labelled
+    after the member with the highest score. The edges between communities are merged, summing up their weights.
+    """
+    if hasattr(nx.community, 'louvain_communities'):
+        communities = nx.community.louvain_communities(G.to_undirected(), weight='value', seed=0)
+    else:
+        # networkx before 2.8
+        communities = nx.community.greedy_modularity_communities(G.to_undirected(), weight='value')
+    community_of = {}
+    H = nx.DiGraph()
+    for community in communities:
+        members = sorted(community, key=lambda node_id: G.nodes[node_id]['score'], reverse=True)
+        top_member = members[0]
+        for node_id in members:
+            community_of[node_id] = top_member
+        label = G.nodes[top_member]['label'] + (f' (+{len(members) - 1})' if len(members) > 1 else '')
+        H.add_node(top_member, label=label, score=sum(G.nodes[node_id]['score'] for node_id in members), size=sum(G.nodes[node_id]['size'] for node_id in members))
+    for source, target, weight in G.edges(data='value'):
+        source, target = community_of[source], community_of[target]
+        if source != target:
+            H.add_edge(source, target, value=H.edges[source, target]['value'] + weight if H.has_edge(source, target) else weight)
+    return H
+
+
+def compute_layout(G, max_iter=100):
+    """
+    Positions of the nodes computed with ForceAtlas2, scaled to the size of the graph. networkx versions before 3.5 have no
+    ForceAtlas2 layout, the spring layout is used instead.
+    """
+    if G.number_of_nodes() == 0:
+        return {}
+    if hasattr(nx, 'forceatlas2_layout'):
+        node_size = {node_id: np.sqrt(size) for node_id, size in G.nodes(data='size')}
+        positions = nx.forceatlas2_layout(G, max_iter=max_iter, node_size=node_size, seed=0)
+    else:
+        positions = nx.spring_layout(G, iterations=max_iter, weight='value', seed=0)
+    coordinates = np.array([positions[node_id] for node_id in G.nodes])
+    coordinates -= coordinates.mean(axis=0)
+    scale = 50 * np.sqrt(G.number_of_nodes()) / max(np.abs(coordinates).max(), 1e-9)
+    return {node_id: (float(x), float(y)) for node_id, (x, y) in zip(G.nodes, coordinates * scale)}
+
+
+def load_layout(G, graph_name, settings):
+    """
+    Return the layout of G, the reduced graph graph_name. Layouts are cached in data/network/layouts per graph and settings of the
+    reduction and only computed again when the graph was built again.
+    """
+    cache_path = os.path.join(LAYOUT_CACHE_DIRECTORY, graph_name + '_' + fingerprint(settings)[:12] + '.p')
+    cache_key = {'format': LAYOUT_CACHE_FORMAT, 'settings': settings, 'forceatlas2': hasattr(nx, 'forceatlas2_layout'), 'graph_time': os.path.getmtime(os.path.join(graph_path(graph_name), 'indptr.npy'))}
+    if os.path.isfile(cache_path):
+        with open(cache_path, 'rb') as file:
+            cache = pickle.load(file)
+        if cache['key'] == cache_key:
+            return cache['positions']
+    positions = compute_layout(G)
+    if not os.path.exists(LAYOUT_CACHE_DIRECTORY):
+        os.makedirs(LAYOUT_CACHE_DIRECTORY)
+    with open(cache_path, 'wb') as file:
+        pickle.dump({'key': cache_key, 'positions': positions}, file)
+    return positions
+
+
+def write_html(G, positions, file_path, title):
+    """Write a static HTML page drawing the graph with vis-network at the given positions, without physics simulation."""
+    nodes = [
+        {'id': node_id, 'label': data['label'], 'x': positions[node_id][0], 'y': positions[node_id][1], 'value': data['score'],
+         'title': f"{data['label']}\nScore: {data['score']:g}" + (f"\nChats: {data['size']}" if data['size'] > 1 else '')}
+        for node_id, data in G.nodes(data=True)
+    ]
+    edges = [{'from': source, 'to': target, 'value': weight, 'title': str(weight)} for source, target, weight in G.edges(data='value')]
+    # Escape </script> in chat names
+    with open(file_path, 'w', encoding='utf-8') as file:
+        file.write(HTML_TEMPLATE.format(
+            title=title,
+            nodes=json.dumps(nodes, ensure_ascii=False).replace('</', '<\\/'),
+            edges=json.dumps(edges).replace('</', '<\\/')
+        ))
+
+
+def write_gexf(G, positions, file_path):
+    """Write the graph with positions and sizes as GEXF file, e.g. for Gephi."""
+    H = G.copy()
+    for node_id, data in H.nodes(data=True):
+        data['viz'] = {'position': {'x': positions[node_id][0], 'y': positions[node_id][1], 'z': 0.0}, 'size': float(np.sqrt(data['size']))}
+    nx.write_gexf(H, file_path)
+
+
+def export_graph(graph_name, file_format='html', file_path=None, k=1000, min_edge_weight=1, measure='in_degree', communities=False):
+    """
+    Export a reduced version of a stored graph with a precomputed layout as static HTML page or GEXF file. Unlike show_graph,
+    no physics simulation runs in the browser, so large crawls can be rendered quickly.
+
+    Args:
+        graph_name - Name of the stored graph
+        file_format - html or gexf
+        file_path - Path of the exported file, graph_name with the extension of the format by default
+        k - Number of chats with the highest scores to keep, all if None
+        min_edge_weight - Minimum number of forwards of the edges to keep
+        measure - Measure of ranking.MEASURES by which the chats are selected and sized
+        communities - If True, each community is collapsed into one node
+    """
+    if file_format not in EXPORT_FORMATS:
+        print('Unknown format ' + file_format + ', use one of ' + ', '.join(EXPORT_FORMATS))
+        return
+    G = reduce_graph(graph_name, k, min_edge_weight, measure)
+    if G is None:
+        print("Graph not found. You may need to run build_graph() first.")
+        return
+    if communities:
+        G = collapse_communities(G)
+    positions = load_layout(G, graph_name, {'k': k, 'min_edge_weight': min_edge_weight, 'measure': measure, 'communities': communities})
+    file_path = file_path or graph_name + '.' + file_format
+    if file_format == 'html':
+        write_html(G, positions, file_path, graph_name)
+    else:
+        write_gexf(G, positions, file_path)
+    return file_path
+
+
 if __name__ == "__main__":
     show_graph(graph_name='nodes_restricted_with_3_edges_restricted_with_5')
+    # export_graph('nodes_complete_edges_complete', k=2000, min_edge_weight=2)
@@ -0,0 +1,195 @@
+import bisect
+import json
+import os
+import time
+from functools import wraps
+
+# Upper bounds in seconds of the buckets of the timer histograms
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+# Prefix of the metric names in the Prometheus format
+PROMETHEUS_PREFIX = 'telegram_crawler_'
+
+
+class _NullTimer:
+    """Timer used while metrics are disabled, it does nothing."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class _Timer:
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Metrics:
+    """
+    Counters and timers of the crawler, e.g. the time spent per stage (scan_chat, storing the results, build_graph) and per API
+    method, the requests that failed, cache lookups and rows written. Metrics are disabled by default and then cost one attribute
+    lookup per measurement. Enable them with enable() or by setting the environment variable CRAWLER_METRICS=1.
+
+    Timers are histograms with the buckets DEFAULT_BUCKETS. All metrics can be labelled, e.g. metrics.count('rows_written_total',
+    len(rows), table='edges'). The metrics are exported as JSON (to_json, dump_json) or in the Prometheus text format (to_prometheus).
+    """
+    def __init__(self, enabled=False, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self.reset()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self._counters = {}
+        self._timers = {}
+        self._started = time.time()
+        self._bytes_written_at_start = bytes_written()
+
+    def count(self, name, value=1, **labels):
+        """Add value to the counter with the given name and labels."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        """Record a duration in the timer with the given name and labels."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        timer = self._timers.get(key)
+        if timer is None:
+            timer = self._timers[key] = {'count': 0, 'sum': 0.0, 'max': 0.0, 'buckets': [0] * (len(self.buckets) + 1)}
+        timer['count'] += 1
+        timer['sum'] += seconds
+        timer['max'] = max(timer['max'], seconds)
+        timer['buckets'][bisect.bisect_left(self.buckets, seconds)] += 1
+
+    def timer(self, name, **labels):
+        """Context manager measuring the time of the with block: with metrics.timer('stage_seconds', stage='add_edges'): ..."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def timed(self, stage):
+        """Decorator measuring every call of the function in the timer stage_seconds with the label stage."""
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with _Timer(self, 'stage_seconds', {'stage': stage}):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def cache_hit_ratios(self):
+        """Fraction of the lookups per cache that were hits, from the counter cache_lookups_total."""
+        lookups = {}
+        for (name, labels), value in self._counters.items():
+            if name == 'cache_lookups_total':
+                labels = dict(labels)
+                hits_and_total = lookups.setdefault(labels['cache'], [0, 0])
+                hits_and_total[0] += value if labels['result'] == 'hit' else 0
+                hits_and_total[1] += value
+        return {cache: hits / total for cache, (hits, total) in lookups.items() if total}
+
+    def _gauges(self):
+        gauges = [('cache_hit_ratio', {'cache': cache}, ratio) for cache, ratio in self.cache_hit_ratios().items()]
+        gauges.append(('uptime_seconds', {}, time.time() - self._started))
+        written = bytes_written()
+        if written is not None and self._bytes_written_at_start is not None:
+            gauges.append(('process_bytes_written', {}, written - self._bytes_written_at_start))
+        return gauges
+
+    def to_dict(self):
+        return {
+            'counters': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in self._counters.items()],
+            'timers': [
+                {'name': name, 'labels': dict(labels), 'count': timer['count'], 'sum': timer['sum'], 'max': timer['max'],
+                 'buckets': dict(zip([str(bound) for bound in self.buckets] + ['+Inf'], timer['buckets']))}
+                for (name, labels), timer in self._timers.items()
+            ],
+            'gauges': [{'name': name, 'labels': labels, 'value': value} for name, labels, value in self._gauges()]
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=4)
+
+    def dump_json(self, file_path='data/metrics.json'):
+        directory = os.path.dirname(file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(file_path, 'w') as file:
+            file.write(self.to_json())
+
+    def to_prometheus(self):
+        """Return the metrics in the Prometheus text exposition format, e.g. to be served by a web server or a textfile collector."""
+        lines = []
+        declared = set()
+
+        def declare(name, type):
+            if name not in declared:
+                lines.append(f'# TYPE {PROMETHEUS_PREFIX}{name} {type}')
+                declared.add(name)
+
+        for (name, labels), value in sorted(self._counters.items()):
+            declare(name, 'counter')
+            lines.append(f'{PROMETHEUS_PREFIX}{name}{format_labels(labels)} {value}')
+        for (name, labels), timer in sorted(self._timers.items()):
+            declare(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip([str(bound) for bound in self.buckets] + ['+Inf'], timer['buckets']):
+                cumulative += bucket_count
+                lines.append(f'{PROMETHEUS_PREFIX}{name}_bucket{format_labels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{PROMETHEUS_PREFIX}{name}_sum{format_labels(labels)} {timer["sum"]}')
+            lines.append(f'{PROMETHEUS_PREFIX}{name}_count{format_labels(labels)} {timer["count"]}')
+        for name, labels, value in self._gauges():
+            declare(name, 'gauge')
+            lines.append(f'{PROMETHEUS_PREFIX}{name}{format_labels(tuple(sorted(labels.items())))} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def print_summary(self):
+        """Print the total and mean time per timer, slowest first, as well as the counters and cache hit ratios."""
+        for (name, labels), timer in sorted(self._timers.items(), key=lambda item: item[1]['sum'], reverse=True):
+            print(f"{name}{format_labels(labels)}: {timer['sum']:.3f}s in {timer['count']} calls, mean {1000 * timer['sum'] / timer['count']:.2f}ms, max {1000 * timer['max']:.2f}ms")
+        for (name, labels), value in sorted(self._counters.items()):
+            print(f'{name}{format_labels(labels)}: {value}')
+        for cache, ratio in self.cache_hit_ratios().items():
+            print(f'{cache} cache hit ratio: {ratio:.1%}')
+
+
+def format_labels(labels):
+    """Format labels (a tuple of (name, value) pairs) like Prometheus: {name="value",...}"""
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{str(value)}"' for name, value in labels) + '}'
+
+def bytes_written():
+    """Bytes written by this process according to /proc/self/io, None if it is not available (e.g. not on Linux)."""
+    try:
+        with open('/proc/self/io') as file:
+            counters = dict(line.split(': ') for line in file.read().splitlines())
+    except OSError:
+        return None
+    return int(counters['wchar'])
+
+
+_NULL_TIMER = _NullTimer()
+# Metrics of the crawler, shared by all modules
+metrics = Metrics(enabled=os.environ.get('CRAWLER_METRICS', '').lower() in ('1', 'true', 'yes'))
@@ -3,16 +3,26 @@ import logging
 import os
 import pandas as pd
 import shutil
-from data_model import CHATS_COLUMNS, SCANNED_COLUMNS, NODES_COLUMNS, EDGES_COLUMNS, MESSAGES_COLUMNS
-from telegram import SyncTelegramClient
-from telethon.errors.rpcerrorlist import ChannelPrivateError
+from data_model import CHATS_COLUMNS, SCANNED_COLUMNS, NODES_COLUMNS, EDGES_COLUMNS, NAME_QUEUE_COLUMNS, MessageRecord
+from edge_index import EdgeIndex
+from frontier import CrawlFrontier
+from metrics import metrics
+from storage import MessageWriter, get_storage
+from telegram import OfflineError, SyncTelegramClient, TRANSIENT_ERRORS
+from telethon.errors.rpcerrorlist import ChannelPrivateError, FloodWaitError
 import traceback
 from tqdm import tqdm
 
 from chat_lists import misinformation_channel_usernames, misinformation_channel_ids
 
-# Initialize telegram client
+# Initialize telegram client. It is shared by graph_builder and chat_analyzer, use it as a context manager
+# (with telethon_api: ...) to keep one connection open for a whole crawl instead of reconnecting for every request.
+# config.json is only read when the client is first used, so modules that only analyze local data import quickly.
 telethon_api = SyncTelegramClient()
+# Buffered writer for the messages, see storage.py for the storage backends
+message_writer = MessageWriter()
+# Index of the stored edges, which keeps the in-degrees of the nodes correct when forwards are stored again
+edge_index = EdgeIndex()
 # Configure logging
 logging.basicConfig(filename='log.log', level=logging.DEBUG)
 
@@ -23,62 +33,77 @@ def initialize_data():
     if input("Are you sure you want to initialize the data? All previously collected data will be lost. Please enter (y/n)") != "y":
         exit()
     initialize_network()
-    # Create messages directory if it does not exist
-    if not os.path.exists('data/messages'):
-        os.makedirs('data/messages')
-    # Initialize csv files for storing Pandas dataframes
+    storage = get_storage()
+    storage.clear_rows('messages')
+    # Initialize the table for storing Pandas dataframes
     df_chats = pd.DataFrame(columns=CHATS_COLUMNS)
-    df_chats.to_csv('data/chats.csv', index=False)
+    storage.write_table('chats', df_chats)
+    storage.flush()
     print('Initialized data')
 
 def initialize_network():
     """Initialize the network csv files. Data which was previously collected is lost."""
     if input("Are you sure you want to initialize the network? All previously collected network data will be lost. Please enter (y/n)") != "y":
         exit()
-    # If the edges directory is not empty, i. e. contains old data, delete it
-    if os.path.exists('data/network/edges') and not len(os.listdir('data/network/edges')) == 0:
-        shutil.rmtree('data/network/edges')
+    storage = get_storage()
+    # Delete old edges
+    storage.clear_rows('edges')
+    edge_index.clear()
     # If the graphs directory is not empty, i. e. contains old data, delete it
     if os.path.exists('data/network/graphs') and not len(os.listdir('data/network/graphs')) == 0:
         shutil.rmtree('data/network/graphs')
-    # Create edges directory if it does not exist
-    if not os.path.exists('data/network/edges'):
-        os.makedirs('data/network/edges')
     # Create graphs directory if it does not exist
     if not os.path.exists('data/network/graphs'):
         os.makedirs('data/network/graphs')
-    # Initialize csv files for storing Pandas dataframes
+    # Initialize the tables for storing Pandas dataframes
     df_scanned = pd.DataFrame(columns=SCANNED_COLUMNS)
-    df_scanned.to_csv('data/network/scanned_log.csv', index=False)
+    storage.write_table('scanned_log', df_scanned)
     df_nodes = pd.DataFrame(columns=NODES_COLUMNS)
-    df_nodes.to_csv('data/network/nodes.csv', index=False)
+    storage.write_table('nodes', df_nodes)
+    storage.flush()
     print('Initialized network')
 
+def rebuild_in_degrees():
+    """
+    Recompute the in-degrees of all nodes from the stored edges, as the number of distinct chats that forwarded from them. Earlier
+    versions counted every forwarded message and counted messages again when they were stored again, so call this once for networks
+    crawled with them. Afterwards the in-degrees are kept up to date by add_edges.
+    """
+    storage = get_storage()
+    df_edges = storage.read_all_rows('edges', columns=['forwarded_from'])
+    in_degrees = df_edges.drop_duplicates(['chat_id', 'forwarded_from'])['forwarded_from'].value_counts()
+    df_nodes = storage.read_table('nodes')
+    df_nodes['in_degree'] = df_nodes['chat_id'].map(in_degrees).fillna(0).astype('int64')
+    storage.write_table('nodes', df_nodes)
+    storage.flush()
+    edge_index.clear()
+    print('Recomputed the in-degrees of', len(df_nodes), 'nodes')
+
+@metrics.timed('add_chats_by_id')
 def add_chats_by_id(chats):
     """
-    Adds chats from the given list of ids to chats.csv.
+    Adds chats from the given list of ids to chats.csv. The metadata of up to 100 chats is fetched with a single request.
 
     chats - A list of chat ids
     """
-    df_chats = pd.read_csv('data/chats.csv')
-    stored_chat_ids = list(df_chats.iloc[:,0])
+    if any(type(chat_id) != int for chat_id in chats):
+        raise TypeError('The list should contain ids as integers')
+    df_chats = get_storage().read_table('chats', columns=['id'], keys=chats)
+    stored_chat_ids = set(df_chats.iloc[:,0])
     chat_ids = [chat_id for chat_id in chats if chat_id not in stored_chat_ids]
-    for chat_id in chat_ids:
-        if type(chat_id) != int:
-            raise TypeError('The list should contain ids as integers')
-        chat_metadata = None
-        try:
-            chat_metadata = telethon_api.get_chat_metadata(chat_id)
-        except ValueError:
-            print('ValueError in chat ' + str(chat_id) + '. This probably means that the chat is not known by its id yet. You need to first retrieve it in some other way. If you know the username, use add_chat_by_username instead. See https://docs.telethon.dev/en/latest/concepts/entities.html#summary for more information.')
-            df_chats.to_csv('data/chats.csv', index=False)
-            return
-        except ChannelPrivateError:
-            print('The chat', chat_id, 'could not be added to chats.csv because it is private.')
-            continue
-        df_chats.loc[len(df_chats.index)] = [chat_id, chat_metadata['title'], chat_metadata['username'], chat_metadata['type'], chat_metadata['can_comment']]
-        stored_chat_ids.append(chat_id)
-    df_chats.to_csv('data/chats.csv', index=False)
+    add_chats(telethon_api.get_chats_metadata(chat_ids))
+
+@metrics.timed('add_chats')
+def add_chats(chats_metadata):
+    """
+    Adds chats whose metadata was already fetched (see SyncTelegramClient.get_chat_metadata) to chats.csv. Chats that are already stored are skipped.
+
+    chats_metadata - A list of chat metadata dictionaries
+    """
+    rows = [[chat_metadata['id'], chat_metadata['title'], chat_metadata['username'], chat_metadata['type'], chat_metadata['can_comment']] for chat_metadata in chats_metadata]
+    if rows:
+        get_storage().insert_missing_rows('chats', pd.DataFrame(rows, columns=CHATS_COLUMNS))
+        metrics.count('rows_written_total', len(rows), table='chats')
 
 def add_chats_by_username(chats):
     """
@@ -86,33 +111,54 @@ def add_chats_by_username(chats):
 
     chats - A list of chat usernames
     """
-    if os.path.isfile('data/chats.csv'):
-        df_chats = pd.read_csv('data/chats.csv')
-    else:
-        df_chats = pd.DataFrame(columns=CHATS_COLUMNS)
-    already_stored_ids = list(df_chats.iloc[:,0])
-    already_stored_usernames = [username.lower() for username in list(df_chats.dropna().iloc[:,2])]
-    chat_usernames = [username for username in chats if username.lower() not in already_stored_usernames]
-    for chat_username in tqdm(chat_usernames):
-        if type(chat_username) != str:
-            raise TypeError('The list should contain usernames as strings')
-        try:
-            # TODO: Check if chat is already stored before using api
-            chat_metadata = telethon_api.get_chat_metadata(chat_username)
-        except ValueError as error:
-            print('The chat', chat_username, 'was not added because:', error)
-            continue
-        except ChannelPrivateError:
-            print('The chat', chat_username, 'could not be added to chats.csv because it is private.')
-            continue
-        except Exception as error:
-            print('The chat', chat_username, 'could not be added to chats.csv due to an error:')
-            print(error)
-            continue
-        chat_id = chat_metadata['id']
-        if chat_id not in already_stored_ids:
-            df_chats.loc[len(df_chats.index)] = [chat_id, chat_metadata['title'], chat_metadata['username'], chat_metadata['type'], chat_metadata['can_comment']]
-    df_chats.to_csv('data/chats.csv', index=False)
+    add_chats(telethon_api.get_chats_metadata(usernames_not_stored(chats)))
+    get_storage().flush()
+
+def resolve_queued_chat_names():
+    """
+    Fetch the metadata of the chats in the name queue (data/network/name_queue.csv), which build_graph fills with chats that are
+    missing in chats.csv, and add them to chats.csv. Up to 100 chats are resolved with one request and lookups are cached.
+    Chats that are private or forbidden are marked as unavailable and left out of graphs. Chats that could not be resolved for
+    other reasons, e.g. because their id is not known to the account yet, stay pending and are tried again on the next call.
+    """
+    storage = get_storage()
+    if not storage.has_table('name_queue'):
+        print('No chat names to resolve')
+        return
+    df_name_queue = storage.read_table('name_queue')
+    pending_chat_ids = [int(chat_id) for chat_id in df_name_queue.loc[df_name_queue['status'] == 'pending', 'chat_id']]
+    chats_metadata = telethon_api.get_chats_metadata(pending_chat_ids)
+    resolved_chat_ids = set(chat_metadata['id'] for chat_metadata in chats_metadata)
+    with storage.transaction():
+        add_chats(chats_metadata)
+        storage.upsert_rows('name_queue', pd.DataFrame(
+            {'chat_id': pending_chat_ids, 'status': [name_queue_status(chat_id, resolved_chat_ids) for chat_id in pending_chat_ids]},
+            columns=NAME_QUEUE_COLUMNS
+        ))
+    storage.flush()
+    print('Resolved', len(resolved_chat_ids), 'of', len(pending_chat_ids), 'chat names')
+
+def name_queue_status(chat_id, resolved_chat_ids):
+    """Status of a chat in the name queue after resolving it: resolved, unavailable if it is private or forbidden, else still pending."""
+    if chat_id in resolved_chat_ids:
+        return 'resolved'
+    if telethon_api.is_known_private(chat_id):
+        return 'unavailable'
+    return 'pending'
+
+def usernames_not_stored(chats):
+    """
+    Returns the usernames in the list whose chats are not stored in chats.csv yet.
+
+    chats - A list of chat usernames
+    """
+    if any(type(chat_username) != str for chat_username in chats):
+        raise TypeError('The list should contain usernames as strings')
+    storage = get_storage()
+    if not storage.has_table('chats'):
+        return list(chats)
+    already_stored_usernames = set(storage.read_table('chats', columns=['username'])['username'].dropna().str.lower())
+    return [username for username in chats if username.lower() not in already_stored_usernames]
 
 def usernames_to_ids(usernames):
     """
@@ -120,11 +166,11 @@ def usernames_to_ids(usernames):
 
     usernames - The list of usernames that is transformed. Usernames are not case-sensitive.
     """
-    if not os.path.isfile('data/chats.csv'):
+    if not get_storage().has_table('chats'):
         print('chats.csv does not exist yet. You need to call initialize_data first.')
         return None
     # Read chat.csv, drop rows with missing values
-    df_chats = pd.read_csv('data/chats.csv').dropna()
+    df_chats = get_storage().read_table('chats').dropna()
     # Transform username column to lower case, so that differences in upper/lower case between usernames list and stored usernames do not matter.
     df_chats['username'] = df_chats['username'].str.lower()
     df_chats = df_chats.set_index('username')
@@ -145,20 +191,19 @@ def set_network_seed(seed):
 
     seed - List of ids of the chats that are set as the initial nodes of the network
     """
-    df_chats = pd.read_csv('data/chats.csv').set_index('id')
-    df_nodes = pd.read_csv('data/network/nodes.csv')
+    storage = get_storage()
+    df_chats = storage.read_table('chats').set_index('id')
+    df_nodes = storage.read_table('nodes')
     if not df_nodes.empty:
         print('There is still old network data. You must call initialize_network() before setting a new network seed.')
         exit()
     for chat_id in seed:
-        chat = None
-        if chat_id in df_chats.index:
-            chat = df_chats.loc[chat_id]
-        else:
+        if chat_id not in df_chats.index:
             print('The chat with id', chat_id, 'does not exist in chats.csv. You need to add it first.')
             exit()
-        df_nodes.loc[len(df_nodes.index)] = [chat_id, chat['name'], 1, 0]
-    df_nodes.to_csv('data/network/nodes.csv', index=False)
+    df_nodes = pd.DataFrame({'chat_id': seed, 'chat_name': df_chats.loc[seed, 'name'].values, 'in_seed': 1, 'in_degree': 0}, columns=NODES_COLUMNS)
+    storage.write_table('nodes', df_nodes)
+    storage.flush()
     print('Network seed set')
 
 def set_network_seed_by_usernames(seed):
@@ -171,129 +216,266 @@ def set_network_seed_by_usernames(seed):
     if ids is not None:
         set_network_seed(ids)
 
+@metrics.timed('add_nodes')
 def add_nodes(nodes_id_list):
     """
-    Adds the given nodes to the nodes.csv file. Only chats that are stored in chats.csv can be added as nodes.
+    Adds the given nodes to the nodes.csv file. Only chats that are stored in chats.csv can be added as nodes. Nodes that are already
+    part of the network are skipped.
 
     nodes_id_list - List of ids of the nodes to be added to the network
     """
-    df_chats = pd.read_csv('data/chats.csv').set_index('id')
-    df_nodes = pd.read_csv('data/network/nodes.csv')
+    storage = get_storage()
+    df_chats = storage.read_table('chats', columns=['id', 'name'], keys=nodes_id_list).set_index('id')
+    stored_nodes_id_list = set(storage.read_table('nodes', columns=['chat_id'], keys=nodes_id_list).iloc[:,0])
+    rows = []
     for node_id in nodes_id_list:
+        if node_id in stored_nodes_id_list:
+            continue
         try:
             node_name = df_chats.loc[node_id]['name']
-            df_nodes.loc[len(df_nodes.index)] = [node_id, node_name, 0, 0]
+            rows.append([node_id, node_name, 0, 0])
+            stored_nodes_id_list.add(node_id)
         except KeyError:
             print('Cannot add chat', node_id, 'as a node because it was not added to chats.csv.')
-    df_nodes.to_csv('data/network/nodes.csv', index=False)
+    if rows:
+        storage.insert_missing_rows('nodes', pd.DataFrame(rows, columns=NODES_COLUMNS))
+        metrics.count('rows_written_total', len(rows), table='nodes')
 
-def add_edges(chat_id, edges):
+@metrics.timed('add_edges')
+def add_edges(chat_id, edges, stored=True):
     """
-    Adds the given edges to the edges csv file of the corresponding chat.
+    Adds the given edges to the edges csv file of the corresponding chat and updates the in-degrees of the chats forwarded from.
+    The in-degree of a chat is the number of distinct chats that forwarded from it. Edges that are already stored are skipped
+    (see EdgeIndex), so storing the same forwards again does not change the network. Returns the changes of the in-degrees.
 
     chat_id - Id of the chat the forward edges were found in
     edges - The list of edges to be added
+    stored - False if the chat has no stored edges yet, see EdgeIndex.add_edges
     """
-    df_nodes = pd.read_csv('data/network/nodes.csv').set_index('chat_id')
-    edges_file_path = 'data/network/edges/'+str(chat_id)+'.csv'
-    # If the chat already has an edge file, read it. Otherwise initialize an empty DataFrame.
-    if os.path.isfile(edges_file_path):
-        df_edges = pd.read_csv(edges_file_path)
-    else:
-        df_edges = pd.DataFrame(columns=EDGES_COLUMNS)
-    df_edges = df_edges.set_index('message_id')
-    for edge in edges:
-        message_id, forwarded_from = edge
-        df_edges.loc[message_id] = [forwarded_from]
-        if not forwarded_from in df_nodes.index:
-            df_nodes.loc[forwarded_from] = ['', 0, 0]
-        df_nodes.at[forwarded_from, 'in_degree'] += 1
-    df_edges.to_csv(edges_file_path)
-    df_nodes.to_csv('data/network/nodes.csv')
+    storage = get_storage()
+    # The index must not contain edges that were not stored
+    with edge_index.forget_on_error():
+        changed_edges, in_degree_increments = edge_index.add_edges(chat_id, edges, stored)
+        # Chats that are not nodes yet (e.g. private chats) are added without a name
+        new_node_ids = [node_id for node_id, increment in in_degree_increments.items() if increment > 0]
+        if new_node_ids:
+            storage.insert_missing_rows('nodes', pd.DataFrame([[node_id, '', 0, 0] for node_id in new_node_ids], columns=NODES_COLUMNS))
+        if in_degree_increments:
+            storage.increment('nodes', 'in_degree', in_degree_increments)
+        # Edges are appended, an edge of a message that is stored again replaces the stored edge
+        if changed_edges:
+            storage.append_rows('edges', chat_id, pd.DataFrame(changed_edges, columns=EDGES_COLUMNS))
+    metrics.count('rows_written_total', len(changed_edges), table='edges')
+    return in_degree_increments
 
 def add_messages(chat_id, messages):
     """
-    Adds the given messages to the messages csv file of the corresponding chat.
+    Adds the given messages to the messages csv file of the corresponding chat. The messages are buffered and appended to the
+    storage in batches, call flush_messages to write them immediately. See storage.MessageWriter.
 
-    messages - List of messages to be added
+    messages - List of messages or MessageRecords to be added
     """
-    messages_file_path = 'data/messages/'+str(chat_id)+'.csv'
-    # Create messages directory if it does not exist
-    if not os.path.exists('data/messages'):
-        os.makedirs('data/messages')
-    # If the chat already has a message file, read it. Otherwise initialize an empty DataFrame.
-    if os.path.isfile(messages_file_path):
-        df_messages = pd.read_csv(messages_file_path)
+    message_writer.add(chat_id, [message if isinstance(message, MessageRecord) else message_record(chat_id, message) for message in messages])
+
+def flush_messages(chat_id=None):
+    """Write the buffered messages of the given chat or of all chats if chat_id is None."""
+    if chat_id is None:
+        message_writer.flush_all()
     else:
-        df_messages = pd.DataFrame(columns=MESSAGES_COLUMNS)
-    df_messages = df_messages.set_index('id')
-    for message in messages:
-        message_id = message.id
-        message_content = message.message
-        message_forwarded = 1 if message.fwd_from else 0
-        message_date = message.date
-        message_views = message.views
-        message_forwards = message.forwards
-        df_messages.loc[message_id] = [message_content, message_forwarded, message_date, message_views, message_forwards]
-    df_messages.to_csv(messages_file_path)
+        message_writer.flush(chat_id)
+
+class MessagePager:
+    """
+    Paging state of a scan of one chat, shared by iter_message_pages and async_crawler.iter_message_pages_async, which only differ
+    in how the requests are sent. Call fetch_messages with the arguments returned by request() and pass the messages to page(),
+    or the error it raised to failed(), until request() returns None.
+
+    For the arguments see scan_chat and iter_message_pages.
+    """
+    def __init__(self, chat_id, batch_size=100, offset_id=0, offset_date=None, min_id=0, upward=False):
+        self.chat_id = chat_id
+        self.batch_size = batch_size
+        self.offset_id = min_id + 1 if upward else offset_id
+        self.offset_date = offset_date
+        self.min_id = min_id
+        self.upward = upward
+        self.total_messages = 0
+        self.finished = False
+
+    def request(self):
+        """Keyword arguments of the next fetch_messages call, None when the scan is finished."""
+        if self.finished or (self.batch_size != None and self.total_messages >= self.batch_size):
+            return None
+        size = 100 if self.batch_size == None else min(100, self.batch_size - self.total_messages)
+        # Fetch the last 100 messages, or the next 100 messages from offset_id upwards
+        return {
+            'chat': self.chat_id,
+            'size': size if self.upward else 100,
+            'offset_id': self.offset_id,
+            'min_id': self.min_id,
+            'offset_date': self.offset_date,
+            'add_offset': -size if self.upward else 0
+        }
+
+    def page(self, messages):
+        """Convert the fetched messages to MessageRecords and move the offset past them. Returns None if there are no more messages."""
+        if not messages:
+            self.finished = True
+            return None
+        if self.batch_size != None:
+            messages = messages[:self.batch_size - self.total_messages]
+        records = [message_record(self.chat_id, message) for message in messages]
+        self.total_messages += len(records)
+        metrics.count('messages_scanned_total', len(records))
+        self.offset_id = records[0].id + 1 if self.upward else records[-1].id
+        return records
+
+    def failed(self, error):
+        """Handle an error raised by fetch_messages. The scan ends, errors after which the chat should be scanned again are raised."""
+        self.finished = True
+        if isinstance(error, (FloodWaitError, OfflineError, *TRANSIENT_ERRORS)):
+            # The request scheduler gave up or Telegram cannot be accessed. Raise the error, so that the chat is not logged as
+            # scanned and can be scanned again.
+            raise error
+        if isinstance(error, ValueError):
+            print('ValueError in chat', self.chat_id)
+        else:
+            print('Exception in chat', self.chat_id, ':', error)
+
+class ChatScan:
+    """
+    Results of a scan of one chat, collected page by page. Shared by scan_chat and async_crawler.scan_chat_async, which only
+    differ in how is_private is called for the chats returned by add_page.
+    """
+    def __init__(self, nodes_in_network_id_list, chat_id):
+        self.nodes_in_network_id_list = nodes_in_network_id_list
+        self.chat_id = chat_id
+        self.new_nodes = []
+        self.new_nodes_set = set()
+        self.forward_edges = []
+        self.newest_message = None
+        self.oldest_message = None
+
+    def add_page(self, records):
+        """Store the messages of a page and collect its forwards. Returns the chats forwarded from that need to be looked up."""
+        add_messages(self.chat_id, records)
+        if self.newest_message is None or records[0].id > self.newest_message.id:
+            self.newest_message = records[0]
+        if self.oldest_message is None or records[-1].id < self.oldest_message.id:
+            self.oldest_message = records[-1]
+        forwards = extract_forwards(self.chat_id, records)
+        self.forward_edges.extend(forwards)
+        # Only look up chats that are not known yet. Lookups are cached, see EntityCache.
+        return [
+            forwarded_from_id for forwarded_from_id in dict.fromkeys(forwarded_from_id for _, forwarded_from_id in forwards)
+            if forwarded_from_id not in self.new_nodes_set and forwarded_from_id not in self.nodes_in_network_id_list
+        ]
+
+    def add_new_node(self, chat_id):
+        self.new_nodes.append(chat_id)
+        self.new_nodes_set.add(chat_id)
+
+    def results(self):
+        """Write the buffered messages and return the results of scan_chat."""
+        flush_messages(self.chat_id)
+        return self.new_nodes, self.forward_edges, self.newest_message, self.oldest_message
+
+def iter_message_pages(chat_id, batch_size=100, offset_id=0, offset_date=None, min_id=0, upward=False):
+    """
+    Fetches the messages of the chat page by page, from the newest to the oldest, and yields each page as a list of MessageRecords.
+    The message objects of a page are converted right away and not kept, so memory does not grow with the number of messages
+    scanned. Ends after batch_size messages, when there are no more messages or when a request failed.
+
+    For the arguments see scan_chat. If upward is True, the pages go from the oldest message newer than min_id to the newest
+    message instead, the messages within a page are still ordered from the newest to the oldest.
+    """
+    pager = MessagePager(chat_id, batch_size, offset_id, offset_date, min_id, upward)
+    while True:
+        request = pager.request()
+        if request is None:
+            return
+        try:
+            messages = telethon_api.fetch_messages(**request)
+        except Exception as error:
+            pager.failed(error)
+            return
+        records = pager.page(messages)
+        # Do not keep the message objects alive while the page is processed
+        del messages
+        if records is None:
+            return
+        yield records
 
 """ This function does not work in Ipython """
-def scan_chat(nodes_in_network_id_list, chat_id, batch_size=100, offset_id=0, offset_date=None):
+@metrics.timed('scan_chat')
+def scan_chat(nodes_in_network_id_list, chat_id, batch_size=100, offset_id=0, offset_date=None, min_id=0, upward=False):
     """Scans the given chat for forwarded messages from other chats in order to construct a network of chats. Stores all messages in messages.csv.
 
+    The messages are streamed page by page to the storage and only the forwards are kept, see iter_message_pages.
+
     Args:
-        nodes_in_network_id_list: List of ids of all chats that are already part of the network.
+        nodes_in_network_id_list: Ids of all chats that are already part of the network, preferably a set or CrawlFrontier for fast lookups.
         chat: Id of the chat that is going to be searched for forwards.
+        batch_size: The maximum number of messages scanned. If None, all messages are scanned.
+        min_id: Only messages with a larger id are scanned. Used to scan the messages posted since the last scan.
+        upward: If True, the messages newer than min_id are scanned from the oldest to the newest, so that a scan limited by
+            batch_size covers the messages right after min_id.
     Returns:
         new_nodes: Nodes in the network that were newly identified.
         forward_edges: a list of tuples (ch_destination ,ch_origin). This means that a message was forwarded from
             ch_origin to ch_destination.
-        newest_message: the newest messages fetched from the chat in this run.
-        oldest_message: the oldest message fetched from the chat in this run.
-    """
-    new_nodes = []
-    forward_edges = []
-    total_messages = 0
-    newest_message = None
-    oldest_message = None
-    while total_messages < batch_size:
-        try:
-            # Fetch the last 100 messages
-            messages = telethon_api.fetch_messages(
-                chat=chat_id,
-                offset_id=offset_id,
-                offset_date=offset_date
-            )
-        except ValueError:
-            print('ValueError in chat', chat_id)
-            break
-        except Exception as e:
-            print('Exception in chat', chat_id, ':', e)
-            break
-        if not messages:
-            break
+        newest_message: the MessageRecord of the newest message fetched from the chat in this run.
+        oldest_message: the MessageRecord of the oldest message fetched from the chat in this run.
+    """
+    scan = ChatScan(nodes_in_network_id_list, chat_id)
+    for records in iter_message_pages(chat_id, batch_size, offset_id, offset_date, min_id, upward):
+        for forwarded_from_id in scan.add_page(records):
+            try:
+                if not telethon_api.is_private(forwarded_from_id): # Just calling is_private on a private chat causes ChannelPrivateError
+                    scan.add_new_node(forwarded_from_id)
+            except ChannelPrivateError:
+                logging.info(str(forwarded_from_id) + ' is private')
+    return scan.results()
+
+def forwarded_from_channel(chat_id, message):
+    """Returns the id of the channel the message was forwarded from, None if it was not forwarded from another channel."""
+    if message.fwd_from and hasattr(message.fwd_from ,'from_id') and hasattr(message.fwd_from.from_id, 'channel_id') and message.fwd_from.from_id.channel_id != chat_id:
+        return message.fwd_from.from_id.channel_id
+    return None
+
+def message_record(chat_id, message):
+    """Converts a message fetched from the chat into a MessageRecord, see data_model.py."""
+    return MessageRecord(message.id, message.message, 1 if message.fwd_from else 0, str(message.date), message.views, message.forwards, forwarded_from_channel(chat_id, message))
+
+def extract_forwards(chat_id, messages):
+    """
+    Returns a list of tuples (message_id, forwarded_from_id) of the messages that were forwarded from another channel.
 
-        add_messages(chat_id, messages)
-        newest_message = messages[0]
-        for m in messages:
-            oldest_message = m
-            # If a msg was forwarded from another chat, append it to the list
-            if m.fwd_from and hasattr(m.fwd_from ,'from_id') and hasattr(m.fwd_from.from_id, 'channel_id') and m.fwd_from.from_id.channel_id != chat_id:
-                forwarded_from_id = m.fwd_from.from_id.channel_id
-                try:
-                    forward_edges.append((m.id, forwarded_from_id))
-                    if not telethon_api.is_private(forwarded_from_id): # Just calling is_private on a private chat causes ChannelPrivateError
-                        if forwarded_from_id not in new_nodes and forwarded_from_id not in nodes_in_network_id_list:
-                            new_nodes.append(forwarded_from_id)
-                except ChannelPrivateError:
-                    logging.info(str(forwarded_from_id) + ' is private')
-            total_messages += 1
-            if total_messages >= batch_size:
-                break
-        offset_id = messages[len(messages) - 1].id
-
-    return new_nodes, forward_edges, newest_message, oldest_message
+    chat_id - Id of the chat the messages were posted in
+    messages - List of messages or MessageRecords fetched from the chat
+    """
+    forwards = []
+    for m in messages:
+        # If a msg was forwarded from another chat, append it to the list
+        forwarded_from_id = m.forwarded_from if isinstance(m, MessageRecord) else forwarded_from_channel(chat_id, m)
+        if forwarded_from_id is not None:
+            forwards.append((m.id, forwarded_from_id))
+    return forwards
+
+@metrics.timed('log_scanned_chat')
+def log_scanned_chat(chat_id, newest_message, oldest_message):
+    """
+    Logs the range of messages scanned in the chat in scanned_log.csv. Chats without messages are logged with message ids 0 and the current time.
+    """
+    if newest_message != None and oldest_message != None:
+        row = [chat_id, newest_message.id, str(newest_message.date), oldest_message.id, str(oldest_message.date)]
+    else:
+        print('Chat', chat_id, 'contains no messages')
+        now = datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc).replace(microsecond=0).isoformat().replace('T', ' ')
+        row = [chat_id, 0, now, 0, now]
+    get_storage().upsert_rows('scanned_log', pd.DataFrame([row], columns=SCANNED_COLUMNS))
 
+@metrics.timed('extend_network')
 def extend_network(iterations=1, scan_size=100, only_scan_chats=None, max_date=None, min_degree=0):
     """
     Take nodes from the network corresponding to chats that have not been scanned yet, search for forwarded messages in these chats, use them to extend the network.
@@ -301,13 +483,14 @@ def extend_network(iterations=1, scan_size=100, only_scan_chats=None, max_date=N
     The chat ids along with the ranges of messages scanned are stored in data/network/scanned_log.csv.
     The network edges are stored in data/network/edges/<chat id>.csv, where the file is named after the chat the messages were forwarded to.
     Nodes are stored in data/network/nodes.csv and if they were discovered for the first time, the chat is stored in data/chats.csv
+    (or in the corresponding files of the storage backend configured in config.json, see storage.py).
 
     iterations - The number of iterations in which the chats not scanned so far are taken from chats.csv and scanned to obtain new nodes/edges for the network
     scan_size - The number of messages that are scanned for forwards in each chat
     only_scan_chats - List of chat ids. If given, the network is only extended from these chats.
     min_degree - The minimum degree of a node from which the network is extended.
     """
-    if not os.path.isfile('data/chats.csv'):
+    if not get_storage().has_table('chats'):
         print('chats.csv does not exist yet. You need to call initialize_data first.')
         return
     
@@ -315,46 +498,98 @@ def extend_network(iterations=1, scan_size=100, only_scan_chats=None, max_date=N
         print('only_scan_chats must be a list of ids')
         return
 
-    # create edges directory if it does not exist
-    if not os.path.exists('data/network/edges'):
-        os.makedirs('data/network/edges')
-
     offset_date = datetime.datetime(*max_date).replace(hour=23, minute=59, second=59, microsecond=999999) if max_date != None else None
+    # The frontier is loaded once and kept up to date in memory during all iterations
+    frontier = CrawlFrontier.load(get_storage())
     
     for i in range(iterations):
         print('Extending network: Iteration', i+1, 'of', iterations)
-        # Determine which chats to scan
-        df_nodes = pd.read_csv('data/network/nodes.csv')
-        already_stored_nodes_id_list = list(df_nodes.iloc[:,0])
-        df_scanned_log = pd.read_csv('data/network/scanned_log.csv')
-        scanned_nodes_id_list = list(df_scanned_log.iloc[:,0])
-        if only_scan_chats != None:
-            chats_to_scan = [chat_id for chat_id in already_stored_nodes_id_list if chat_id in only_scan_chats and chat_id not in scanned_nodes_id_list]
-        else:
-            chats_to_scan = [chat_id for chat_id in already_stored_nodes_id_list if chat_id not in scanned_nodes_id_list]
-        df_nodes = df_nodes.set_index('chat_id')
-
+        chats_to_scan = frontier.chats_to_scan(only_scan_chats, min_degree)
         for chat_id in tqdm(chats_to_scan):
-            # Prevent scanning a chat that has already been scanned. Prevent scanning a chat that has a degree of less than min_degree.
-            if chat_id not in scanned_nodes_id_list and df_nodes.at[chat_id, 'in_degree'] >= min_degree:
-                new_nodes_found, forward_edges, newest_message, oldest_message = scan_chat(already_stored_nodes_id_list, chat_id, batch_size=scan_size, offset_date=offset_date)
-                if newest_message != None and oldest_message != None:
-                    # log the range of messages scanned
-                    scanned_nodes_id_list.append(chat_id)
-                    df_scanned_log.loc[len(df_scanned_log.index)] = [chat_id, newest_message.id, newest_message.date, oldest_message.id, oldest_message.date]
-                    df_scanned_log.to_csv('data/network/scanned_log.csv', index=False)
-                    # store newly discovered chats as well as nodes and edges
-                    add_chats_by_id(new_nodes_found)
-                    add_nodes(new_nodes_found)
-                    already_stored_nodes_id_list.extend(new_nodes_found)
-                    add_edges(chat_id, forward_edges)
-                else:
-                    print('Chat', chat_id, 'contains no messages')
-                    scanned_nodes_id_list.append(chat_id)
-                    now = datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc).replace(microsecond=0).isoformat().replace('T', ' ')
-                    df_scanned_log.loc[len(df_scanned_log.index)] = [chat_id, 0, now, 0, now]
-                    df_scanned_log.to_csv('data/network/scanned_log.csv', index=False)
+            try:
+                new_nodes_found, forward_edges, newest_message, oldest_message = scan_chat(frontier, chat_id, batch_size=scan_size, offset_date=offset_date)
+            except (FloodWaitError, *TRANSIENT_ERRORS) as error:
+                print('Chat', chat_id, 'could not be scanned completely and is not logged as scanned:', error)
+                continue
+            store_scan_results(frontier, chat_id, new_nodes_found, forward_edges, newest_message, oldest_message)
+        get_storage().flush()
+
+@metrics.timed('crawl_best_first')
+def crawl_best_first(max_chats=None, max_requests=None, scan_size=100, max_date=None, min_degree=0):
+    """
+    Extend the network by always scanning the unscanned node with the highest in-degree next. Unlike extend_network there are no
+    iterations: chats discovered during the crawl are prioritised immediately according to their current in-degree, so the most
+    central chats are reached with fewer requests. The results are stored like in extend_network.
+
+    max_chats - The maximum number of chats that are scanned. If None, the crawl only stops on the other limits.
+    max_requests - The maximum number of API requests sent during the crawl, counted by the request schedulers of all accounts. The chat being scanned
+    when the budget runs out is completed.
+    min_degree - The crawl stops when no unscanned node has at least this in-degree.
+    For the other arguments see extend_network.
+    """
+    if not get_storage().has_table('chats'):
+        print('chats.csv does not exist yet. You need to call initialize_data first.')
+        return
+
+    if max_chats == None and max_requests == None and min_degree == 0:
+        print('Please limit the crawl with max_chats, max_requests or min_degree')
+        return
 
+    offset_date = datetime.datetime(*max_date).replace(hour=23, minute=59, second=59, microsecond=999999) if max_date != None else None
+    frontier = CrawlFrontier.load(get_storage())
+    first_request = telethon_api.total_requests()
+    scanned_chats = 0
+    progress_bar = tqdm(total=max_chats)
+    while max_chats == None or scanned_chats < max_chats:
+        if max_requests != None and telethon_api.total_requests() - first_request >= max_requests:
+            print('Stopping the crawl: the budget of', max_requests, 'requests is used up')
+            break
+        chat_id = frontier.pop(min_degree)
+        if chat_id == None:
+            print('Stopping the crawl: no unscanned chat has an in-degree of at least', min_degree)
+            break
+        try:
+            new_nodes_found, forward_edges, newest_message, oldest_message = scan_chat(frontier, chat_id, batch_size=scan_size, offset_date=offset_date)
+        except (FloodWaitError, *TRANSIENT_ERRORS) as error:
+            # The chat stays unscanned in the storage, so it is tried again in the next crawl
+            print('Chat', chat_id, 'could not be scanned completely and is not logged as scanned:', error)
+            continue
+        store_scan_results(frontier, chat_id, new_nodes_found, forward_edges, newest_message, oldest_message)
+        scanned_chats += 1
+        progress_bar.update(1)
+    progress_bar.close()
+    get_storage().flush()
+    print('Scanned', scanned_chats, 'chats with', telethon_api.total_requests() - first_request, 'requests')
+
+@metrics.timed('store_scan_results')
+def store_scan_results(frontier, chat_id, new_nodes_found, forward_edges, newest_message, oldest_message, chats_metadata=None):
+    """
+    Log the scanned chat and store newly discovered chats as well as nodes and edges. Updates the frontier accordingly.
+
+    frontier - CrawlFrontier of the crawl
+    chats_metadata - Metadata of the new nodes if it was already fetched. Otherwise it is fetched by add_chats_by_id.
+    For the other arguments see the return values of scan_chat.
+    """
+    # Store the results of the chat together, so that an interruption does not leave the chat half stored. If the transaction is
+    # rolled back, the edges are forgotten by the edge index as well.
+    with edge_index.forget_on_error(), get_storage().transaction():
+        # log the range of messages scanned
+        log_scanned_chat(chat_id, newest_message, oldest_message)
+        if newest_message != None and oldest_message != None:
+            # Chats scanned at the same time may have discovered the same chats
+            new_nodes_found = [node_id for node_id in new_nodes_found if node_id not in frontier]
+            # store newly discovered chats as well as nodes and edges
+            if chats_metadata is None:
+                add_chats_by_id(new_nodes_found)
+            else:
+                add_chats(chats_metadata)
+            add_nodes(new_nodes_found)
+            in_degree_increments = add_edges(chat_id, forward_edges, stored=frontier.is_scanned(chat_id))
+    frontier.mark_scanned(chat_id)
+    metrics.count('chats_scanned_total')
+    if newest_message != None and oldest_message != None:
+        frontier.add_nodes(new_nodes_found)
+        frontier.add_in_degrees(in_degree_increments)
 
 def extend_with_older_forwards(chat_id, scan_size=100):
     """
@@ -363,68 +598,188 @@ def extend_with_older_forwards(chat_id, scan_size=100):
     chat_id - Id of the chat to be scanned
     scan_size - The number of messages that are scanned for forwards in the chat
     """
-    df_scanned_log = pd.read_csv('data/network/scanned_log.csv')
-    chat_row = df_scanned_log.loc[df_scanned_log['chat_id'] == chat_id]
+    storage = get_storage()
+    chat_row = storage.read_table('scanned_log', keys=[chat_id])
     if chat_row.empty:
         print('The chat with id', chat_id, 'has not been scanned yet. Therefore it cannot be extended.')
         return
-    oldest_message_id = int(chat_row['oldest_message_id'])
-    df_nodes = pd.read_csv('data/network/nodes.csv')
-    nodes_id_list = list(df_nodes.iloc[:,0])
-    new_nodes_found, forward_edges, _, oldest_message = scan_chat(
-        nodes_id_list, 
-        chat_id, 
-        batch_size=scan_size, 
-        offset_id=oldest_message_id
-    )
-    if oldest_message != None:
-        # If there were no older messages, oldest_message is None
-        # Log the new oldest message scanned
-        df_scanned_log = pd.read_csv('data/network/scanned_log.csv').set_index('chat_id')
-        df_scanned_log.at[chat_id, 'oldest_message_id'] = oldest_message.id
-        df_scanned_log.to_csv('data/network/scanned_log.csv')
+    extend_chat_with_older_forwards(CrawlFrontier.load(storage), next(chat_row.itertuples(index=False)), scan_size)
+
+def extend_chat_with_older_forwards(frontier, chat_row, scan_size=100):
+    """
+    Scan the messages of one chat prior to its oldest scanned message and store the results.
+
+    frontier - CrawlFrontier of the network, it is updated with the results
+    chat_row - Row of scanned_log.csv of the chat
+    scan_size - The number of messages that are scanned for forwards in the chat
+    """
+    chat_id = int(chat_row.chat_id)
+    try:
+        new_nodes_found, forward_edges, _, oldest_message = scan_chat(
+            frontier,
+            chat_id,
+            batch_size=scan_size,
+            offset_id=int(chat_row.oldest_message_id)
+        )
+    except (FloodWaitError, *TRANSIENT_ERRORS) as error:
+        print('Older messages of chat', chat_id, 'could not be scanned completely:', error)
+        return
+    store_older_forwards([(chat_row, new_nodes_found, forward_edges, oldest_message)], frontier)
+
+def store_older_forwards(results, frontier, chats_metadata=None):
+    """
+    Store the results of scanning older messages of several chats in one transaction.
+
+    results - List of tuples (chat_row, new_nodes_found, forward_edges, oldest_message), where chat_row is the row of scanned_log.csv
+    of the chat and the other values are returned by scan_chat. If there were no older messages, oldest_message is None.
+    frontier - CrawlFrontier of the network, it is updated with the results
+    chats_metadata - Metadata of the new nodes if it was already fetched. Otherwise it is fetched by add_chats_by_id.
+    """
+    results = [result for result in results if result[3] != None]
+    if not results:
+        return
+    storage = get_storage()
+    # Log the new oldest message scanned of all chats at once
+    df_scanned_log = pd.DataFrame([chat_row for chat_row, _, _, _ in results], columns=SCANNED_COLUMNS)
+    df_scanned_log['oldest_message_id'] = [oldest_message.id for _, _, _, oldest_message in results]
+    df_scanned_log['oldest_message_date'] = [str(oldest_message.date) for _, _, _, oldest_message in results]
+    # Several chats may have discovered the same chats
+    new_nodes_found = list(dict.fromkeys(node_id for _, nodes, _, _ in results for node_id in nodes if node_id not in frontier))
+    with edge_index.forget_on_error(), storage.transaction():
+        storage.upsert_rows('scanned_log', df_scanned_log)
         # store newly discovered chats as well as nodes and edges
-        add_chats_by_id(new_nodes_found)
+        if chats_metadata is None:
+            add_chats_by_id(new_nodes_found)
+        else:
+            add_chats(chats_metadata)
         add_nodes(new_nodes_found)
-        add_edges(chat_id, forward_edges)
+        in_degree_increments = [add_edges(int(chat_row.chat_id), forward_edges) for chat_row, _, forward_edges, _ in results]
+    frontier.add_nodes(new_nodes_found)
+    for increments in in_degree_increments:
+        frontier.add_in_degrees(increments)
 
 def extend_all_with_older_forwards(scan_size=100):
     """
     Scan the given number of messages in all chats in the network prior to the currently oldest scanned message in each chat. Identify forwards and use them
-    to extend the network.
+    to extend the network. To scan many chats at the same time, use extend_all_with_older_forwards_concurrently from async_crawler.
 
     scan_size - The number of messages that are scanned for forwards in each chat
     """
-    df_scanned_log = pd.read_csv('data/network/scanned_log.csv')
-    scanned_nodes_id_list = list(df_scanned_log.iloc[:,0])
-    for chat_id in tqdm(scanned_nodes_id_list):
-        extend_with_older_forwards(chat_id, scan_size)
+    extend_chats_with_older_forwards(None, scan_size)
 
 def extend_chats_with_older_forwards(chat_ids=[], scan_size=100):
     """
     Scan the given number of messages in all chats in the list, prior to the currently oldest scanned message in each chat. Identify forwards and use them
     to extend the network.
 
-    chat_ids - Ids of the chats to be scanned
+    chat_ids - Ids of the chats to be scanned. If None, all scanned chats are scanned.
     scan_size - The number of messages that are scanned for forwards in each chat
     """
-    if len(chat_ids) > 0 and type(chat_ids[0]) != int:
+    chat_rows, frontier = load_chats_to_extend(chat_ids)
+    for chat_row in tqdm(chat_rows):
+        extend_chat_with_older_forwards(frontier, chat_row, scan_size)
+    get_storage().flush()
+
+def load_chats_to_extend(chat_ids=None):
+    """
+    Load the crawl state once for scanning older messages of many chats. Returns the scanned_log.csv rows of the chats, which
+    are skipped with a message if they have not been scanned, and the CrawlFrontier of the network.
+
+    chat_ids - Ids of the chats. If None, all scanned chats are returned.
+    """
+    if chat_ids != None and len(chat_ids) > 0 and type(chat_ids[0]) != int:
+        print('chat_ids must be a list of ids')
+        return [], None
+
+    storage = get_storage()
+    df_scanned_log = storage.read_table('scanned_log')
+    if chat_ids != None:
+        scanned_chat_ids = set(df_scanned_log['chat_id'])
+        for chat_id in chat_ids:
+            if chat_id not in scanned_chat_ids:
+                print('The chat with id', chat_id, 'has not been scanned yet. Therefore it cannot be extended.')
+        df_scanned_log = df_scanned_log.set_index('chat_id', drop=False).loc[[chat_id for chat_id in chat_ids if chat_id in scanned_chat_ids]]
+    return list(df_scanned_log.itertuples(index=False)), CrawlFrontier.load(storage)
+
+def refresh_chats(chat_ids=None, max_messages=None):
+    """
+    Scan the messages posted in the chats since they were scanned last, i.e. newer than the newest message in scanned_log.csv.
+    Identify forwards and use them to extend the network. The newest message in scanned_log.csv is updated, so calling this
+    regularly only fetches the new messages instead of rescanning the chats.
+
+    chat_ids - Ids of the chats to be refreshed. If None, all scanned chats are refreshed.
+    max_messages - The maximum number of new messages scanned in each chat. If None, all new messages are scanned. The new messages
+    are scanned from the oldest to the newest, so messages beyond the limit are scanned by the next refresh.
+
+    Chats without messages in scanned_log.csv, e.g. because they were empty or private when they were scanned, are skipped.
+    """
+    if chat_ids != None and len(chat_ids) > 0 and type(chat_ids[0]) != int:
         print('chat_ids must be a list of ids')
         return
 
-    df_scanned_log = pd.read_csv('data/network/scanned_log.csv')
-    scanned_nodes_id_list = list(df_scanned_log.iloc[:,0])
-    for chat_id in tqdm(chat_ids):
-        if chat_id not in scanned_nodes_id_list:
-            print('The chat with id', chat_id, 'has not been scanned yet. Therefore it cannot be extended.')
-        else:
-            extend_with_older_forwards(chat_id, scan_size)
+    storage = get_storage()
+    df_scanned_log = storage.read_table('scanned_log')
+    if chat_ids != None:
+        not_scanned = set(chat_ids) - set(df_scanned_log['chat_id'])
+        for chat_id in not_scanned:
+            print('The chat with id', chat_id, 'has not been scanned yet. Therefore it cannot be refreshed.')
+        df_scanned_log = df_scanned_log[df_scanned_log['chat_id'].isin(chat_ids)]
+    frontier = CrawlFrontier.load(storage)
+    new_forwards = 0
+    for chat_row in tqdm(list(df_scanned_log.itertuples(index=False))):
+        new_forwards += refresh_chat(frontier, chat_row, max_messages)
+    storage.flush()
+    print('Found', new_forwards, 'new forwards in', len(df_scanned_log), 'chats')
+
+def refresh_chat(frontier, chat_row, max_messages=None):
+    """
+    Scan the messages of one chat that are newer than its newest scanned message and store the results. Returns the number of new forwards.
+    Chats without scanned messages are skipped, because min_id 0 would scan their whole history on every refresh.
+
+    frontier - CrawlFrontier of the network
+    chat_row - Row of scanned_log.csv of the chat
+    max_messages - The maximum number of new messages scanned, starting with the oldest. If None, all new messages are scanned.
+    """
+    chat_id = int(chat_row.chat_id)
+    newest_message_id = int(chat_row.newest_message_id)
+    if newest_message_id == 0:
+        return 0
+    try:
+        # Scan upwards from the newest scanned message, so that the newest message id only moves over scanned messages
+        new_nodes_found, forward_edges, newest_message, oldest_message = scan_chat(
+            frontier,
+            chat_id,
+            batch_size=max_messages,
+            min_id=newest_message_id,
+            upward=True
+        )
+    except (FloodWaitError, *TRANSIENT_ERRORS) as error:
+        print('New messages of chat', chat_id, 'could not be scanned completely:', error)
+        return 0
+    if newest_message == None:
+        return 0
+    row = pd.DataFrame([chat_row], columns=SCANNED_COLUMNS)
+    row['newest_message_id'] = newest_message.id
+    row['newest_message_date'] = str(newest_message.date)
+    new_nodes_found = [node_id for node_id in new_nodes_found if node_id not in frontier]
+    with edge_index.forget_on_error(), get_storage().transaction():
+        get_storage().upsert_rows('scanned_log', row)
+        add_chats_by_id(new_nodes_found)
+        add_nodes(new_nodes_found)
+        in_degree_increments = add_edges(chat_id, forward_edges)
+    frontier.add_nodes(new_nodes_found)
+    frontier.add_in_degrees(in_degree_increments)
+    return len(forward_edges)
 
 
 if __name__ == "__main__":
-    pass
-    # add_chats_by_username(misinformation_channel_usernames)
-    # initialize_network()
-    # set_network_seed_by_usernames(misinformation_channel_usernames)
-    # extend_network(iterations=1, scan_size=100, max_date=(2022, 2, 28), min_degree=5)
-    # extend_chats_with_older_forwards(misinformation_channel_ids, scan_size=200)
\ No newline at end of file
+    # Keep a single connection open for all calls below
+    with telethon_api:
+        pass
+        # add_chats_by_username(misinformation_channel_usernames)
+        # initialize_network()
+        # set_network_seed_by_usernames(misinformation_channel_usernames)
+        # extend_network(iterations=1, scan_size=100, max_date=(2022, 2, 28), min_degree=5)
+        # crawl_best_first(max_requests=5000, scan_size=100, max_date=(2022, 2, 28), min_degree=5)
+        # resolve_queued_chat_names()
+        # extend_chats_with_older_forwards(misinformation_channel_ids, scan_size=200)
\ No newline at end of file
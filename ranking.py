@@ -0,0 +1,112 @@
+import os
+import numpy as np
+
+# Measures that chats can be ranked by
+MEASURES = ['in_degree', 'in_degree_centrality', 'in_strength', 'pagerank', 'authorities', 'hubs']
+# Scores computed before, by graph directory, its modification time and the measure with its settings
+_memo = {}
+
+
+def pagerank(graph, alpha=0.85, weighted=True, max_iter=100, tol=1.0e-6):
+    """
+    PageRank of the nodes of a CompactGraph computed on its CSR arrays. Gives the same result as networkx.pagerank. Edges point
+    from the chat that forwarded to the chat forwarded from, so chats that are forwarded from by central chats rank high.
+
+    alpha - Damping factor
+    weighted - If True, the edge weights (number of forwards) are used
+    """
+    n = graph.number_of_nodes()
+    if n == 0:
+        return np.zeros(0)
+    sources = np.repeat(np.arange(n), graph.out_degree())
+    weights = graph.weights.astype(np.float64) if weighted else np.ones(graph.number_of_edges(), dtype=np.float64)
+    # bincount returns integers for empty input, e.g. for a graph without edges
+    out_strength = np.bincount(sources, weights=weights, minlength=n).astype(np.float64)
+    dangling = out_strength == 0
+    # Share of the rank of the source that flows along each edge
+    edge_shares = weights / out_strength[sources]
+    x = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        x_last = x
+        x = alpha * np.bincount(graph.indices, weights=x_last[sources] * edge_shares, minlength=n).astype(np.float64)
+        # The rank of nodes without outgoing edges is distributed evenly
+        x += (alpha * x_last[dangling].sum() + 1.0 - alpha) / n
+        if np.abs(x - x_last).sum() < n * tol:
+            return x
+    raise RuntimeError(f'PageRank did not converge in {max_iter} iterations')
+
+
+def hits(graph, weighted=False, max_iter=100, tol=1.0e-8):
+    """
+    Hub and authority scores of the nodes of a CompactGraph, like networkx.hits. Authorities are chats that are forwarded from by
+    many good hubs, hubs are chats that forward from many good authorities. Returns the tuple (hubs, authorities).
+
+    weighted - If True, the edge weights (number of forwards) are used. networkx.hits ignores them for graphs built by build_graph.
+    """
+    n = graph.number_of_nodes()
+    if n == 0:
+        return np.zeros(0), np.zeros(0)
+    sources = np.repeat(np.arange(n), graph.out_degree())
+    weights = graph.weights.astype(np.float64) if weighted else np.ones(graph.number_of_edges(), dtype=np.float64)
+    if len(weights) == 0 or weights.max() == 0:
+        # Without edges, e.g. when the thresholds of build_graph removed all of them, all nodes have the same scores
+        return np.full(n, 1.0 / n), np.full(n, 1.0 / n)
+    hubs = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        hubs_last = hubs
+        authorities = np.bincount(graph.indices, weights=hubs_last[sources] * weights, minlength=n)
+        hubs = np.bincount(sources, weights=authorities[graph.indices] * weights, minlength=n)
+        hubs /= hubs.max()
+        if np.abs(hubs - hubs_last).sum() < tol:
+            break
+    else:
+        raise RuntimeError(f'HITS did not converge in {max_iter} iterations')
+    return hubs / hubs.sum(), authorities / authorities.sum()
+
+
+def scores(graph, measure='in_degree', **settings):
+    """
+    Scores of the nodes of a CompactGraph by one of the MEASURES. settings are passed to pagerank or hits.
+    """
+    if measure == 'in_degree':
+        return graph.in_degree()
+    if measure == 'in_degree_centrality':
+        return graph.in_degree_centrality()
+    if measure == 'in_strength':
+        return graph.in_strength()
+    if measure == 'pagerank':
+        return pagerank(graph, **settings)
+    if measure == 'hubs':
+        return hits(graph, **settings)[0]
+    if measure == 'authorities':
+        return hits(graph, **settings)[1]
+    raise ValueError('Unknown measure ' + measure + ', use one of ' + ', '.join(MEASURES))
+
+
+def top_k(values, k=None):
+    """
+    Positions of the k largest values, largest first, in the same order as a stable sort of all values: equal values keep their
+    order. Only the k largest values are sorted.
+
+    k - Number of positions, all if None
+    """
+    k = len(values) if k is None else min(k, len(values))
+    if k == 0:
+        return np.zeros(0, dtype=np.int64)
+    kth_value = -np.partition(-values, k - 1)[k - 1]
+    above = np.flatnonzero(values > kth_value)
+    # Of the values equal to the k-th largest, the first ones are taken
+    candidates = np.concatenate([above, np.flatnonzero(values == kth_value)[:k - len(above)]])
+    candidates.sort()
+    return candidates[np.argsort(-values[candidates], kind='stable')]
+
+
+def cached_scores(graph, directory, measure='in_degree', **settings):
+    """
+    Like scores, for a CompactGraph loaded from directory. The scores are kept in memory, so repeated rankings of the same graph
+    are instant. They are computed again when the graph is stored again.
+    """
+    key = (os.path.abspath(directory), os.path.getmtime(os.path.join(directory, 'indptr.npy')), measure, tuple(sorted(settings.items())))
+    if key not in _memo:
+        _memo[key] = scores(graph, measure, **settings)
+    return _memo[key]
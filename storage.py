@@ -0,0 +1,617 @@
+import atexit
+import glob
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import uuid
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from data_model import CHATS_COLUMNS, SCANNED_COLUMNS, NODES_COLUMNS, EDGES_COLUMNS, MESSAGES_COLUMNS, NAME_QUEUE_COLUMNS
+from metrics import metrics
+
+# Columns of the tables and the column identifying a row. Edges and messages are stored per chat.
+TABLE_COLUMNS = {
+    'chats': CHATS_COLUMNS,
+    'nodes': NODES_COLUMNS,
+    'scanned_log': SCANNED_COLUMNS,
+    'edges': EDGES_COLUMNS,
+    'messages': MESSAGES_COLUMNS,
+    'name_queue': NAME_QUEUE_COLUMNS
+}
+TABLE_KEYS = {
+    'chats': 'id',
+    'nodes': 'chat_id',
+    'scanned_log': 'chat_id',
+    'edges': 'message_id',
+    'messages': 'id',
+    'name_queue': 'chat_id'
+}
+CHAT_TABLES = ['edges', 'messages']
+
+
+def fingerprint(value):
+    """Hash of the value that is stable between runs, unlike hash()."""
+    return hashlib.sha1(repr(value).encode()).hexdigest()
+
+
+class FileStorage:
+    """
+    Base class of the storage backends that store the tables chats, nodes and scanned_log in files. Row level updates read,
+    modify and write the whole table.
+    """
+    def read_table(self, table, columns=None, keys=None):
+        """
+        Read one of the tables chats, nodes and scanned_log.
+
+        columns - The columns to read, all columns if None
+        keys - If given, only the rows with these keys (ids of the chats) are read
+        """
+        df = self._read_table(table, columns if columns is None or keys is None else list(dict.fromkeys([TABLE_KEYS[table]] + columns)))
+        if keys is not None:
+            df = df[df[TABLE_KEYS[table]].isin(keys)].reset_index(drop=True)
+        return df if columns is None else df[columns]
+
+    def upsert_rows(self, table, df):
+        """Insert the rows into one of the tables chats, nodes and scanned_log. Existing rows with the same key are replaced."""
+        key = TABLE_KEYS[table]
+        df_table = self.read_table(table) if self.has_table(table) else pd.DataFrame(columns=TABLE_COLUMNS[table])
+        self.write_table(table, pd.concat([df_table[~df_table[key].isin(df[key])], df[TABLE_COLUMNS[table]]], ignore_index=True))
+
+    def insert_missing_rows(self, table, df):
+        """Insert the rows into one of the tables chats, nodes and scanned_log. Rows whose key is already stored are skipped."""
+        key = TABLE_KEYS[table]
+        df_table = self.read_table(table) if self.has_table(table) else pd.DataFrame(columns=TABLE_COLUMNS[table])
+        df = df[~df[key].isin(df_table[key])].drop_duplicates(subset=key)
+        if not df.empty:
+            self.write_table(table, pd.concat([df_table, df[TABLE_COLUMNS[table]]], ignore_index=True))
+
+    def increment(self, table, column, increments):
+        """
+        Add values to a column of stored rows.
+
+        increments - Dictionary mapping keys of rows to the value added to the column
+        """
+        if not increments:
+            return
+        df_table = self.read_table(table).set_index(TABLE_KEYS[table])
+        keys = list(increments)
+        df_table.loc[keys, column] = df_table.loc[keys, column] + pd.Series(increments)[keys].values
+        self.write_table(table, df_table.reset_index())
+
+    @contextmanager
+    def transaction(self):
+        """Group changes, see SqliteStorage. The file backends write changes as they happen (csv) or on flush (parquet)."""
+        yield
+
+
+class CsvStorage(FileStorage):
+    """
+    Stores the data in csv files: data/chats.csv, data/network/nodes.csv, data/network/scanned_log.csv and one file per chat in
+    data/network/edges/<chat id>.csv and data/messages/<chat id>.csv. Every write goes to disk immediately.
+    """
+    TABLE_PATHS = {
+        'chats': 'data/chats.csv',
+        'nodes': 'data/network/nodes.csv',
+        'scanned_log': 'data/network/scanned_log.csv',
+        'name_queue': 'data/network/name_queue.csv'
+    }
+    CHAT_TABLE_DIRECTORIES = {
+        'edges': 'data/network/edges',
+        'messages': 'data/messages'
+    }
+
+    def _chat_table_path(self, table, chat_id):
+        return self.CHAT_TABLE_DIRECTORIES[table]+'/'+str(chat_id)+'.csv'
+
+    def has_table(self, table):
+        return os.path.isfile(self.TABLE_PATHS[table])
+
+    def _read_table(self, table, columns):
+        return pd.read_csv(self.TABLE_PATHS[table], usecols=columns)
+
+    def write_table(self, table, df):
+        """Replace one of the tables chats, nodes and scanned_log."""
+        directory = os.path.dirname(self.TABLE_PATHS[table])
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        df[TABLE_COLUMNS[table]].to_csv(self.TABLE_PATHS[table], index=False)
+
+    def append_rows(self, table, chat_id, df):
+        """Append rows to the edges or messages of the chat. Rows with a key that is already stored replace the stored row when read."""
+        directory = self.CHAT_TABLE_DIRECTORIES[table]
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        file_path = self._chat_table_path(table, chat_id)
+        df[TABLE_COLUMNS[table]].to_csv(file_path, mode='a', header=not os.path.isfile(file_path), index=False)
+
+    def has_rows(self, table, chat_id):
+        return os.path.isfile(self._chat_table_path(table, chat_id))
+
+    def read_rows(self, table, chat_id, columns=None):
+        """Read the edges or messages of the chat. If a row was stored several times, the latest version is returned."""
+        key = TABLE_KEYS[table]
+        if not self.has_rows(table, chat_id):
+            return pd.DataFrame(columns=columns or TABLE_COLUMNS[table])
+        usecols = None if columns is None else list(dict.fromkeys([key] + columns))
+        df = pd.read_csv(self._chat_table_path(table, chat_id), usecols=usecols)
+        df = df.drop_duplicates(subset=key, keep='last').reset_index(drop=True)
+        return df if columns is None else df[columns]
+
+    def chat_ids(self, table):
+        """Ids of all chats that have stored edges or messages."""
+        return [int(os.path.basename(path)[:-len('.csv')]) for path in glob.glob(self.CHAT_TABLE_DIRECTORIES[table]+'/*.csv')]
+
+    def rows_version(self, table):
+        """
+        Value that changes whenever edges or messages of the table are stored or deleted. Used to invalidate data derived from them.
+        Computed from the names, sizes and modification times of the files, which does not require reading them.
+        """
+        entries = sorted((entry.name, entry.stat().st_size, entry.stat().st_mtime_ns) for entry in os.scandir(self.CHAT_TABLE_DIRECTORIES[table])) \
+            if os.path.isdir(self.CHAT_TABLE_DIRECTORIES[table]) else []
+        return fingerprint(entries)
+
+    def read_all_rows(self, table, columns=None):
+        """Read the edges or messages of all chats into one DataFrame with an additional chat_id column."""
+        key = TABLE_KEYS[table]
+        usecols = None if columns is None else list(dict.fromkeys([key] + columns))
+        chat_ids = self.chat_ids(table)
+        frames = [pd.read_csv(self._chat_table_path(table, chat_id), usecols=usecols) for chat_id in chat_ids]
+        if not frames:
+            return pd.DataFrame(columns=['chat_id'] + (columns or TABLE_COLUMNS[table]))
+        # Concatenate the files first and remove duplicates of all chats at once
+        df = pd.concat(frames, ignore_index=True)
+        df.insert(0, 'chat_id', np.repeat(chat_ids, [len(frame) for frame in frames]))
+        df = df.drop_duplicates(subset=['chat_id', key], keep='last').reset_index(drop=True)
+        return df[['chat_id'] + (columns or TABLE_COLUMNS[table])]
+
+    def compact(self, table, chat_id=None):
+        """Rewrite the stored rows of the chat (or of all chats if chat_id is None) without duplicates."""
+        for compacted_chat_id in ([chat_id] if chat_id is not None else self.chat_ids(table)):
+            self.read_rows(table, compacted_chat_id).to_csv(self._chat_table_path(table, compacted_chat_id), index=False)
+
+    def clear_rows(self, table):
+        """Delete the edges or messages of all chats."""
+        directory = self.CHAT_TABLE_DIRECTORIES[table]
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.makedirs(directory)
+
+    def flush(self):
+        pass
+
+
+class ParquetStorage(FileStorage):
+    """
+    Stores the data in Parquet files in data/parquet. The tables chats, nodes and scanned_log are stored in one file each. Edges and
+    messages of all chats are stored together in part files of data/parquet/edges and data/parquet/messages with a chat_id column,
+    sorted by chat id so that reads of single chats can skip row groups. Only the requested columns are read.
+
+    All changes are kept in memory and written when flush() is called, when flush_rows appended rows are pending or when the program
+    exits. Requires pyarrow.
+    """
+    def __init__(self, directory='data/parquet', flush_rows=100000):
+        """
+        directory - Directory the Parquet files are stored in
+        flush_rows - Number of pending edges and messages after which all changes are written
+        """
+        try:
+            import pyarrow
+            import pyarrow.dataset
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('The parquet storage backend requires pyarrow. Install it with pip install pyarrow.')
+        self._pa = pyarrow
+        self.directory = os.path.abspath(directory)
+        self.flush_rows = flush_rows
+        self._tables = {}
+        self._changed_tables = set()
+        self._pending_rows = {table: [] for table in CHAT_TABLES}
+        self._pending_row_count = 0
+        atexit.register(self.flush)
+
+    def _schema(self, table):
+        pa = self._pa
+        types = {
+            'chats': [pa.int64(), pa.string(), pa.string(), pa.string(), pa.int64()],
+            'nodes': [pa.int64(), pa.string(), pa.int64(), pa.int64()],
+            'scanned_log': [pa.int64(), pa.int64(), pa.string(), pa.int64(), pa.string()],
+            'edges': [pa.int64(), pa.int64()],
+            'messages': [pa.int64(), pa.string(), pa.int64(), pa.string(), pa.int64(), pa.int64()],
+            'name_queue': [pa.int64(), pa.string()]
+        }[table]
+        fields = [pa.field(column, column_type) for column, column_type in zip(TABLE_COLUMNS[table], types)]
+        if table in CHAT_TABLES:
+            fields.insert(0, pa.field('chat_id', pa.int64()))
+        return pa.schema(fields)
+
+    def _table_path(self, table):
+        return os.path.join(self.directory, table+'.parquet')
+
+    def _chat_table_directory(self, table):
+        return os.path.join(self.directory, table)
+
+    def _to_arrow(self, table, df):
+        df = df.astype(object).where(df.notna(), None)
+        return self._pa.Table.from_pandas(df, schema=self._schema(table), preserve_index=False)
+
+    def has_table(self, table):
+        return table in self._tables or os.path.isfile(self._table_path(table))
+
+    def _read_table(self, table, columns):
+        if table not in self._tables:
+            self._tables[table] = self._pa.parquet.read_table(self._table_path(table)).to_pandas()
+        df = self._tables[table].copy()
+        return df if columns is None else df[columns]
+
+    def write_table(self, table, df):
+        self._tables[table] = df[TABLE_COLUMNS[table]].reset_index(drop=True)
+        self._changed_tables.add(table)
+
+    def append_rows(self, table, chat_id, df):
+        df = df[TABLE_COLUMNS[table]].copy()
+        df.insert(0, 'chat_id', chat_id)
+        self._pending_rows[table].append(df)
+        self._pending_row_count += len(df)
+        if self._pending_row_count >= self.flush_rows:
+            self.flush()
+
+    def _dataset_filter(self, chat_id):
+        return None if chat_id is None else self._pa.dataset.field('chat_id') == chat_id
+
+    def _read_rows(self, table, chat_id, columns):
+        """Read the stored and pending rows of one chat (or all chats if chat_id is None) with the given columns and the chat_id column."""
+        key = TABLE_KEYS[table]
+        read_columns = list(dict.fromkeys(['chat_id', key] + (columns or TABLE_COLUMNS[table])))
+        frames = []
+        directory = self._chat_table_directory(table)
+        if os.path.exists(directory) and os.listdir(directory):
+            dataset = self._pa.dataset.dataset(directory, schema=self._schema(table), format='parquet')
+            frames.append(dataset.to_table(columns=read_columns, filter=self._dataset_filter(chat_id)).to_pandas())
+        for df in self._pending_rows[table]:
+            if chat_id is None or (len(df) > 0 and df['chat_id'].iat[0] == chat_id):
+                frames.append(df[read_columns])
+        if not frames:
+            return pd.DataFrame(columns=read_columns)
+        df = pd.concat(frames, ignore_index=True)
+        # Part files are written in order, so the last row of a key is the latest version
+        return df.drop_duplicates(subset=['chat_id', key], keep='last').reset_index(drop=True)
+
+    def has_rows(self, table, chat_id):
+        return not self._read_rows(table, chat_id, [TABLE_KEYS[table]]).empty
+
+    def read_rows(self, table, chat_id, columns=None):
+        return self._read_rows(table, chat_id, columns)[columns or TABLE_COLUMNS[table]]
+
+    def chat_ids(self, table):
+        return list(pd.unique(self._read_rows(table, None, [TABLE_KEYS[table]])['chat_id']))
+
+    def rows_version(self, table):
+        """See CsvStorage.rows_version. Pending rows are written first, part files are never modified after they are written."""
+        self.flush()
+        directory = self._chat_table_directory(table)
+        return fingerprint((directory, sorted(os.listdir(directory)) if os.path.isdir(directory) else []))
+
+    def read_all_rows(self, table, columns=None):
+        return self._read_rows(table, None, columns)[['chat_id'] + (columns or TABLE_COLUMNS[table])]
+
+    def compact(self, table, chat_id=None):
+        """Rewrite all part files of the table as a single file without duplicates. All chats are compacted, even if chat_id is given."""
+        self.flush()
+        directory = self._chat_table_directory(table)
+        part_files = os.listdir(directory) if os.path.exists(directory) else []
+        df = self._read_rows(table, None, None)
+        # Write the compacted part before removing the old ones, so that no rows are lost if writing fails. Until then it is read
+        # last and its rows win over the old versions.
+        self._write_part(table, df)
+        for file_name in part_files:
+            os.remove(os.path.join(directory, file_name))
+
+    def clear_rows(self, table):
+        self._pending_row_count -= sum(len(df) for df in self._pending_rows[table])
+        self._pending_rows[table] = []
+        directory = self._chat_table_directory(table)
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+
+    def _write_part(self, table, df):
+        directory = self._chat_table_directory(table)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        # The stable sort keeps the order of the versions of a row, part files are named in the order they are written
+        df = df.sort_values('chat_id', kind='stable')
+        # Numbered after the newest part, the numbers of compacted parts are not reused
+        part_number = max([int(file_name.split('-')[1]) for file_name in os.listdir(directory)], default=-1) + 1
+        file_path = os.path.join(directory, f'part-{part_number:06d}-{uuid.uuid4().hex[:8]}.parquet')
+        self._pa.parquet.write_table(self._to_arrow(table, df), file_path)
+
+    def flush(self):
+        """Write all changes to disk."""
+        if self._changed_tables and not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        for table in CHAT_TABLES:
+            if self._pending_rows[table]:
+                self._write_part(table, pd.concat(self._pending_rows[table], ignore_index=True))
+                self._pending_rows[table] = []
+        self._pending_row_count = 0
+        for table in self._changed_tables:
+            self._pa.parquet.write_table(self._to_arrow(table, self._tables[table]), self._table_path(table))
+        self._changed_tables = set()
+
+
+class SqliteStorage:
+    """
+    Stores all data in one SQLite database, data/crawl.db by default. Edges and messages are stored in one table each with the chat
+    id as part of the primary key, so single rows are inserted, updated and looked up by key without rewriting any files. Changes
+    made inside transaction() are committed together, so a crawl that is interrupted never leaves a chat half stored.
+    """
+    COLUMN_TYPES = {
+        'chats': ['INTEGER PRIMARY KEY', 'TEXT', 'TEXT', 'TEXT', 'INTEGER'],
+        'nodes': ['INTEGER PRIMARY KEY', 'TEXT', 'INTEGER', 'INTEGER'],
+        'scanned_log': ['INTEGER PRIMARY KEY', 'INTEGER', 'TEXT', 'INTEGER', 'TEXT'],
+        'edges': ['INTEGER', 'INTEGER'],
+        'messages': ['INTEGER', 'TEXT', 'INTEGER', 'TEXT', 'INTEGER', 'INTEGER'],
+        'name_queue': ['INTEGER PRIMARY KEY', 'TEXT']
+    }
+
+    def __init__(self, file_path='data/crawl.db'):
+        """
+        file_path - Path of the database file
+        """
+        directory = os.path.dirname(file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.file_path = file_path
+        # Autocommit mode, transactions are started explicitly in transaction(). Several processes can share the database, e.g.
+        # the workers of a distributed crawl, so wait for the locks of the others instead of failing right away.
+        self._connection = sqlite3.connect(file_path, isolation_level=None, timeout=60)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._transaction_depth = 0
+        for table, types in self.COLUMN_TYPES.items():
+            columns = [column + ' ' + column_type for column, column_type in zip(TABLE_COLUMNS[table], types)]
+            if table in CHAT_TABLES:
+                columns = ['chat_id INTEGER NOT NULL'] + columns + [f'PRIMARY KEY (chat_id, {TABLE_KEYS[table]})']
+            self._connection.execute(f'CREATE TABLE IF NOT EXISTS {table} ({", ".join(columns)})')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS edges_forwarded_from ON edges (forwarded_from)')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS initialized_tables (name TEXT PRIMARY KEY)')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS rows_versions (name TEXT PRIMARY KEY, version INTEGER)')
+
+    @staticmethod
+    def _rows(df, columns):
+        """Convert the DataFrame to a list of tuples of Python values, which sqlite3 can store."""
+        df = df[columns].astype(object).where(df[columns].notna(), None)
+        return [tuple(value.item() if hasattr(value, 'item') else value for value in row) for row in df.itertuples(index=False)]
+
+    def _query(self, query, parameters=(), columns=None):
+        df = pd.read_sql_query(query, self._connection, params=parameters)
+        return df if columns is None or not df.empty else pd.DataFrame(columns=columns)
+
+    @contextmanager
+    def transaction(self):
+        """Commit all changes made inside the with block together or none of them if an exception is raised. Transactions can be nested."""
+        if self._transaction_depth == 0:
+            # Take the write lock right away, so that transactions of other processes cannot deadlock with this one
+            self._connection.execute('BEGIN IMMEDIATE')
+        self._transaction_depth += 1
+        try:
+            yield
+        except BaseException:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self._connection.execute('ROLLBACK')
+            raise
+        self._transaction_depth -= 1
+        if self._transaction_depth == 0:
+            self._connection.execute('COMMIT')
+
+    def execute(self, query, parameters=()):
+        """Execute an SQL statement on the database and return the cursor. Used for tables of other modules, see work_queue.py."""
+        return self._connection.execute(query, parameters)
+
+    def executemany(self, query, parameters):
+        return self._connection.executemany(query, parameters)
+
+    def has_table(self, table):
+        """A table exists once it was written (see _insert), like the csv files created by initialize_data and initialize_network."""
+        return self._connection.execute('SELECT 1 FROM initialized_tables WHERE name = ?', (table,)).fetchone() is not None
+
+    def read_table(self, table, columns=None, keys=None):
+        columns = columns or TABLE_COLUMNS[table]
+        query = f'SELECT {", ".join(columns)} FROM {table}'
+        if keys is None:
+            return self._query(query, columns=columns)
+        keys = [int(key) for key in keys]
+        frames = []
+        # SQLite limits the number of parameters of a query
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            frames.append(self._query(query + f' WHERE {TABLE_KEYS[table]} IN ({", ".join("?" * len(batch))})', batch, columns))
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+
+    def _insert(self, table, df, verb, columns=None):
+        columns = columns or TABLE_COLUMNS[table]
+        self._connection.executemany(f'{verb} INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})', self._rows(df, columns))
+        if table not in CHAT_TABLES:
+            # Like a csv file, the table exists once rows were written to it, see has_table
+            self._connection.execute('INSERT OR IGNORE INTO initialized_tables VALUES (?)', (table,))
+
+    def write_table(self, table, df):
+        with self.transaction():
+            self._connection.execute(f'DELETE FROM {table}')
+            self._insert(table, df, 'INSERT OR REPLACE')
+
+    def upsert_rows(self, table, df):
+        self._insert(table, df, 'INSERT OR REPLACE')
+
+    def insert_missing_rows(self, table, df):
+        self._insert(table, df, 'INSERT OR IGNORE')
+
+    def increment(self, table, column, increments):
+        self._connection.executemany(
+            f'UPDATE {table} SET {column} = {column} + ? WHERE {TABLE_KEYS[table]} = ?',
+            [(int(value), int(key)) for key, value in increments.items()]
+        )
+
+    def append_rows(self, table, chat_id, df):
+        df = df[TABLE_COLUMNS[table]].copy()
+        df.insert(0, 'chat_id', chat_id)
+        with self.transaction():
+            self._insert(table, df, 'INSERT OR REPLACE', ['chat_id'] + TABLE_COLUMNS[table])
+            self._increase_rows_version(table)
+
+    def has_rows(self, table, chat_id):
+        return self._connection.execute(f'SELECT 1 FROM {table} WHERE chat_id = ? LIMIT 1', (int(chat_id),)).fetchone() is not None
+
+    def read_rows(self, table, chat_id, columns=None):
+        columns = columns or TABLE_COLUMNS[table]
+        return self._query(f'SELECT {", ".join(columns)} FROM {table} WHERE chat_id = ?', (int(chat_id),), columns)
+
+    def chat_ids(self, table):
+        return [row[0] for row in self._connection.execute(f'SELECT DISTINCT chat_id FROM {table}')]
+
+    def rows_version(self, table):
+        """See CsvStorage.rows_version. A counter in the table rows_versions is increased with every write of the table."""
+        row = self._connection.execute('SELECT version FROM rows_versions WHERE name = ?', (table,)).fetchone()
+        return fingerprint((self.file_path, row[0] if row else 0))
+
+    def _increase_rows_version(self, table):
+        self._connection.execute('INSERT INTO rows_versions VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET version = version + 1', (table,))
+
+    def read_all_rows(self, table, columns=None):
+        columns = ['chat_id'] + (columns or TABLE_COLUMNS[table])
+        return self._query(f'SELECT {", ".join(columns)} FROM {table}', columns=columns)
+
+    def compact(self, table, chat_id=None):
+        """Rows are never duplicated in the database, so there is nothing to compact."""
+        pass
+
+    def clear_rows(self, table):
+        with self.transaction():
+            self._connection.execute(f'DELETE FROM {table}')
+            self._increase_rows_version(table)
+
+    def flush(self):
+        pass
+
+
+STORAGE_BACKENDS = {
+    'csv': CsvStorage,
+    'parquet': ParquetStorage,
+    'sqlite': SqliteStorage
+}
+_storage = None
+
+
+def create_storage(backend, **settings):
+    """
+    Create a storage backend.
+
+    backend - Name of the backend, 'csv', 'parquet' or 'sqlite'
+    settings - Keyword arguments of the backend class
+    """
+    return STORAGE_BACKENDS[backend](**settings)
+
+
+def get_storage():
+    """Return the storage backend selected in the storage section of config.json, e.g. {"backend": "parquet"}. Defaults to csv."""
+    global _storage
+    if _storage is None:
+        settings = {}
+        if os.path.isfile('config.json'):
+            with open('config.json', 'r') as file:
+                settings = dict(json.load(file).get('storage', {}))
+        _storage = create_storage(settings.pop('backend', 'csv'), **settings)
+    return _storage
+
+
+def set_storage(storage):
+    """Use the given storage backend instead of the one configured in config.json."""
+    global _storage
+    _storage = storage
+
+
+def migrate_storage(source, target):
+    """
+    Copy all data from one storage backend to another, e.g. migrate_storage(CsvStorage(), SqliteStorage()).
+    Edges and messages are written without duplicates.
+    """
+    with target.transaction():
+        for table in ['chats', 'nodes', 'scanned_log', 'name_queue']:
+            if source.has_table(table):
+                target.write_table(table, source.read_table(table))
+        for table in CHAT_TABLES:
+            target.clear_rows(table)
+            for chat_id in source.chat_ids(table):
+                target.append_rows(table, chat_id, source.read_rows(table, chat_id))
+    target.flush()
+
+
+class MessageWriter:
+    """
+    Append-only writer for the messages of the chats. Messages are buffered per chat and appended to the storage backend in
+    batches, so the cost of storing a message does not grow with the number of messages already stored. A message that is
+    stored again (e.g. when a chat is rescanned) is appended again. Duplicates are removed by read_messages and compact_messages.
+    """
+    def __init__(self, flush_size=1000):
+        """
+        flush_size - Number of buffered messages of a chat after which they are written
+        """
+        self.flush_size = flush_size
+        self._buffers = {}
+        atexit.register(self._flush_at_exit)
+
+    def add(self, chat_id, records):
+        """
+        Buffer the given messages of the chat.
+
+        records - List of MessageRecords to be added, see data_model.py
+        """
+        buffer = self._buffers.setdefault(chat_id, [])
+        for record in records:
+            buffer.append(record[:len(MESSAGES_COLUMNS)])
+        if len(buffer) >= self.flush_size:
+            self.flush(chat_id)
+
+    def flush(self, chat_id):
+        """Append the buffered messages of the chat to the storage."""
+        buffer = self._buffers.pop(chat_id, None)
+        if not buffer:
+            return
+        with metrics.timer('stage_seconds', stage='flush_messages'):
+            get_storage().append_rows('messages', chat_id, pd.DataFrame(buffer, columns=MESSAGES_COLUMNS))
+        metrics.count('rows_written_total', len(buffer), table='messages')
+
+    def flush_all(self):
+        for chat_id in list(self._buffers):
+            self.flush(chat_id)
+
+    def _flush_at_exit(self):
+        # The exit hook of the storage backend may have run already (atexit runs the hooks of backends created later first),
+        # so the storage is flushed again after the buffered messages were appended
+        if self._buffers:
+            self.flush_all()
+            get_storage().flush()
+
+
+def read_messages(chat_id, columns=None):
+    """Read the stored messages of the chat. If a message was stored several times, the latest version is returned."""
+    df_messages = get_storage().read_rows('messages', chat_id, columns)
+    return df_messages.sort_values('id', ascending=False).reset_index(drop=True) if 'id' in df_messages else df_messages
+
+
+def compact_messages(chat_id):
+    """Rewrite the stored messages of the chat without duplicate messages."""
+    get_storage().compact('messages', chat_id)
+
+
+def compact_all_messages():
+    """Rewrite the stored messages of all chats without duplicate messages."""
+    get_storage().compact('messages')
+
+
+if __name__ == "__main__":
+    pass
+    # Migrate the csv files to parquet files, then set "storage": {"backend": "parquet"} in config.json
+    # migrate_storage(CsvStorage(), ParquetStorage())
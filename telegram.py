@@ -1,90 +1,742 @@
 # Code adapted from Miguel Angel Garcia-Gutierrez Espina
 
+import asyncio
 import json
 import logging
+import os
+import time
+from contextlib import contextmanager
+from entity_cache import EntityCache
+from metrics import metrics
 from telethon.sync import TelegramClient
 from telethon.tl import functions
-from telethon.errors.rpcerrorlist import ChannelPrivateError
+from telethon.errors import ServerError
+from telethon.errors.rpcerrorlist import ChannelPrivateError, FloodWaitError
 from telethon.tl.functions.messages import GetHistoryRequest
+from telethon.tl.types import ChannelForbidden
 
 # Configure logging
 logging.basicConfig(filename='log.log', level=logging.DEBUG)
 
-class SyncTelegramClient:
-    def __init__(self):
-        """Initialize Telegram client using the credentials given in config.json."""
-        with open('config.json', 'r') as file:
-            data = file.read()
-        config = json.loads(data)
-        api_id = config['credentials']['api_id']
-        api_hash = config['credentials']['api_hash']
-        if api_id != '' and api_hash != '':
-            self._client = TelegramClient("session", api_id, api_hash)
+# Default request rates (requests per second) and burst sizes per method type. They can be overridden in config.json.
+DEFAULT_RATE_LIMITS = {
+    'get_history': {'rate': 3, 'burst': 10},
+    'get_full_channel': {'rate': 1, 'burst': 5},
+    'get_entity': {'rate': 3, 'burst': 10},
+    'default': {'rate': 1, 'burst': 5}
+}
+# Errors after which a request is retried with backoff
+TRANSIENT_ERRORS = (ServerError, ConnectionError, TimeoutError)
+# Maximum number of chats resolved with one GetChannelsRequest
+GET_CHANNELS_BATCH_SIZE = 100
+
+
+class TokenBucket:
+    """Token bucket limiting the rate of requests. The rate is halved after a FloodWaitError and slowly recovers afterwards."""
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+
+    def reserve(self):
+        """Take a token and return the number of seconds to wait before the request may be sent."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        return max(wait, self.blocked_until - now)
+
+    def flood_wait(self, seconds):
+        """Block all requests for the given number of seconds and slow down."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.rate = max(self.max_rate / 16, self.rate / 2)
+
+    def success(self):
+        self.rate = min(self.max_rate, self.rate * 1.05)
+
+
+class RequestScheduler:
+    """
+    Sends all API requests of a client. Applies a token bucket rate limit per method type, waits for the duration of a
+    FloodWaitError before retrying and retries transient errors with exponential backoff.
+    The counters of requests sent, waits and retries per method type are available in the attribute counters.
+    """
+    def __init__(self, rate_limits=DEFAULT_RATE_LIMITS, max_retries=5, backoff=1, max_flood_wait=15*60):
+        """
+        rate_limits - Dictionary mapping method types to {'rate': requests per second, 'burst': size of bursts}. Method types
+            without an entry use the entry 'default'. Method types without any entry are not rate limited.
+        max_retries - Number of times a request is retried after a FloodWaitError or a transient error before the error is raised
+        backoff - Seconds to wait before the first retry after a transient error. The wait is doubled with every retry.
+        max_flood_wait - Longest FloodWaitError in seconds that is waited for. Longer waits raise the error immediately.
+        """
+        self.rate_limits = rate_limits
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_flood_wait = max_flood_wait
+        self.counters = {}
+        self._buckets = {}
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a scheduler using the optional request_scheduler settings in config.json."""
+        settings = dict(config.get('request_scheduler', {}))
+        settings['rate_limits'] = {**DEFAULT_RATE_LIMITS, **settings.get('rate_limits', {})}
+        return cls(**settings)
+
+    def _bucket(self, method):
+        if method not in self._buckets:
+            rate_limit = self.rate_limits.get(method, self.rate_limits.get('default'))
+            self._buckets[method] = TokenBucket(rate_limit['rate'], rate_limit['burst']) if rate_limit else None
+        return self._buckets[method]
+
+    def _count(self, method, counter, value=1):
+        method_counters = self.counters.setdefault(method, {'requests': 0, 'rate_limit_waits': 0, 'rate_limit_seconds': 0, 'flood_waits': 0, 'flood_wait_seconds': 0, 'retries': 0, 'failures': 0})
+        method_counters[counter] += value
+        metrics.count('api_' + counter + '_total', value, method=method)
+
+    def _before_request(self, method):
+        """Count the request and return the number of seconds to wait before sending it."""
+        self._count(method, 'requests')
+        bucket = self._bucket(method)
+        wait = bucket.reserve() if bucket else 0
+        if wait > 0:
+            self._count(method, 'rate_limit_waits')
+            self._count(method, 'rate_limit_seconds', wait)
+        return wait
+
+    def _after_error(self, method, error, attempt):
+        """Return the number of seconds to wait before retrying the failed request or raise the error if it is not retried."""
+        if attempt >= self.max_retries:
+            self._count(method, 'failures')
+            raise error
+        if isinstance(error, FloodWaitError):
+            if error.seconds > self.max_flood_wait:
+                self._count(method, 'failures')
+                raise error
+            logging.warning('FloodWaitError in ' + method + ', waiting ' + str(error.seconds) + ' seconds')
+            self._count(method, 'flood_waits')
+            self._count(method, 'flood_wait_seconds', error.seconds)
+            bucket = self._bucket(method)
+            if bucket:
+                bucket.flood_wait(error.seconds)
+            wait = error.seconds
         else:
-            raise Exception("Please set your api_id and api_hash in config.json. More information can be found at https://core.telegram.org/api/obtaining_api_id.")
+            logging.warning('Retrying ' + method + ' after ' + type(error).__name__ + ': ' + str(error))
+            wait = self.backoff * 2 ** attempt
+        self._count(method, 'retries')
+        return wait
 
-    # Call the API once to fetch 100 messages
-    def fetch_messages(self, chat, size=100, offset_id=0, max_id=0, min_id=0, offset_date=None):
-        with self._client as client:
+    def _after_success(self, method):
+        bucket = self._bucket(method)
+        if bucket:
+            bucket.success()
+
+    def call(self, method, function, *args, retry_flood_waits=True):
+        """
+        Call function(*args) according to the limits of the method type.
+
+        method - Method type the rate limit is applied for, e.g. 'get_history'
+        retry_flood_waits - If False, FloodWaitErrors are raised without waiting, so that the caller can handle them, see AccountPool
+        """
+        attempt = 0
+        while True:
+            wait = self._before_request(method)
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                with metrics.timer('api_request_seconds', method=method):
+                    result = function(*args)
+            except (FloodWaitError, *TRANSIENT_ERRORS) as error:
+                if isinstance(error, FloodWaitError) and not retry_flood_waits:
+                    raise
+                time.sleep(self._after_error(method, error, attempt))
+                attempt += 1
+                continue
+            self._after_success(method)
+            return result
+
+    async def call_async(self, method, function, *args, retry_flood_waits=True):
+        """Asyncio version of call for coroutine functions. Concurrent requests share the same rate limits."""
+        attempt = 0
+        while True:
+            wait = self._before_request(method)
+            if wait > 0:
+                await asyncio.sleep(wait)
             try:
-                history = client(GetHistoryRequest(
-                    peer=chat,
-                    limit=size, # 100 is the max number of messages that can be retrieved per request
-                    offset_date=offset_date,
-                    offset_id=offset_id,
-                    max_id=max_id,
-                    min_id=min_id,
-                    add_offset=0,
-                    hash=0
-                ))  
-            except ChannelPrivateError:
-                print('Chat', chat, 'is private')
-                return None
+                with metrics.timer('api_request_seconds', method=method):
+                    result = await function(*args)
+            except (FloodWaitError, *TRANSIENT_ERRORS) as error:
+                if isinstance(error, FloodWaitError) and not retry_flood_waits:
+                    raise
+                await asyncio.sleep(self._after_error(method, error, attempt))
+                attempt += 1
+                continue
+            self._after_success(method)
+            return result
+
+    def total_requests(self):
+        """Number of requests sent for all method types, including retries."""
+        return sum(method_counters['requests'] for method_counters in self.counters.values())
+
+    def print_counters(self):
+        for method, method_counters in self.counters.items():
+            print(method + ':', ', '.join(f'{counter} {round(value, 1)}' for counter, value in method_counters.items()))
+
+
+class Account:
+    """A Telegram account of an AccountPool with its own client, request scheduler (and so its own rate limits) and FloodWait cooldown."""
+    def __init__(self, name, client, scheduler):
+        """
+        name - Name of the account in reports, e.g. its session file
+        client - Telethon client logged in with the account
+        scheduler - RequestScheduler of the account
+        """
+        self.name = name
+        self.client = client
+        self.scheduler = scheduler
+        self.cooldown_until = 0
+        self.in_flight = 0
+        self.busy_seconds = 0
+        self._busy_since = None
+        self.cooldowns = 0
+        self.cooldown_seconds = 0
+        self.chats = 0
+
+    def cooldown(self):
+        """Seconds until the account may send requests again after a FloodWaitError."""
+        return max(0, self.cooldown_until - time.monotonic())
+
+    def begin_request(self):
+        if self.in_flight == 0:
+            self._busy_since = time.monotonic()
+        self.in_flight += 1
+
+    def end_request(self):
+        """Count the time in which at least one request of the account was in flight as busy."""
+        self.in_flight -= 1
+        if self.in_flight == 0:
+            self.busy_seconds += time.monotonic() - self._busy_since
+
+    def cool_down(self, seconds):
+        logging.warning('FloodWaitError for account ' + self.name + ', cooling down for ' + str(seconds) + ' seconds')
+        self.cooldown_until = max(self.cooldown_until, time.monotonic() + seconds)
+        self.cooldowns += 1
+        self.cooldown_seconds += seconds
+
+
+class AccountPool:
+    """
+    Sends requests with several Telegram accounts, so that the rate limits of all accounts add up. Requests about a chat are
+    always sent with the same account, because the access hashes of chats are only valid for the account that received them.
+    Chats are assigned to the account that first received them or else to the least loaded account, as are requests about no
+    chat. With several accounts, an account that receives a FloodWaitError is cooled down for the requested time while the
+    other accounts continue.
+    """
+    def __init__(self, accounts):
+        """
+        accounts - List of Accounts. With several accounts, the pool handles the FloodWaitErrors instead of the schedulers: the
+            account is cooled down and the request is sent again, at most max_retries times of the scheduler of the account.
+        """
+        self.accounts = accounts
+        self._chat_accounts = {}
+        self._started = time.monotonic()
+
+    def account_for(self, chat=None):
+        """Return the account that sends the requests about the chat. If chat is None, the least loaded account is returned."""
+        if chat in self._chat_accounts:
+            return self._chat_accounts[chat]
+        available = [account for account in self.accounts if account.cooldown() == 0] or [min(self.accounts, key=Account.cooldown)]
+        account = min(available, key=lambda account: (account.in_flight, account.scheduler.total_requests()))
+        if chat is not None:
+            self.assign(chat, account)
+        return account
+
+    def assign(self, chat, account):
+        """Send the requests about the chat with the account, unless the chat is assigned to an account already."""
+        if chat not in self._chat_accounts:
+            self._chat_accounts[chat] = account
+            account.chats += 1
+
+    def batches(self, chats, size):
+        """Split the chats into batches of at most size chats that are assigned to the same account or not assigned yet."""
+        groups = {}
+        for chat in chats:
+            groups.setdefault(self._chat_accounts.get(chat), []).append(chat)
+        return [group[i:i+size] for group in groups.values() for i in range(0, len(group), size)]
+
+    def _after_flood_wait(self, method, account, error, attempt):
+        """Count the FloodWaitError and slow down the rate limit like the scheduler of the account, then cool the account down."""
+        if len(self.accounts) == 1:
+            # The scheduler of a single account waited for the FloodWaitErrors already and gave up
+            raise error
+        # Raises the error once the request was retried max_retries times or if the wait is longer than max_flood_wait
+        seconds = account.scheduler._after_error(method, error, attempt)
+        metrics.count('account_cool_downs_total', account=account.name)
+        account.cool_down(seconds)
+
+    def _after_success(self, account, result, known_chats):
+        if known_chats is not None:
+            for chat in known_chats(result):
+                self.assign(chat, account)
+
+    def call(self, method, chat, function, *args, known_chats=None):
+        """
+        Call function(client, *args) with the client of the account of the chat, through the scheduler of the account. After a
+        FloodWaitError the request is sent again when the account of the chat cooled down, or right away by another account
+        if the request is not about a chat. The error is raised after max_retries retries.
+
+        method - Method type the rate limit is applied for, e.g. 'get_history'
+        chat - Id or username of the chat the request is about, None if it is not about one chat
+        known_chats - Optional function returning the ids of the chats in the result of the request. They are assigned to the
+            account, because it received their access hashes.
+        """
+        attempt = 0
+        while True:
+            account = self.account_for(chat)
+            wait = account.cooldown()
+            if wait > 0:
+                time.sleep(wait)
+            account.begin_request()
+            try:
+                result = account.scheduler.call(method, function, account.client, *args, retry_flood_waits=len(self.accounts) == 1)
+            except FloodWaitError as error:
+                self._after_flood_wait(method, account, error, attempt)
+                attempt += 1
+                continue
+            finally:
+                account.end_request()
+            self._after_success(account, result, known_chats)
+            return result
+
+    async def call_async(self, method, chat, function, *args, known_chats=None):
+        """Asyncio version of call for coroutine functions. Concurrent requests are spread over the accounts."""
+        attempt = 0
+        while True:
+            account = self.account_for(chat)
+            wait = account.cooldown()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            account.begin_request()
+            try:
+                result = await account.scheduler.call_async(method, function, account.client, *args, retry_flood_waits=len(self.accounts) == 1)
+            except FloodWaitError as error:
+                self._after_flood_wait(method, account, error, attempt)
+                attempt += 1
+                continue
+            finally:
+                account.end_request()
+            self._after_success(account, result, known_chats)
+            return result
+
+    def total_requests(self):
+        """Number of requests sent by all accounts, including retries."""
+        return sum(account.scheduler.total_requests() for account in self.accounts)
+
+    def utilisation(self):
+        """
+        Return a list with a dictionary per account: the requests sent, their share of all requests, the fraction of the time
+        spent in requests (busy), the number and seconds of FloodWait cooldowns and the number of chats assigned.
+        """
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        total_requests = max(self.total_requests(), 1)
+        return [{
+            'account': account.name,
+            'requests': account.scheduler.total_requests(),
+            'share': account.scheduler.total_requests() / total_requests,
+            'busy': account.busy_seconds / elapsed,
+            'cooldowns': account.cooldowns,
+            'cooldown_seconds': account.cooldown_seconds,
+            'chats': account.chats
+        } for account in self.accounts]
+
+    def print_utilisation(self):
+        for row in self.utilisation():
+            print(row['account'] + ':', f"{row['requests']} requests ({row['share']:.0%}), busy {row['busy']:.0%}, "
+                  f"{row['cooldowns']} cooldowns ({round(row['cooldown_seconds'], 1)}s), {row['chats']} chats")
+
+
+class OfflineError(Exception):
+    """Raised when a request would have to be sent to Telegram in offline mode."""
+    pass
+
+
+def load_config():
+    """Read config.json. Returns an empty configuration if the file does not exist, e.g. on machines that only analyze data."""
+    if not os.path.exists('config.json'):
+        return {}
+    with open('config.json', 'r') as file:
+        data = file.read()
+    return json.loads(data)
+
+def read_config():
+    """Read config.json and check that the api credentials are set."""
+    config = load_config()
+    credentials = config.get('credentials', {})
+    if credentials.get('api_id', '') == '' or credentials.get('api_hash', '') == '':
+        raise Exception("Please set your api_id and api_hash in config.json. More information can be found at https://core.telegram.org/api/obtaining_api_id.")
+    return config
+
+def read_accounts(config):
+    """
+    Return the credentials of the Telegram accounts in config.json, each with the name of its session file. The account in
+    credentials uses the session file "session". Further accounts can be added to the list accounts, e.g.
+    "accounts": [{"api_id": "...", "api_hash": "...", "session": "session_2"}]. Their session files default to session_2, session_3 and so on.
+    """
+    accounts = [{'session': 'session', **config['credentials']}]
+    for number, credentials in enumerate(config.get('accounts', []), start=2):
+        if credentials.get('api_id', '') == '' or credentials.get('api_hash', '') == '':
+            raise Exception("Please set the api_id and api_hash of every account in config.json.")
+        accounts.append({'session': 'session_' + str(number), **credentials})
+    return accounts
+
+def is_offline(config):
+    """
+    Offline mode is enabled by setting the environment variable TELEGRAM_OFFLINE=1 or "offline": true in config.json. In offline
+    mode no connection to Telegram is made, only cached lookups work.
+    """
+    if os.environ.get('TELEGRAM_OFFLINE', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return config.get('offline', False) == True
+
+def create_entity_cache(config):
+    """Create the EntityCache using the settings in config.json."""
+    entity_cache_ttl_hours = config.get('entity_cache', {}).get('ttl_hours', 7*24)
+    return EntityCache(ttl=entity_cache_ttl_hours*60*60)
+
+def chat_metadata_from_info(chat_info):
+    """Extract the meta information stored in chats.csv from the result of a GetFullChannelRequest."""
+    type = 'broadcast'
+    if chat_info["chats"][0]['megagroup'] == True:
+        type = 'megagroup'
+    if chat_info["chats"][0]['gigagroup'] == True:
+        type = 'gigagroup'
+    can_comment = 1
+    if type == 'broadcast':
+        can_comment = 0 if len(chat_info["chats"]) == 1 else 1
+    metadata = {
+        'id': chat_info["chats"][0]["id"],
+        'title': chat_info["chats"][0]["title"],
+        'username': chat_info['chats'][0]['username'],
+        'type': type,
+        'can_comment': can_comment
+    }
+    return metadata
+
+def chat_metadata_from_channel(channel):
+    """
+    Extract the meta information stored in chats.csv from a channel returned by a GetChannelsRequest. Gives the same result as
+    chat_metadata_from_info, because a broadcast channel can be commented if it has a linked discussion group.
+    """
+    type = 'broadcast'
+    if channel.megagroup == True:
+        type = 'megagroup'
+    if channel.gigagroup == True:
+        type = 'gigagroup'
+    can_comment = 1
+    if type == 'broadcast':
+        can_comment = 1 if channel.has_link else 0
+    return {
+        'id': channel.id,
+        'title': channel.title,
+        'username': channel.username,
+        'type': type,
+        'can_comment': can_comment
+    }
+
+def split_cached_chats(entity_cache, chats):
+    """
+    Split chats into the metadata found in the entity cache, the ids that need to be requested and the usernames.
+    Chats that are cached as private are left out.
+    """
+    chats_metadata = {}
+    chat_ids = []
+    usernames = []
+    for chat in chats:
+        if type(chat) != int:
+            usernames.append(chat)
+            continue
+        if entity_cache.is_private_error(chat):
+            continue
+        found, metadata = entity_cache.get(chat, 'metadata')
+        if found:
+            chats_metadata[chat] = metadata
+        else:
+            chat_ids.append(chat)
+    return chats_metadata, chat_ids, usernames
+
+def cache_channels(entity_cache, channels):
+    """Cache the metadata of the channels returned by a GetChannelsRequest and return it by chat id."""
+    chats_metadata = {}
+    for channel in channels:
+        if isinstance(channel, ChannelForbidden):
+            entity_cache.set_private_error(channel.id)
+            print_chat_metadata_error(channel.id, ChannelPrivateError(request=None))
+            continue
+        chats_metadata[channel.id] = chat_metadata_from_channel(channel)
+        entity_cache.set(channel.id, 'metadata', chats_metadata[channel.id])
+    return chats_metadata
+
+def print_chat_metadata_error(chat, error):
+    if isinstance(error, ChannelPrivateError):
+        print('The metadata of chat', chat, 'could not be retrieved because it is private.')
+    elif type(chat) == int:
+        print('ValueError in chat ' + str(chat) + '. This probably means that the chat is not known by its id yet. You need to first retrieve it in some other way. If you know the username, use add_chat_by_username instead. See https://docs.telethon.dev/en/latest/concepts/entities.html#summary for more information.')
+    else:
+        print('The metadata of chat', chat, 'could not be retrieved because:', error)
+
+def history_request(chat, size=100, offset_id=0, max_id=0, min_id=0, offset_date=None, add_offset=0):
+    return GetHistoryRequest(
+        peer=chat,
+        limit=size, # 100 is the max number of messages that can be retrieved per request
+        offset_date=offset_date,
+        offset_id=offset_id,
+        max_id=max_id,
+        min_id=min_id,
+        add_offset=add_offset, # A negative offset of -size returns the size messages from offset_id upwards
+        hash=0
+    )
+
+
+def history_chat_ids(history):
+    """Ids of the chats in the result of a GetHistoryRequest, e.g. the chats messages were forwarded from."""
+    return [chat.id for chat in getattr(history, 'chats', [])]
+
+def channels_chat_ids(result):
+    """Ids of the chats in the result of a GetChannelsRequest."""
+    return [chat.id for chat in result.chats]
+
+
+class LazyTelegramClient:
+    """
+    Base class of SyncTelegramClient and AsyncTelegramClient. config.json is only read and the telethon clients are only created
+    when they are needed, so creating a client is instant and works without credentials as long as no request is sent.
+    Requests are sent with all accounts in config.json, see read_accounts and AccountPool.
+    """
+    def __init__(self, client=None, entity_cache=None, scheduler=None, offline=None):
+        """
+        client - Optional already constructed TelegramClient (or a compatible fake) to use instead of reading config.json, or a
+            list of clients to use several accounts
+        entity_cache - Optional EntityCache used for chat lookups. By default the cache is stored in data/entity_cache.json.
+        scheduler - Optional RequestScheduler all requests are sent through, or a list with one per client. By default each
+            account gets a scheduler configured by config.json.
+        offline - If True, no connection to Telegram is made and requests raise an OfflineError. By default see is_offline.
+        """
+        self._client = client
+        self._config = None if client is None else {}
+        self._entity_cache_instance = entity_cache
+        self._scheduler = scheduler
+        self._offline = offline
+        self._pool = None
+
+    @property
+    def config(self):
+        if self._config is None:
+            self._config = load_config()
+        return self._config
+
+    @property
+    def offline(self):
+        if self._offline is None:
+            self._offline = is_offline(self.config)
+        return self._offline
+
+    @property
+    def _entity_cache(self):
+        if self._entity_cache_instance is None:
+            self._entity_cache_instance = create_entity_cache(self.config)
+        return self._entity_cache_instance
+
+    def _schedulers(self, count):
+        if isinstance(self._scheduler, list):
+            return self._scheduler
+        if self._scheduler is not None and count == 1:
+            return [self._scheduler]
+        return [RequestScheduler.from_config(self.config) for _ in range(count)]
+
+    def _account_pool(self):
+        """Return the AccountPool, creating the telethon clients using the credentials in config.json on first use."""
+        if self._pool is None:
+            if self._client is not None:
+                clients = self._client if isinstance(self._client, list) else [self._client]
+                names = ['client ' + str(number) for number in range(1, len(clients) + 1)]
+            else:
+                if self.offline:
+                    raise OfflineError('Telegram cannot be accessed in offline mode')
+                accounts = read_accounts(read_config())
+                # FloodWaitErrors are handled by the scheduler, so telethon must not sleep on its own
+                clients = [TelegramClient(account['session'], account['api_id'], account['api_hash'], flood_sleep_threshold=0) for account in accounts]
+                names = [account['session'] for account in accounts]
+            self._pool = AccountPool([Account(name, client, scheduler) for name, client, scheduler in zip(names, clients, self._schedulers(len(clients)))])
+        return self._pool
+
+    def total_requests(self):
+        """Number of requests sent by all accounts, including retries."""
+        return self._pool.total_requests() if self._pool is not None else 0
+
+    def print_counters(self):
+        """Print the counters of the request schedulers and the utilisation of the accounts."""
+        if self._pool is None:
+            return
+        for account in self._pool.accounts:
+            print('Account', account.name)
+            account.scheduler.print_counters()
+        self._pool.print_utilisation()
+
+    def is_known_private(self, chat_id):
+        """Return True if the chat is cached as private or forbidden, without sending a request."""
+        return self._entity_cache.is_private_error(chat_id)
+
+    def _save_entity_cache(self):
+        if self._entity_cache_instance is not None:
+            self._entity_cache_instance.save()
+
+
+class SyncTelegramClient(LazyTelegramClient):
+    def __init__(self, client=None, entity_cache=None, scheduler=None, offline=None):
+        """
+        Initialize Telegram client using the credentials given in config.json. See LazyTelegramClient for the arguments.
+        """
+        super().__init__(client, entity_cache, scheduler, offline)
+        self._is_open = False
+
+    def open(self):
+        """
+        Connect and authorize once and keep the connection open until close() is called. While the client is open, all
+        methods reuse this connection instead of connecting and disconnecting for every single request.
+        """
+        if not self._is_open:
+            for account in self._account_pool().accounts:
+                account.client.start()
+            self._is_open = True
+        return self
+
+    def close(self):
+        """Disconnect a connection opened with open() and store the entity cache."""
+        self._save_entity_cache()
+        if self._is_open:
+            for account in self._pool.accounts:
+                account.client.disconnect()
+            self._is_open = False
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *args):
+        self.close()
+
+    @contextmanager
+    def _session(self, client):
+        """Yield the connected client. If no long-lived connection was opened, connect for the duration of this request only."""
+        if self._is_open:
+            yield client
+        else:
+            with client:
+                yield client
+
+    def _send(self, client, request):
+        with self._session(client) as connected_client:
+            return connected_client(request)
+
+    def _get_entity(self, client, chat):
+        with self._session(client) as connected_client:
+            return connected_client.get_entity(chat)
+
+    # Call the API once to fetch 100 messages
+    def fetch_messages(self, chat, size=100, offset_id=0, max_id=0, min_id=0, offset_date=None, add_offset=0):
+        try:
+            history = self._account_pool().call('get_history', chat, self._send, history_request(chat, size, offset_id, max_id, min_id, offset_date, add_offset), known_chats=history_chat_ids)
+        except ChannelPrivateError:
+            print('Chat', chat, 'is private')
+            return None
         return history.messages
 
     def get_chat_info(self, chat):
-        with self._client as client:
-            data = client(functions.channels.GetFullChannelRequest(channel=chat)).to_json()
+        data = self._account_pool().call('get_full_channel', chat, self._send, functions.channels.GetFullChannelRequest(channel=chat)).to_json()
         return json.loads(data)
 
+    def _cached(self, chat, key, fetch):
+        """
+        Return the value cached for the chat under the given key. If it is not cached, call fetch(chat) and cache the result.
+        A ChannelPrivateError is cached as well and raised again for later lookups. Only ids are cached, not usernames.
+        """
+        if type(chat) != int:
+            return fetch(chat)
+        if self._entity_cache.is_private_error(chat):
+            raise ChannelPrivateError(request=None)
+        found, value = self._entity_cache.get(chat, key)
+        if found:
+            return value
+        try:
+            value = fetch(chat)
+        except ChannelPrivateError:
+            self._entity_cache.set_private_error(chat)
+            raise
+        self._entity_cache.set(chat, key, value)
+        return value
+
     def is_private(self, chat):
-        with self._client as client:
-            result = client.get_entity(chat).restricted
-        return result # Boolean
+        return self._cached(chat, 'restricted', self._fetch_is_private) # Boolean
+
+    def _fetch_is_private(self, chat):
+        return self._account_pool().call('get_entity', chat, self._get_entity, chat).restricted
 
     def get_chat_name(self, chat_id):
-        return self.get_chat_info(chat_id)["chats"][0]["title"]
+        return self.get_chat_metadata(chat_id)['title']
 
     def get_chat_metadata(self, chat):
         """
-        Get meta information about the given chat.
+        Get meta information about the given chat. Results are cached by chat id.
         
         chat - id or username of the chat
         """
-        chat_info = self.get_chat_info(chat)
-        type = 'broadcast'
-        if chat_info["chats"][0]['megagroup'] == True:
-            type = 'megagroup'
-        if chat_info["chats"][0]['gigagroup'] == True:
-            type = 'gigagroup'
-        can_comment = 1
-        if type == 'broadcast':
-            can_comment = 0 if len(chat_info["chats"]) == 1 else 1
-        metadata = {
-            'id': chat_info["chats"][0]["id"],
-            'title': chat_info["chats"][0]["title"],
-            'username': chat_info['chats'][0]['username'],
-            'type': type,
-            'can_comment': can_comment
-        }
+        metadata = self._cached(chat, 'metadata', self._fetch_chat_metadata)
+        if type(chat) != int:
+            # Cache the chat by its id, so that later lookups by id do not need a request
+            self._entity_cache.set(metadata['id'], 'metadata', metadata)
         return metadata
+
+    def _fetch_chat_metadata(self, chat):
+        return chat_metadata_from_info(self.get_chat_info(chat))
+
+    def get_chats_metadata(self, chats):
+        """
+        Get meta information about many chats with few requests. Uncached ids are resolved with one GetChannelsRequest per
+        GET_CHANNELS_BATCH_SIZE chats, usernames one by one. Chats that cannot be accessed are skipped with a message.
+        Returns the metadata in the order of the given chats.
+
+        chats - List of ids or usernames of the chats
+        """
+        chats_metadata, chat_ids, usernames = split_cached_chats(self._entity_cache, chats)
+        # Each batch is sent by the account its chats are assigned to. The pool is only needed if some chats are not cached.
+        batches = self._account_pool().batches(chat_ids, GET_CHANNELS_BATCH_SIZE) if chat_ids else []
+        for batch in batches:
+            try:
+                channels = self._account_pool().call('get_channels', batch[0], self._send, functions.channels.GetChannelsRequest(id=batch), known_chats=channels_chat_ids).chats
+            except (ValueError, ChannelPrivateError):
+                # The whole request fails if one of the chats cannot be resolved, so look them up one by one
+                for chat_id in batch:
+                    self._get_chat_metadata_or_none(chat_id, chats_metadata)
+                continue
+            chats_metadata.update(cache_channels(self._entity_cache, channels))
+        for username in usernames:
+            self._get_chat_metadata_or_none(username, chats_metadata)
+        return [chats_metadata[chat] for chat in chats if chat in chats_metadata]
+
+    def _get_chat_metadata_or_none(self, chat, chats_metadata):
+        try:
+            chats_metadata[chat] = self.get_chat_metadata(chat)
+        except (ValueError, ChannelPrivateError) as error:
+            print_chat_metadata_error(chat, error)
     
     # Try to join the chat
     def join_chat(self, chat):
         print("Joining", self.get_chat_info(chat)["chats"][0]["username"])
         try:
-            with self._client as client:
-                client(functions.channels.JoinChannelRequest(channel=chat))
+            self._account_pool().call('join_channel', chat, self._send, functions.channels.JoinChannelRequest(channel=chat))
         except Exception as e:
             print("Failed to join chat:", e)
 
@@ -92,14 +744,117 @@ class SyncTelegramClient:
     def leave_chat(self, chat):
         print("Leaving", self.get_chat_info(chat)["chats"][0]["username"])
         try:
-            with self._client as client:
-                client(functions.channels.LeaveChannelRequest(channel=chat))
+            self._account_pool().call('leave_channel', chat, self._send, functions.channels.LeaveChannelRequest(channel=chat))
         except Exception as e:
             print("Failed to join chat:", e)
 
     def print_user_dialogs(self):
-        """Print the name and id of all chats of the user whose credentials are used. Being able to access these personal chats might be useful for testing."""
-        with self._client as client:
-            for dialog in client.iter_dialogs():
-                print(dialog.name, dialog.entity.id)
+        """Print the name and id of all chats of the users whose credentials are used. Being able to access these personal chats might be useful for testing."""
+        for account in self._account_pool().accounts:
+            print('Account', account.name)
+            with self._session(account.client) as client:
+                for dialog in client.iter_dialogs():
+                    print(dialog.name, dialog.entity.id)
+
+
+
+
+class AsyncTelegramClient(LazyTelegramClient):
+    """
+    Asyncio counterpart of SyncTelegramClient with the methods needed for crawling. Many requests can be awaited concurrently
+    over the same connection. Use it as an async context manager: async with AsyncTelegramClient() as client: ...
+    See LazyTelegramClient for the arguments.
+    """
+    async def open(self):
+        # The telethon clients are bound to the running event loop, so they can only be created here
+        for account in self._account_pool().accounts:
+            await account.client.start()
+        return self
+
+    async def close(self):
+        self._save_entity_cache()
+        for account in self._pool.accounts:
+            await account.client.disconnect()
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    @staticmethod
+    async def _send(client, request):
+        return await client(request)
 
+    @staticmethod
+    async def _get_entity(client, chat):
+        return await client.get_entity(chat)
+
+    async def fetch_messages(self, chat, size=100, offset_id=0, max_id=0, min_id=0, offset_date=None, add_offset=0):
+        try:
+            history = await self._pool.call_async('get_history', chat, self._send, history_request(chat, size, offset_id, max_id, min_id, offset_date, add_offset), known_chats=history_chat_ids)
+        except ChannelPrivateError:
+            print('Chat', chat, 'is private')
+            return None
+        return history.messages
+
+    async def get_chat_info(self, chat):
+        data = (await self._pool.call_async('get_full_channel', chat, self._send, functions.channels.GetFullChannelRequest(channel=chat))).to_json()
+        return json.loads(data)
+
+    async def _cached(self, chat, key, fetch):
+        """Async version of SyncTelegramClient._cached."""
+        if type(chat) != int:
+            return await fetch(chat)
+        if self._entity_cache.is_private_error(chat):
+            raise ChannelPrivateError(request=None)
+        found, value = self._entity_cache.get(chat, key)
+        if found:
+            return value
+        try:
+            value = await fetch(chat)
+        except ChannelPrivateError:
+            self._entity_cache.set_private_error(chat)
+            raise
+        self._entity_cache.set(chat, key, value)
+        return value
+
+    async def is_private(self, chat):
+        return await self._cached(chat, 'restricted', self._fetch_is_private)
+
+    async def _fetch_is_private(self, chat):
+        return (await self._pool.call_async('get_entity', chat, self._get_entity, chat)).restricted
+
+    async def get_chat_metadata(self, chat):
+        metadata = await self._cached(chat, 'metadata', self._fetch_chat_metadata)
+        if type(chat) != int:
+            self._entity_cache.set(metadata['id'], 'metadata', metadata)
+        return metadata
+
+    async def _fetch_chat_metadata(self, chat):
+        return chat_metadata_from_info(await self.get_chat_info(chat))
+
+    async def get_chats_metadata(self, chats):
+        """Async version of SyncTelegramClient.get_chats_metadata. The batches and usernames are requested concurrently."""
+        chats_metadata, chat_ids, usernames = split_cached_chats(self._entity_cache, chats)
+
+        async def get_batch(batch):
+            try:
+                channels = (await self._pool.call_async('get_channels', batch[0], self._send, functions.channels.GetChannelsRequest(id=batch), known_chats=channels_chat_ids)).chats
+            except (ValueError, ChannelPrivateError):
+                # The whole request fails if one of the chats cannot be resolved, so look them up one by one
+                await asyncio.gather(*[self._get_chat_metadata_or_none(chat_id, chats_metadata) for chat_id in batch])
+                return
+            chats_metadata.update(cache_channels(self._entity_cache, channels))
+        batches = self._pool.batches(chat_ids, GET_CHANNELS_BATCH_SIZE) if chat_ids else []
+        await asyncio.gather(
+            *[get_batch(batch) for batch in batches],
+            *[self._get_chat_metadata_or_none(username, chats_metadata) for username in usernames]
+        )
+        return [chats_metadata[chat] for chat in chats if chat in chats_metadata]
+
+    async def _get_chat_metadata_or_none(self, chat, chats_metadata):
+        try:
+            chats_metadata[chat] = await self.get_chat_metadata(chat)
+        except (ValueError, ChannelPrivateError) as error:
+            print_chat_metadata_error(chat, error)
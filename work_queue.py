@@ -0,0 +1,150 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+class LeaseLostError(Exception):
+    """Raised when a worker stores the results of a chat whose lease expired and was given to another worker."""
+    pass
+
+
+class WorkQueue:
+    """
+    Queue of the chats to scan in a distributed crawl, shared by workers in several processes or on several machines through the
+    SQLite database of a SqliteStorage. Workers lease chats for lease_seconds and extend their leases with heartbeats while they
+    scan. Leases that expire, e.g. because a worker crashed, are given to the next worker that asks for work.
+
+    A crawl runs in iterations like extend_network: the chats of an iteration are queued once all chats of the previous iteration
+    were scanned, so that a distributed crawl scans the same chats as extend_network on a single machine.
+    """
+    def __init__(self, storage, lease_seconds=60):
+        """
+        storage - SqliteStorage whose database holds the queue
+        lease_seconds - Seconds a lease is valid without heartbeat
+        """
+        self.storage = storage
+        self.lease_seconds = lease_seconds
+        with storage.transaction():
+            storage.execute('CREATE TABLE IF NOT EXISTS crawls (name TEXT PRIMARY KEY, iteration INTEGER, iterations INTEGER, settings TEXT)')
+            storage.execute(
+                'CREATE TABLE IF NOT EXISTS crawl_tasks (crawl TEXT, iteration INTEGER, chat_id INTEGER, position INTEGER, status TEXT, '
+                'worker TEXT, lease_expires REAL, attempts INTEGER, PRIMARY KEY (crawl, iteration, chat_id))'
+            )
+            storage.execute('CREATE TABLE IF NOT EXISTS crawl_workers (crawl TEXT, worker TEXT, heartbeat REAL, scanned INTEGER, PRIMARY KEY (crawl, worker))')
+
+    def create(self, crawl, iterations, settings):
+        """
+        Create the crawl unless it exists already. Returns the settings of the crawl, which are the given ones if it was created.
+
+        crawl - Name of the crawl
+        iterations - Number of iterations of the crawl
+        settings - Dictionary of the settings all workers use, e.g. scan_size
+        """
+        with self.storage.transaction():
+            self.storage.execute('INSERT OR IGNORE INTO crawls VALUES (?, 0, ?, ?)', (crawl, iterations, json.dumps(settings)))
+            return json.loads(self.storage.execute('SELECT settings FROM crawls WHERE name = ?', (crawl,)).fetchone()[0])
+
+    def iteration(self, crawl):
+        """Return the tuple (current iteration, number of iterations) of the crawl. The iteration is 0 before the first one started."""
+        return tuple(self.storage.execute('SELECT iteration, iterations FROM crawls WHERE name = ?', (crawl,)).fetchone())
+
+    def _pending(self, crawl, iteration):
+        return self.storage.execute(
+            "SELECT COUNT(*) FROM crawl_tasks WHERE crawl = ? AND iteration = ? AND status IN ('queued', 'leased')", (crawl, iteration)
+        ).fetchone()[0]
+
+    def next_iteration(self, crawl, chats_to_scan):
+        """
+        Start the next iteration if all chats of the current one were scanned and queue its chats. Returns True if an iteration
+        was started.
+
+        chats_to_scan - Function returning the ids of the chats of the next iteration. It is called while the queue is locked.
+        """
+        with self.storage.transaction():
+            iteration, iterations = self.iteration(crawl)
+            if iteration >= iterations or self._pending(crawl, iteration) > 0:
+                return False
+            chat_ids = chats_to_scan()
+            self.storage.execute('UPDATE crawls SET iteration = ? WHERE name = ?', (iteration + 1, crawl))
+            self.storage.execute('DELETE FROM crawl_tasks WHERE crawl = ? AND iteration = ?', (crawl, iteration))
+            self.storage.executemany(
+                "INSERT INTO crawl_tasks VALUES (?, ?, ?, ?, 'queued', NULL, NULL, 0)",
+                [(crawl, iteration + 1, int(chat_id), position) for position, chat_id in enumerate(chat_ids)]
+            )
+            print('Iteration', iteration + 1, 'of', iterations, 'of crawl', crawl, 'started with', len(chat_ids), 'chats')
+            return True
+
+    def finished(self, crawl):
+        iteration, iterations = self.iteration(crawl)
+        return iteration >= iterations and self._pending(crawl, iteration) == 0
+
+    def lease(self, crawl, worker, count=1):
+        """
+        Lease up to count queued chats of the current iteration to the worker, in the order they were queued. Expired leases are
+        queued again first. Returns the tuple (iteration, list of chat ids).
+        """
+        now = time.time()
+        with self.storage.transaction():
+            iteration, _ = self.iteration(crawl)
+            expired = self.storage.execute(
+                "UPDATE crawl_tasks SET status = 'queued', worker = NULL WHERE crawl = ? AND iteration = ? AND status = 'leased' AND lease_expires < ?",
+                (crawl, iteration, now)
+            ).rowcount
+            if expired:
+                print(expired, 'expired leases of crawl', crawl, 'were queued again')
+            chat_ids = [row[0] for row in self.storage.execute(
+                "SELECT chat_id FROM crawl_tasks WHERE crawl = ? AND iteration = ? AND status = 'queued' ORDER BY position LIMIT ?", (crawl, iteration, count)
+            ).fetchall()]
+            self.storage.executemany(
+                "UPDATE crawl_tasks SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 WHERE crawl = ? AND iteration = ? AND chat_id = ?",
+                [(worker, now + self.lease_seconds, crawl, iteration, chat_id) for chat_id in chat_ids]
+            )
+        return iteration, chat_ids
+
+    def complete(self, crawl, worker, iteration, chat_id, status='done'):
+        """
+        Mark a leased chat as done (or failed). Call it in the transaction that stores the results of the chat, so that the
+        results are only committed if the worker still held the lease. Raises a LeaseLostError otherwise.
+        """
+        with self.storage.transaction():
+            updated = self.storage.execute(
+                "UPDATE crawl_tasks SET status = ?, lease_expires = NULL WHERE crawl = ? AND iteration = ? AND chat_id = ? AND worker = ? AND status = 'leased'",
+                (status, crawl, iteration, chat_id, worker)
+            ).rowcount
+            if updated == 0:
+                raise LeaseLostError('The lease of chat ' + str(chat_id) + ' by worker ' + worker + ' expired')
+            self.storage.execute(
+                'INSERT INTO crawl_workers VALUES (?, ?, ?, 1) ON CONFLICT (crawl, worker) DO UPDATE SET scanned = scanned + 1, heartbeat = excluded.heartbeat',
+                (crawl, worker, time.time())
+            )
+
+    def progress(self, crawl):
+        """Return a dictionary with the number of chats of the current iteration per status."""
+        iteration, _ = self.iteration(crawl)
+        return dict(self.storage.execute('SELECT status, COUNT(*) FROM crawl_tasks WHERE crawl = ? AND iteration = ? GROUP BY status', (crawl, iteration)).fetchall())
+
+    def workers(self, crawl):
+        """Return a dictionary mapping the workers of the crawl to the number of chats they scanned."""
+        return dict(self.storage.execute('SELECT worker, scanned FROM crawl_workers WHERE crawl = ?', (crawl,)).fetchall())
+
+    def heartbeat(self, crawl, worker):
+        """
+        Start a thread that extends the leases of the worker every third of lease_seconds until the returned event is set. The
+        thread uses its own connection, so heartbeats are sent while the worker waits for Telegram.
+        """
+        stopped = threading.Event()
+
+        def beat():
+            connection = sqlite3.connect(self.storage.file_path, isolation_level=None, timeout=60)
+            while not stopped.wait(self.lease_seconds / 3):
+                now = time.time()
+                connection.execute(
+                    "UPDATE crawl_tasks SET lease_expires = ? WHERE crawl = ? AND worker = ? AND status = 'leased'", (now + self.lease_seconds, crawl, worker)
+                )
+                connection.execute(
+                    'INSERT INTO crawl_workers VALUES (?, ?, ?, 0) ON CONFLICT (crawl, worker) DO UPDATE SET heartbeat = excluded.heartbeat', (crawl, worker, now)
+                )
+            connection.close()
+        threading.Thread(target=beat, daemon=True).start()
+        return stopped